@@ -0,0 +1,404 @@
+"""
+Offline end-to-end benchmark of the booking spider against saved fixtures.
+
+The search results and hotel pages of `fixtures/` are served by a local HTTP server, so the spider runs without
+network and without reaching booking.com. Hotel pages come in three variants: fields in the visible markup, only
+in the embedded JSON-LD and map URL, and coordinates only added by JavaScript. Like the pages of booking.com, every
+fixture page loads the AWS WAF client script, so none of them must be taken for a block by BOOKING_BLOCK_MARKERS.
+
+Two modes are run, one after the other:
+- http: no browser. Every page of search results is fetched over plain HTTP and parsed from its static HTML, as
+  when it is replayed from the HTTP cache. Hotel pages whose coordinates are only added by JavaScript cannot be
+  completed, so their fallback request comes back without them.
+- playwright: the spider runs unchanged, paginating the search with the "Load more results" button in headless
+  Chromium and rendering the hotel pages the static HTML does not complete. Requires scrapy-playwright and its
+  browser (playwright install chromium), and is skipped otherwise.
+
+For every mode it reports items and pages per second, hotel pages sent to the browser, the peak memory of the
+browser processes and, per field, the share of properties extracted with the value of the fixture. Values the mode
+cannot see (coordinates added by JavaScript without a browser) are not errors; any other missing or wrong value
+is. Properties go through the item pipelines of the project, and every property scraped must also be in the CSV and
+JSON Lines exports. --check makes the script exit with status 1 if there is any error.
+
+Usage (from the repository root):
+    python challenge-1/benchmarks/bench_extraction.py --properties 300
+    python challenge-1/benchmarks/bench_extraction.py --modes http --check
+"""
+import argparse
+import csv
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy import signals
+from scrapy.settings import Settings
+
+from booking.page_pool import POOL_META_KEY
+from booking.spiders.booking_crawler import SHARD_META_KEY, BookingPropertiesCrawler
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+MODES = ['http', 'playwright']
+# Outputs of the export pipeline whose rows are counted
+EXPORT_FORMATS = ['csv', 'jsonl']
+FIELDS = ['name', 'latitude', 'longitude', 'address', 'rating']
+# Hotel page variants, and the fields each one has in its static HTML
+VARIANTS = {
+    'markup': set(FIELDS),
+    'json_ld': set(FIELDS),
+    'script': {'name', 'address', 'rating'},
+}
+# Address as each variant shows it, and as the parsers compose it from the JSON-LD
+ADDRESS_FORMATS = {
+    'markup': "{street}, {postal_code} {city}, España",
+    'json_ld': "{street}, {postal_code}, {city}, ES",
+    'script': "{street}, {postal_code} {city}, España",
+}
+CITIES = ['Madrid', 'Barcelona', 'Valencia', 'Sevilla', 'Málaga', 'Bilbao', 'Granada', 'Palma']
+# Interval in seconds between samples of the memory of the browser processes
+MEMORY_SAMPLE_INTERVAL = 0.5
+
+
+def fixture_property(index):
+    """Returns the values of the index-th fixture property, its hotel page variant and its expected fields."""
+    variant = list(VARIANTS)[index % len(VARIANTS)]
+    values = {
+        'index': index,
+        'slug': f"fixture-hotel-{index}",
+        'name': f"Hotel Fixture {index}",
+        'latitude': round(36.0 + index * 7919 % 7000 / 1000, 6),
+        'longitude': round(-9.0 + index * 104729 % 12000 / 1000, 6),
+        'street': f"Calle Mayor {index % 300 + 1}",
+        'postal_code': f"{28001 + index % 900:05d}",
+        'city': CITIES[index % len(CITIES)],
+        'rating': round(5.0 + index % 50 / 10, 1),
+        'price': 60 + index * 37 % 400,
+    }
+    expected = {field: values[field] for field in ('name', 'latitude', 'longitude', 'rating')}
+    expected['address'] = ADDRESS_FORMATS[variant].format(**values)
+    return variant, values, expected
+
+
+class FixtureServer:
+    """Local HTTP server of the fixture search results and hotel pages, in a background thread."""
+
+    def __init__(self, properties, page_size=25, delay=0.0):
+        """
+        :param properties: Number of properties in the search results
+        :param page_size: Property cards per page of results
+        :param delay: Seconds every response is delayed, to simulate network latency
+        """
+        self.properties = properties
+        self.page_size = page_size
+        self.delay = delay
+        self.templates = {}
+        for file_name in os.listdir(FIXTURES_DIR):
+            with open(os.path.join(FIXTURES_DIR, file_name), encoding='utf-8') as f:
+                self.templates[os.path.splitext(file_name)[0]] = Template(f.read())
+        self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        fixtures = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(fixtures.delay)
+                status, headers, body = fixtures.render(self.path)
+                self.send_response(status)
+                for name, value in {**headers, 'Content-Length': str(len(body))}.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def render(self, path):
+        """:return: Tuple (status, headers, body) of the response to a GET of path"""
+        parts = urlsplit(path)
+        html = {'Content-Type': 'text/html; charset=utf-8'}
+        if parts.path == '/searchresults.es.html':
+            query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+            offset = int(query.get('offset', 0))
+            end = min(offset + self.page_size, self.properties)
+            cards = ''.join(self.templates['property_card'].substitute(fixture_property(index)[1])
+                            for index in range(offset, end))
+            headers = {**html, 'X-Next-Offset': str(end) if end < self.properties else ''}
+            if query.get('fragment'):
+                return 200, headers, cards.encode('utf-8')
+            load_more = self.templates['load_more'].substitute(next_offset=end) if end < self.properties else ''
+            page = self.templates['search_results'].substitute(
+                keyword=query.get('ss', ''), total=self.properties, cards=cards, load_more=load_more)
+            return 200, headers, page.encode('utf-8')
+        if parts.path.startswith('/hotel/es/fixture-hotel-'):
+            index = int(parts.path.rsplit('-', 1)[1].split('.')[0])
+            if index < self.properties:
+                variant, values, _ = fixture_property(index)
+                return 200, html, self.templates[f"hotel_{variant}"].substitute(values).encode('utf-8')
+        return 404, html, b'Not found'
+
+
+class FixtureSpider(BookingPropertiesCrawler):
+    """BookingPropertiesCrawler with its search requests sent to the fixture server."""
+
+    name = "booking_fixtures"
+    custom_settings = {}
+
+    def __init__(self, base_url, static=False, page_size=25, **kwargs):
+        """
+        :param base_url: Scheme and host of the fixture server
+        :param static: Whether to fetch every page of search results over plain HTTP instead of paginating in
+            the browser
+        :param page_size: Property cards per page of results
+        """
+        super().__init__(**kwargs)
+        self.base_url = base_url
+        self.static = static
+        self.page_size = page_size
+
+    async def start(self):
+        # Scrapy 2.13 and later call start() instead of start_requests()
+        for request in self.start_requests():
+            yield request
+
+    def start_requests(self):
+        for request in super().start_requests():
+            parts = urlsplit(request.url)
+            url = f"{self.base_url}{parts.path}?{parts.query}"
+            if not self.static:
+                yield request.replace(url=url)
+                continue
+            meta = {key: value for key, value in request.meta.items() if key != POOL_META_KEY}
+            for offset in range(0, self.max_results, self.page_size):
+                yield request.replace(url=f"{url}&offset={offset}", callback=self.parse_static_results,
+                                      errback=None, meta=meta)
+
+    def parse_static_results(self, response):
+        """Yields the hotel page requests of a page of search results fetched over plain HTTP."""
+        yield from self._parse_cached_search_results(response, self.shards[response.meta[SHARD_META_KEY]])
+
+
+def browser_memory_mib():
+    """
+    :return: Resident memory in MiB of the processes started by this one (the Playwright driver and the browser),
+        or None where /proc is not available
+    """
+    if not os.path.isdir('/proc'):
+        return None
+    children = {}
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                # The command name may contain spaces, so the fields are read after its closing parenthesis
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(pid))
+    total_kib, stack = 0, list(children.get(os.getpid(), []))
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                total_kib += next((int(line.split()[1]) for line in f if line.startswith('VmRSS:')), 0)
+        except OSError:
+            continue
+    return total_kib / 1024
+
+
+def mode_settings(mode, export_dir=None):
+    """
+    Returns the project settings for a benchmark mode, with logs and robots.txt disabled. The item pipelines of the
+    project are kept, with the properties exported as CSV and JSON Lines to export_dir.
+    """
+    settings = Settings()
+    settings.setmodule('booking.settings', priority='project')
+    settings.update({
+        'LOG_LEVEL': 'WARNING',
+        'LOG_FILE': None,
+        'ROBOTSTXT_OBEY': False,
+        'TELNETCONSOLE_ENABLED': False,
+        'BOOKING_EXPORT_SINKS': {sink_format: os.path.join(export_dir or '', f"properties.{sink_format}")
+                                 for sink_format in EXPORT_FORMATS},
+        'BOOKING_METRICS_FILE': None,
+    }, priority='cmdline')
+    if mode == 'http':
+        settings.set('DOWNLOAD_HANDLERS', {}, priority='cmdline')
+    else:
+        settings.set('PLAYWRIGHT_LAUNCH_OPTIONS', {'headless': True}, priority='cmdline')
+    return settings
+
+
+def score(items, properties, mode):
+    """
+    :param items: Dict from property index to the fields extracted
+    :param properties: Number of fixture properties
+    :param mode: Benchmark mode
+    :return: Tuple (dict from field to the share of properties extracted with the fixture value, list of errors)
+    """
+    correct, errors = dict.fromkeys(FIELDS, 0), []
+    for index in range(properties):
+        variant, _, expected = fixture_property(index)
+        fields = items.get(index, {})
+        for field in FIELDS:
+            value = fields.get(field)
+            if isinstance(expected[field], float):
+                ok = value is not None and abs(value - expected[field]) < 1e-6
+            else:
+                ok = value == expected[field]
+            if ok:
+                correct[field] += 1
+            elif mode != 'http' or field in VARIANTS[variant]:
+                errors.append(f"{mode}: {field} of fixture-hotel-{index} ({variant}) is {value!r}, "
+                              f"expected {expected[field]!r}")
+    return {field: count / properties for field, count in correct.items()}, errors
+
+
+def exported_rows(export_dir):
+    """:return: Dict from export format to the number of properties in its output"""
+    rows = {}
+    with open(os.path.join(export_dir, 'properties.csv'), newline='', encoding='utf-8') as f:
+        rows['csv'] = max(sum(1 for _ in csv.reader(f)) - 1, 0)
+    with open(os.path.join(export_dir, 'properties.jsonl'), encoding='utf-8') as f:
+        rows['jsonl'] = sum(1 for line in f if line.strip())
+    return rows
+
+
+def run(modes, server, args):
+    """Crawls the fixture server once per mode, one after the other. Returns a dict from mode to its results."""
+    from scrapy.utils.reactor import install_reactor
+    install_reactor(mode_settings('http')['TWISTED_REACTOR'])
+    from scrapy.crawler import CrawlerRunner
+    from scrapy.utils.log import configure_logging
+    from twisted.internet import defer, reactor, task
+
+    configure_logging(mode_settings('http'))
+
+    results = {}
+
+    @defer.inlineCallbacks
+    def crawl(mode):
+        export_dir = tempfile.mkdtemp(prefix=f"bench-{mode}-")
+        runner = CrawlerRunner(mode_settings(mode, export_dir))
+        crawler = runner.create_crawler(FixtureSpider)
+        items = {}
+
+        def item_scraped(item):
+            index = int(item.url.rsplit('-', 1)[1].split('.')[0])
+            items[index] = {field: getattr(item, field) for field in FIELDS}
+
+        crawler.signals.connect(item_scraped, signal=signals.item_scraped)
+        peak_memory = [None]
+
+        def sample_memory():
+            memory = browser_memory_mib()
+            if memory is not None:
+                peak_memory[0] = max(peak_memory[0] or 0.0, memory)
+
+        sampler = task.LoopingCall(sample_memory)
+        sampler.start(MEMORY_SAMPLE_INTERVAL)
+        start = time.perf_counter()
+        try:
+            yield runner.crawl(crawler, base_url=server.base_url, static=mode == 'http', page_size=args.page_size,
+                               search_keyword="Fixtures", max_results=args.properties)
+        finally:
+            sampler.stop()
+        elapsed = time.perf_counter() - start
+        stats = crawler.stats.get_stats()
+        success, errors = score(items, args.properties, mode)
+        exported = exported_rows(export_dir)
+        shutil.rmtree(export_dir)
+        for sink_format, rows in exported.items():
+            if rows != len(items):
+                errors.append(f"{mode}: {rows} properties exported to {sink_format}, {len(items)} scraped")
+        results[mode] = {
+            'items': len(items),
+            'items_per_s': len(items) / elapsed,
+            'pages_per_s': stats.get('downloader/response_count', 0) / elapsed,
+            'rendered': stats.get('booking/hotel_pages/playwright_fallback', 0),
+            'extract_p50_ms': stats.get('metrics/extract/property/p50_s', 0.0) * 1000,
+            'browser_mib': peak_memory[0] if mode != 'http' else None,
+            'success': success,
+            'errors': errors,
+        }
+
+    @defer.inlineCallbacks
+    def crawl_all():
+        try:
+            for mode in modes:
+                yield crawl(mode)
+        finally:
+            reactor.stop()
+
+    reactor.callWhenRunning(crawl_all)
+    reactor.run()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--properties", type=int, default=300, help="Number of fixture properties.")
+    parser.add_argument("--page-size", type=int, default=25, help="Property cards per page of search results.")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds every response of the server is delayed.")
+    parser.add_argument("--modes", default=';'.join(MODES), help="Modes to run, separated by ';'.")
+    parser.add_argument("--check", action="store_true",
+                        help="Exit with status 1 if any field is extracted or exported wrong.")
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(';') if mode.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"Unknown modes: {', '.join(sorted(unknown))}. Expected some of {MODES}")
+    if 'playwright' in modes and importlib.util.find_spec('scrapy_playwright') is None:
+        print("Skipping the playwright mode: scrapy-playwright is not installed")
+        modes.remove('playwright')
+    if not modes:
+        return
+
+    server = FixtureServer(args.properties, page_size=args.page_size, delay=args.delay).start()
+    try:
+        results = run(modes, server, args)
+    finally:
+        server.stop()
+
+    print(f"{'Mode':<12}{'Items':>7}{'Items/s':>10}{'Pages/s':>10}{'Fallbacks':>11}{'Extract p50 ms':>16}"
+          f"{'Browser MiB':>13}" + ''.join(f"{field:>11}" for field in FIELDS))
+    errors = []
+    for mode, result in results.items():
+        memory = f"{result['browser_mib']:.0f}" if result['browser_mib'] is not None else '-'
+        print(f"{mode:<12}{result['items']:>7}{result['items_per_s']:>10.1f}{result['pages_per_s']:>10.1f}"
+              f"{result['rendered']:>11}{result['extract_p50_ms']:>16.2f}{memory:>13}"
+              + ''.join(f"{result['success'][field]:>11.1%}" for field in FIELDS))
+        errors += result['errors']
+    for error in errors[:20]:
+        print(error)
+    if len(errors) > 20:
+        print(f"... and {len(errors) - 20} more errors")
+    if args.check and errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Micro-benchmark of the property item types: memory per item, creation time and export throughput of the
+dict-backed scrapy.Item (PropertyItem) against the slotted dataclass (PropertyRecord).
+
+Memory is measured with tracemalloc over a list of items kept alive. The field values are created beforehand and
+shared by both item types, so it only counts what creating the item allocates: its container and, for
+PropertyRecord, the canonical URL string __post_init__ builds, which PropertyItem does not. That URL share is
+printed apart. Exports go through Scrapy's CSV and JSON Lines item exporters, the ones used by feed exports, to
+memory.
+
+Usage (from the repository root):
+    python challenge-1/benchmarks/bench_items.py --items 100000
+"""
+import argparse
+import gc
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy.exporters import CsvItemExporter, JsonLinesItemExporter
+
+from booking.items import PropertyItem, PropertyRecord
+from booking.utils import canonical_property_url
+
+EXPORTERS = {'csv': CsvItemExporter, 'jsonl': JsonLinesItemExporter}
+
+
+def property_fields(i):
+    """Returns the fields of the i-th synthetic property, typed as the spider yields them."""
+    return {
+        'name': f"Hotel {i}",
+        'latitude': 40.0 + i / 1e6,
+        'longitude': -3.7 - i / 1e6,
+        'address': f"Calle Mayor {i % 300}, 28013 Madrid",
+        'price': f"€ {100 + i % 900}",
+        'price_amount': float(100 + i % 900),
+        'price_currency': 'EUR',
+        'rating': 5.0 + i % 50 / 10,
+        'url': f"https://www.booking.com/hotel/es/hotel-{i}.html",
+    }
+
+
+def create(item_class, fields):
+    """Returns the items created from fields and the seconds it took."""
+    start = time.perf_counter()
+    items = [item_class(**values) for values in fields]
+    return items, time.perf_counter() - start
+
+
+def memory_per_item(item_class, fields):
+    """Returns the bytes allocated per item when it is created from values that already exist."""
+    return allocated_per_value(lambda values: item_class(**values), fields)
+
+
+def allocated_per_value(function, values):
+    """Returns the bytes allocated per value by function, over results kept alive."""
+    gc.collect()
+    tracemalloc.start()
+    results = [function(value) for value in values]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return size / len(values)
+
+
+def export(items, exporter_class):
+    """Returns the seconds it takes to export the items."""
+    exporter = exporter_class(io.BytesIO())
+    start = time.perf_counter()
+    exporter.start_exporting()
+    for item in items:
+        exporter.export_item(item)
+    exporter.finish_exporting()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100_000, help="Number of synthetic properties.")
+    args = parser.parse_args()
+
+    # The values are shared by both item types, so memory only counts the item containers and, for PropertyRecord,
+    # the canonical URL it allocates
+    fields = [property_fields(i) for i in range(args.items)]
+    print(f"{'Item type':<16}{'Bytes/item':>12}{'Create/s':>14}" + ''.join(f"{name + ' export/s':>18}" for name in EXPORTERS))
+    for item_class in (PropertyItem, PropertyRecord):
+        items, elapsed = create(item_class, fields)
+        exports = [args.items / export(items, exporter_class) for exporter_class in EXPORTERS.values()]
+        memory = memory_per_item(item_class, fields)
+        print(f"{item_class.__name__:<16}{memory:>12,.0f}{args.items / elapsed:>14,.0f}"
+              + ''.join(f"{rate:>18,.0f}" for rate in exports))
+    url_bytes = allocated_per_value(lambda values: canonical_property_url(values['url']), fields)
+    print(f"PropertyRecord bytes/item include {url_bytes:,.0f} of the canonical URL string built by __post_init__")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# Persistent state of the booking crawls
+#
+# The properties found and scraped, and the search shards finished, are stored in SQLite instead of in memory,
+# so memory does not grow with the crawl and an interrupted crawl resumes where it stopped: hotel pages
+# requested but not scraped are requested again, and scraped ones and finished shards are skipped.
+import hashlib
+import math
+import os
+import sqlite3
+import time
+
+# State of a property in the store
+PENDING = 0  # Its hotel page was requested but not scraped yet
+SCRAPED = 1
+
+# File of the store inside JOBDIR, when it is set
+STATE_FILE_NAME = 'booking_state.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS properties (
+    url TEXT PRIMARY KEY,
+    request_url TEXT,
+    shard TEXT,
+    price TEXT,
+    state INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS finished_shards (
+    name TEXT PRIMARY KEY
+);
+"""
+
+
+class BloomFilter:
+    """
+    Set of strings with a fixed memory size, which may report as present a string never added (with a
+    probability of error_rate while it holds less than capacity strings), but never the other way round.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001):
+        """
+        :param capacity: Expected number of strings
+        :param error_rate: False positive rate at capacity
+        """
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        # Double hashing: the k positions are derived from the two halves of one digest
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class CrawlState:
+    """
+    Disk-backed set of the canonical URLs of the properties found, with their state, and of the shards finished.
+
+    Lookups go through a Bloom filter first, so the database is only queried for URLs that were probably
+    seen. Writes are committed in batches of commit_every and when the store is closed.
+    """
+
+    def __init__(self, path='', capacity=1_000_000, commit_every=100):
+        """
+        :param path: SQLite file. An empty path stores the state in a temporary file, deleted when closed.
+        :param capacity: Expected number of properties, to size the Bloom filter
+        :param commit_every: Writes between commits
+        """
+        self.path = path
+        self.commit_every = commit_every
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._pending_writes = 0
+
+        self._bloom = BloomFilter(capacity)
+        for (url,) in self._db.execute("SELECT url FROM properties"):
+            self._bloom.add(url)
+        self.scraped = self._db.execute("SELECT COUNT(*) FROM properties WHERE state = ?", (SCRAPED,)).fetchone()[0]
+        # Properties added from now on are requested by this run, not resumed
+        self._resumed_rowid = self._db.execute("SELECT COALESCE(MAX(rowid), 0) FROM properties").fetchone()[0]
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Returns the store in BOOKING_STATE_FILE or, if not set, in JOBDIR. Without any of them the state is
+        kept in a temporary file and the crawl cannot be resumed.
+        """
+        path = settings.get('BOOKING_STATE_FILE')
+        if not path and settings.get('JOBDIR'):
+            path = os.path.join(settings.get('JOBDIR'), STATE_FILE_NAME)
+        return cls(path or '', capacity=settings.getint('BOOKING_STATE_CAPACITY', 1_000_000))
+
+    def __contains__(self, url):
+        if url not in self._bloom:
+            return False
+        return self._db.execute("SELECT 1 FROM properties WHERE url = ?", (url,)).fetchone() is not None
+
+    def add(self, url, request_url=None, shard=None, price=None, state=PENDING):
+        """
+        Records a property found in a search.
+
+        :param url: Canonical URL of the property
+        :param request_url: URL its hotel page is requested with
+        :param shard: Name of the shard it was found in
+        :param price: Price shown in the search results
+        :param state: PENDING if its hotel page is requested, SCRAPED if it was extracted already
+        """
+        self._bloom.add(url)
+        cursor = self._write("INSERT OR IGNORE INTO properties VALUES (?, ?, ?, ?, ?, ?)",
+                             (url, request_url, shard, price, state, time.time()))
+        if state == SCRAPED:
+            self.scraped += cursor.rowcount
+
+    def mark_scraped(self, url):
+        """Records that the property was extracted, so it is not requested again when resuming."""
+        cursor = self._write("UPDATE properties SET state = ?, updated = ? WHERE url = ? AND state = ?",
+                             (SCRAPED, time.time(), url, PENDING))
+        self.scraped += cursor.rowcount
+
+    def pending(self):
+        """
+        :return: Iterator of tuples (url, request_url, shard, price) of the properties whose hotel page was
+            requested by a previous run but not scraped
+        """
+        return self._db.execute("SELECT url, request_url, shard, price FROM properties WHERE state = ? "
+                                "AND request_url IS NOT NULL AND rowid <= ?", (PENDING, self._resumed_rowid))
+
+    def shard_counts(self):
+        """:return: Dict with the number of properties found in every shard"""
+        return dict(self._db.execute("SELECT shard, COUNT(*) FROM properties WHERE shard IS NOT NULL GROUP BY shard"))
+
+    def finish_shard(self, name):
+        """Records that all the results wanted from the shard were found."""
+        self._write("INSERT OR IGNORE INTO finished_shards VALUES (?)", (name,))
+
+    def finished_shards(self):
+        """:return: Set with the names of the finished shards"""
+        return {name for (name,) in self._db.execute("SELECT name FROM finished_shards")}
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+    def _write(self, sql, params):
+        cursor = self._db.execute(sql, params)
+        self._pending_writes += 1
+        if self._pending_writes >= self.commit_every:
+            self._db.commit()
+            self._pending_writes = 0
+        return cursor
@@ -0,0 +1,143 @@
+# HTTP cache storage for the booking spiders
+#
+# Storage backend for Scrapy's HttpCacheMiddleware (HTTPCACHE_STORAGE) keeping the responses, both plain HTTP and
+# rendered by Playwright, compressed in a single SQLite file. Responses are keyed by the canonical URL of the
+# request, the search params of its shard and whether it was rendered, so the same page requested with other
+# tracking parameters or languages is served from the cache. The least recently used responses are evicted once
+# the cache grows over BOOKING_HTTPCACHE_MAX_MB.
+#
+# Search results pages are paginated live in the browser, so they are stored but only replayed offline, when
+# HTTPCACHE_IGNORE_MISSING is set: otherwise a rerun would only see their first page of results.
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+from scrapy.http.headers import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+
+from booking.page_pool import POOL_META_KEY
+from booking.utils import canonical_property_url
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE_NAME = 'booking_cache.sqlite'
+# Meta key of the requests whose response is only replayed from the cache offline
+REPLAY_ONLY_META_KEY = 'cache_replay_only'
+# zlib level of the stored headers and bodies
+COMPRESSION_LEVEL = 6
+# Fraction of the maximum size the cache is shrunk to when it is exceeded, so eviction does not run on every store
+EVICTION_TARGET = 0.9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers BLOB NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+
+def cache_key(spider, request):
+    """
+    :param spider: Scrapy Spider object. If it has `shards`, the search params of the shard of the request are
+        part of the key, otherwise its `query_params`
+    :param request: Scrapy Request object
+    :return: Key of the request in the cache
+    """
+    shards = getattr(spider, 'shards', {})
+    shard = shards.get(request.meta.get('shard'))
+    params = shard.query_params if shard else getattr(spider, 'query_params', {})
+    key = {
+        'url': canonical_property_url(request.url),
+        'params': params,
+        'rendered': bool(request.meta.get(POOL_META_KEY)),
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class SQLiteCacheStorage:
+    """
+    Compressed, size-bounded HTTP cache in SQLite.
+
+    Uses HTTPCACHE_DIR and HTTPCACHE_EXPIRATION_SECS (time to live, 0 to never expire) like Scrapy's own storages,
+    plus BOOKING_HTTPCACHE_MAX_MB (0 for no limit). Headers and bodies are always stored compressed with zlib.
+    """
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.max_size = settings.getint('BOOKING_HTTPCACHE_MAX_MB') * 2 ** 20
+        self.offline = settings.getbool('HTTPCACHE_IGNORE_MISSING')
+        self._db = None
+        self._size = 0
+
+    def open_spider(self, spider):
+        path = os.path.join(self.cachedir, f"{spider.name}_{CACHE_FILE_NAME}")
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        if self.expiration_secs > 0:
+            self._db.execute("DELETE FROM responses WHERE stored < ?", (time.time() - self.expiration_secs,))
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        logger.debug(f"Using SQLite cache storage in {path} ({self._size / 2 ** 20:.1f} MiB)")
+
+    def close_spider(self, spider):
+        self._db.commit()
+        self._db.close()
+
+    def retrieve_response(self, spider, request):
+        """Returns the cached response of the request, or None if it is not cached or expired."""
+        if request.meta.get(REPLAY_ONLY_META_KEY) and not self.offline:
+            return None
+        key = cache_key(spider, request)
+        row = self._db.execute("SELECT url, status, headers, body, stored FROM responses WHERE key = ?",
+                               (key,)).fetchone()
+        if row is None:
+            return None
+        url, status, headers, body, stored = row
+        if 0 < self.expiration_secs < time.time() - stored:
+            return None
+        self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+        headers = Headers(json.loads(zlib.decompress(headers)))
+        body = zlib.decompress(body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        request.meta['cache_timestamp'] = stored
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        """Stores the response of the request, evicting the least recently used ones if the cache is full."""
+        headers = json.dumps({key.decode('latin-1'): [value.decode('latin-1') for value in values]
+                              for key, values in response.headers.items()}).encode('latin-1')
+        headers, body = zlib.compress(headers, COMPRESSION_LEVEL), zlib.compress(response.body, COMPRESSION_LEVEL)
+        size = len(headers) + len(body)
+        key = cache_key(spider, request)
+        now = time.time()
+        previous = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (key, response.url, response.status, headers, body, size, now, now))
+        self._size += size - (previous[0] if previous else 0)
+        if self.max_size and self._size > self.max_size:
+            self._evict()
+        self._db.commit()
+
+    def _evict(self):
+        target = self.max_size * EVICTION_TARGET
+        evicted = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if self._size <= target:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        logger.debug(f"Evicted {len(evicted)} responses from the HTTP cache")
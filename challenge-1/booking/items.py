@@ -2,14 +2,67 @@
 #
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
+from dataclasses import dataclass
 
 import scrapy
 
+from booking.utils import canonical_property_url
+
 class PropertyItem(scrapy.Item):
     name = scrapy.Field()
     latitude = scrapy.Field()
     longitude = scrapy.Field()
     address = scrapy.Field()
     price = scrapy.Field()
+    price_amount = scrapy.Field()  # Set by PropertyNormalizationPipeline from price
+    price_currency = scrapy.Field()
     rating = scrapy.Field()
     url = scrapy.Field()
+
+
+@dataclass(slots=True, eq=False)
+class PropertyRecord:
+    """
+    Compact property yielded by the spiders, with the fields of PropertyItem.
+
+    Being a slotted dataclass it takes a fraction of the memory of a scrapy.Item and is supported by itemadapter,
+    so pipelines and feed exports handle it like any other item. Numeric fields are converted to float, the URL is
+    made canonical, and records are equal, and hashed, by URL.
+    """
+    name: str = None
+    latitude: float = None
+    longitude: float = None
+    address: str = None
+    price: str = None
+    price_amount: float = None
+    price_currency: str = None
+    rating: float = None
+    url: str = None
+
+    def __post_init__(self):
+        self.latitude = to_float(self.latitude)
+        self.longitude = to_float(self.longitude)
+        self.price_amount = to_float(self.price_amount)
+        self.rating = to_float(self.rating)
+        if self.url:
+            self.url = canonical_property_url(self.url)
+
+    def __eq__(self, other):
+        if not isinstance(other, PropertyRecord):
+            return NotImplemented
+        return self.url == other.url
+
+    def __hash__(self):
+        return hash(self.url)
+
+
+def to_float(value):
+    """:return: The value as float, or None if it is missing or not a number"""
+    if isinstance(value, float):
+        return value
+    if isinstance(value, str):
+        value = value.strip().replace(',', '.')  # Decimal comma, e.g. a rating of 8,4
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,209 @@
+# Run metrics of the booking spiders
+#
+# The spider records the time of every stage (search page load, "load more" cycles, hotel page fetch and render,
+# extraction of every field) in histograms and counts cards, duplicates and extraction failures. MetricsExtension
+# copies them to the Scrapy stats and dumps them periodically to BOOKING_METRICS_FILE, as JSON or, if the file
+# ends in .prom, in the Prometheus text format.
+import json
+import logging
+import os
+import re
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the buckets of the histograms
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PROMETHEUS_PREFIX = 'booking_'
+PROMETHEUS_EXTENSION = '.prom'
+
+
+class Histogram:
+    """Distribution of durations in cumulative buckets, like a Prometheus histogram."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """:return: Upper bound of the bucket of the q quantile, or the maximum if it is in the +Inf bucket"""
+        if not self.count:
+            return 0.0
+        rank, cumulative = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum_s': round(self.sum, 6),
+            'mean_s': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50_s': round(self.quantile(0.5), 6),
+            'p95_s': round(self.quantile(0.95), 6),
+            'max_s': round(self.max, 6),
+        }
+
+
+class _Timer:
+    """Context manager adding the time of the enclosed block to a histogram."""
+
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class CrawlMetrics:
+    """Histograms of durations, counters and gauges of a crawl."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        # Functions returning the current value of every gauge
+        self.gauges = {}
+        self.started = time.time()
+
+    def observe(self, name, seconds):
+        """Adds a duration to the histogram name."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+    def timer(self, name):
+        """Context manager adding the time of the enclosed block to the histogram name."""
+        return _Timer(self, name)
+
+    def inc(self, name, count=1):
+        """Adds count to the counter name."""
+        self.counters[name] = self.counters.get(name, 0) + count
+
+    def gauge(self, name, function):
+        """Registers a gauge whose value is returned by function when the metrics are read."""
+        self.gauges[name] = function
+
+    def report(self):
+        """:return: Dict with the histograms, counters and gauges"""
+        return {
+            'timestamp': time.time(),
+            'uptime_s': round(time.time() - self.started, 3),
+            'histograms': {name: histogram.as_dict() for name, histogram in sorted(self.histograms.items())},
+            'counters': dict(sorted(self.counters.items())),
+            'gauges': {name: function() for name, function in sorted(self.gauges.items())},
+        }
+
+    def prometheus(self):
+        """:return: The metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, histogram in sorted(self.histograms.items()):
+            metric = _prometheus_name(name) + '_seconds'
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f"{metric}_sum {histogram.sum}")
+            lines.append(f"{metric}_count {histogram.count}")
+        for name, value in sorted(self.counters.items()):
+            metric = _prometheus_name(name) + '_total'
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, function in sorted(self.gauges.items()):
+            metric = _prometheus_name(name)
+            lines += [f"# TYPE {metric} gauge", f"{metric} {function()}"]
+        return '\n'.join(lines) + '\n'
+
+    def to_stats(self, stats):
+        """Copies the metrics to the Scrapy stats, under `metrics/`."""
+        for name, histogram in self.histograms.items():
+            for key, value in histogram.as_dict().items():
+                stats.set_value(f"metrics/{name}/{key}", value)
+        for name, value in self.counters.items():
+            stats.set_value(f"metrics/{name}", value)
+        for name, function in self.gauges.items():
+            stats.set_value(f"metrics/{name}", function())
+
+    def dump(self, path):
+        """Writes the metrics to path, in the Prometheus text format if it ends in .prom, as JSON otherwise."""
+        content = self.prometheus() if path.endswith(PROMETHEUS_EXTENSION) else json.dumps(self.report(), indent=2)
+        # Written to a temporary file and moved, so readers never see a partial dump
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+
+class MetricsExtension:
+    """
+    Copies the `metrics` of the spider to the Scrapy stats every BOOKING_METRICS_INTERVAL seconds and when it closes,
+    and dumps them to BOOKING_METRICS_FILE if set.
+    """
+
+    def __init__(self, stats, path=None, interval=30.0):
+        self.stats = stats
+        self.path = path
+        self.interval = interval
+        self.metrics = None
+        self._task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Returns an instance of MetricsExtension connected to the spider signals."""
+        interval = crawler.settings.getfloat('BOOKING_METRICS_INTERVAL', 30.0)
+        if interval <= 0:
+            raise NotConfigured
+        extension = cls(crawler.stats, crawler.settings.get('BOOKING_METRICS_FILE'), interval)
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        self.metrics = getattr(spider, 'metrics', None)
+        if self.metrics is None:
+            return
+        self._task = task.LoopingCall(self.publish)
+        self._task.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self._task and self._task.running:
+            self._task.stop()
+        if self.metrics is not None:
+            self.publish()
+
+    def publish(self):
+        """Copies the metrics to the stats and dumps them to the metrics file."""
+        self.metrics.to_stats(self.stats)
+        if self.path:
+            try:
+                self.metrics.dump(self.path)
+            except OSError as e:
+                logger.error(f"Could not write the metrics to {self.path}: {e}")
+
+
+def _prometheus_name(name):
+    return PROMETHEUS_PREFIX + re.sub(r'[^a-zA-Z0-9_]', '_', name)
@@ -2,7 +2,14 @@
 #
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
+import asyncio
 import random
+import time
+
+from scrapy.downloadermiddlewares.retry import get_retry_request
+from scrapy.exceptions import NotConfigured
+
+from booking.page_pool import POOL_META_KEY
 
 class RotateUserAgentMiddleware:
     """Rotates User-Agent headers to avoid being blocked by websites."""
@@ -23,4 +30,208 @@ class RotateUserAgentMiddleware:
         :param request: Scrapy Request object
         :param spider: Scrapy Spider object
         """
-        request.headers['User-Agent'] = random.choice(self.user_agents)
\ No newline at end of file
+        request.headers['User-Agent'] = random.choice(self.user_agents)
+
+class AIMDController:
+    """
+    Additive increase, multiplicative decrease controller of a concurrency limit, as used by TCP congestion control.
+
+    The limit grows by one after a window of successful responses as large as the limit itself, while the latency
+    stays under the target, and is multiplied by decrease_factor on errors, blocks and slow responses, at most once
+    per window so the responses of requests sent before a decrease do not decrease it again.
+    """
+
+    def __init__(self, start, minimum=1, maximum=32, target_latency=2.0, decrease_factor=0.5, smoothing=0.2):
+        """
+        :param start: Initial limit
+        :param minimum: Lowest limit
+        :param maximum: Highest limit
+        :param target_latency: Seconds of (smoothed) latency over which the limit is decreased
+        :param decrease_factor: Factor the limit is multiplied by when decreased
+        :param smoothing: Weight of every new latency in the exponentially weighted moving average
+        """
+        self.minimum = minimum
+        self.maximum = max(maximum, start)
+        self.limit = min(max(start, minimum), self.maximum)
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.smoothing = smoothing
+        self.latency = None
+        self.responses = 0
+        self.errors = 0
+        self._window = 0
+        self._since_decrease = 0
+        self._started = time.monotonic()
+
+    @property
+    def error_rate(self):
+        return self.errors / self.responses if self.responses else 0.0
+
+    @property
+    def rate(self):
+        """Responses per second since the controller was created."""
+        elapsed = time.monotonic() - self._started
+        return self.responses / elapsed if elapsed else 0.0
+
+    def on_success(self, latency):
+        """
+        :param latency: Seconds the response took
+        :return: The new limit
+        """
+        self.responses += 1
+        self._since_decrease += 1
+        self.latency = latency if self.latency is None else self.latency + self.smoothing * (latency - self.latency)
+        if self.latency > self.target_latency:
+            return self._decrease()
+        self._window += 1
+        if self._window >= self.limit:
+            self._window = 0
+            self.limit = min(self.limit + 1, self.maximum)
+        return self.limit
+
+    def on_failure(self):
+        """Registers an error or a block. :return: The new limit"""
+        self.responses += 1
+        self.errors += 1
+        self._since_decrease += 1
+        return self._decrease()
+
+    def _decrease(self):
+        self._window = 0
+        if self._since_decrease >= self.limit:
+            self._since_decrease = 0
+            self.limit = max(int(self.limit * self.decrease_factor), self.minimum)
+        return self.limit
+
+
+class AdaptiveConcurrencyMiddleware:
+    """
+    Adapts the concurrency of every download slot, and the Playwright pages of the spider's page pool, to the
+    latency, errors and blocks of its responses with an AIMD controller, and retries blocked requests with
+    exponential backoff.
+
+    A response is blocked when its status is in BOOKING_BLOCK_STATUS (403, 429, 503) or its body contains one of
+    BOOKING_BLOCK_MARKERS (captcha and challenge pages). Blocked requests are retried up to
+    BOOKING_BLOCK_MAX_RETRIES times, after waiting the Retry-After header or
+    BOOKING_BACKOFF_BASE * 2 ** retries seconds (with jitter, up to BOOKING_BACKOFF_MAX). Other download errors
+    are left to Scrapy's RetryMiddleware. The limits, latency, error rate and rate of every slot are exposed in
+    the crawler stats under `adaptive/`.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('BOOKING_ADAPTIVE_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.minimum = settings.getint('BOOKING_ADAPTIVE_MIN_CONCURRENCY', 1)
+        self.maximum = settings.getint('BOOKING_ADAPTIVE_MAX_CONCURRENCY', 32)
+        self.target_latency = settings.getfloat('BOOKING_ADAPTIVE_TARGET_LATENCY', 2.0)
+        self.decrease_factor = settings.getfloat('BOOKING_ADAPTIVE_DECREASE_FACTOR', 0.5)
+        self.block_status = {int(status) for status in settings.getlist('BOOKING_BLOCK_STATUS', [403, 429, 503])}
+        self.block_markers = [marker.encode() for marker in settings.getlist('BOOKING_BLOCK_MARKERS')]
+        self.max_retries = settings.getint('BOOKING_BLOCK_MAX_RETRIES', 5)
+        self.backoff_base = settings.getfloat('BOOKING_BACKOFF_BASE', 2.0)
+        self.backoff_max = settings.getfloat('BOOKING_BACKOFF_MAX', 60.0)
+        self.controllers = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Returns an instance of AdaptiveConcurrencyMiddleware."""
+        return cls(crawler)
+
+    async def process_response(self, request, response, spider):
+        """
+        Feeds the latency or the block of the response to the controllers of its slot and of the page pool, and
+        retries blocked requests after a backoff.
+
+        :param request: Scrapy Request object
+        :param response: Scrapy Response object
+        :param spider: Scrapy Spider object
+        """
+        if 'cached' in response.flags:
+            return response
+        if not self.is_blocked(response):
+            latency = request.meta.get('download_latency', 0.0)
+            for key, controller in self._controllers(request, spider):
+                self._apply(key, controller.on_success(latency), spider)
+            return response
+
+        self.stats.inc_value('adaptive/blocked')
+        self.stats.inc_value(f'adaptive/blocked/{response.status}')
+        self._on_failure(request, spider)
+        retry_request = get_retry_request(request, spider=spider, reason=f'blocked ({response.status})',
+                                          max_retry_times=self.max_retries, stats_base_key='adaptive/retry')
+        if retry_request is None:
+            return response
+        await asyncio.sleep(self.backoff(request, response))
+        return retry_request
+
+    def process_exception(self, request, exception, spider):
+        """
+        Counts the download error for the controllers of the slot and of the page pool. The request is retried by
+        RetryMiddleware.
+
+        :param request: Scrapy Request object
+        :param exception: Exception raised by the download
+        :param spider: Scrapy Spider object
+        """
+        self.stats.inc_value('adaptive/errors')
+        self._on_failure(request, spider)
+
+    def is_blocked(self, response):
+        """
+        :param response: Scrapy Response object
+        :return: True if the response is a block, rate limit or captcha page
+        """
+        if response.status in self.block_status:
+            return True
+        body = response.body.lower()
+        return any(marker in body for marker in self.block_markers)
+
+    def backoff(self, request, response):
+        """
+        :return: Seconds to wait before retrying a blocked request: its Retry-After header if it is a number of
+            seconds, otherwise an exponential backoff on the retries of the request with full jitter
+        """
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        retries = request.meta.get('retry_times', 0)
+        return random.uniform(0, min(self.backoff_base * 2 ** retries, self.backoff_max))
+
+    def _on_failure(self, request, spider):
+        for key, controller in self._controllers(request, spider):
+            self._apply(key, controller.on_failure(), spider)
+
+    def _controllers(self, request, spider):
+        """Yields the keys and controllers of the download slot of the request and, if it took a page, of the pool."""
+        slot_key = self.crawler.engine.downloader.get_slot_key(request)
+        slot = self.crawler.engine.downloader.slots.get(slot_key)
+        if slot is not None:
+            yield slot_key, self._controller(slot_key, slot.concurrency, self.maximum)
+        page_pool = getattr(spider, 'page_pool', None)
+        if page_pool is not None and request.meta.get(POOL_META_KEY):
+            yield 'page_pool', self._controller('page_pool', page_pool.max_pages, page_pool.max_pages)
+
+    def _controller(self, key, start, maximum):
+        controller = self.controllers.get(key)
+        if controller is None:
+            controller = self.controllers[key] = AIMDController(
+                start, minimum=self.minimum, maximum=maximum, target_latency=self.target_latency,
+                decrease_factor=self.decrease_factor)
+        return controller
+
+    def _apply(self, key, limit, spider):
+        """Sets the limit of the slot or of the page pool and exposes it in the stats."""
+        if key == 'page_pool':
+            spider.page_pool.resize(limit)
+        else:
+            slot = self.crawler.engine.downloader.slots.get(key)
+            if slot is not None:
+                slot.concurrency = limit
+        controller = self.controllers[key]
+        self.stats.set_value(f'adaptive/{key}/concurrency', limit)
+        self.stats.set_value(f'adaptive/{key}/latency_ms', round((controller.latency or 0.0) * 1000))
+        self.stats.set_value(f'adaptive/{key}/error_rate', round(controller.error_rate, 3))
+        self.stats.set_value(f'adaptive/{key}/responses_per_second', round(controller.rate, 2))
@@ -0,0 +1,93 @@
+# Network helpers for the Playwright pages of the booking spiders
+#
+# `should_abort_request` is meant for the PLAYWRIGHT_ABORT_REQUEST setting: it aborts the requests
+# that the crawler does not need (images, media, fonts and trackers), so pages load faster and use
+# less memory. `SearchResultsListener` reads the property cards from the search results responses
+# the page receives while paginating.
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+from booking.parsers import parse_search_payload
+
+logger = logging.getLogger(__name__)
+
+# Resource types the crawler never reads
+BLOCKED_RESOURCE_TYPES = {'image', 'media', 'font', 'texttrack', 'manifest'}
+# Hosts of analytics, ads and tracking scripts
+BLOCKED_HOSTS = (
+    'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googlesyndication.com',
+    'facebook.net', 'facebook.com', 'bat.bing.com', 'hotjar.com', 'criteo.com', 'criteo.net',
+    'taboola.com', 'outbrain.com', 'scorecardresearch.com', 'quantserve.com',
+)
+# Path of the GraphQL endpoint that serves the next pages of search results
+SEARCH_RESULTS_PATH = '/dml/graphql'
+
+
+def should_abort_request(request):
+    """
+    :param request: Playwright Request object
+    :return: True if the request is not needed to read the page
+    """
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+    host = urlsplit(request.url).hostname or ''
+    return any(host == blocked or host.endswith('.' + blocked) for blocked in BLOCKED_HOSTS)
+
+
+def is_search_results_response(response):
+    """
+    :param response: Playwright Response object
+    :return: True if the response carries a page of search results
+    """
+    return response.request.method == 'POST' and urlsplit(response.url).path == SEARCH_RESULTS_PATH
+
+
+class SearchResultsListener:
+    """
+    Collects the properties of the search results responses received by a page.
+
+    Attach it with `page.on("response", listener)`. Properties are parsed as the responses arrive and
+    taken with `pop_properties`; `wait_for_results` waits until the next response has been read.
+    """
+
+    def __init__(self):
+        self._properties = []
+        self._tasks = set()
+        self._received = asyncio.Event()
+
+    def __call__(self, response):
+        if is_search_results_response(response):
+            task = asyncio.ensure_future(self._read(response))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _read(self, response):
+        try:
+            self._properties.extend(parse_search_payload(await response.json()))
+        except Exception as e:
+            logger.debug(f"Could not read search results from {response.url}: {e}")
+        finally:
+            self._received.set()
+
+    async def wait_for_results(self, timeout):
+        """
+        Waits until a search results response is read since the last call.
+
+        :param timeout: Maximum seconds to wait
+        :return: True if a response was read, False on timeout
+        """
+        try:
+            await asyncio.wait_for(self._received.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._received.clear()
+
+    def pop_properties(self):
+        """
+        :return: The properties read since the last call, as dicts with the fields of PropertyItem
+        """
+        properties, self._properties = self._properties, []
+        return properties
@@ -0,0 +1,274 @@
+# Pool of Playwright pages for the booking spiders
+#
+# scrapy-playwright opens a page for every request marked with `playwright` meta. Requests marked
+# with `page_pool` meta get their page through the spider's PagePool instead: it bounds the pages
+# open at once, spreads them over browser contexts that are replaced after a number of uses, and
+# closes pages and retired contexts as soon as they are given back.
+import asyncio
+import time
+from collections import deque
+
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider
+
+# Meta keys used by the pool
+POOL_META_KEY = 'page_pool'
+CONTEXT_META_KEY = 'page_pool_context'
+RELEASED_META_KEY = 'page_pool_released'
+
+
+class PagePool:
+    """
+    Bounded pool of Playwright pages spread over recyclable browser contexts.
+
+    Pages are taken with `acquire` before the request is downloaded and must be given back with
+    `release`, from the callback or errback of the request, whatever the outcome. A browser context
+    serves `max_context_uses` pages and is then retired: new pages go to a fresh context and the old
+    one is closed when its last page is released, which keeps the memory of Chromium flat.
+    """
+
+    def __init__(self, max_pages=4, max_context_uses=100, context_prefix='pool'):
+        """
+        :param max_pages: Maximum number of pages open at once
+        :param max_context_uses: Pages opened in a browser context before it is replaced
+        :param context_prefix: Prefix of the names of the browser contexts
+        """
+        self.max_pages = max_pages
+        self.max_context_uses = max_context_uses
+        self.context_prefix = context_prefix
+        # Pages taken, and requests waiting for a page, in order
+        self._in_use = 0
+        self._waiters = deque()
+        self._generation = 0
+        self._uses = 0
+        self._open_pages = {}
+        self._contexts = {}
+        self._retired = set()
+        self._counters = {
+            'acquired': 0,
+            'released': 0,
+            'peak_open_pages': 0,
+            'contexts_created': 0,
+            'contexts_closed': 0,
+            'wait_seconds': 0.0,
+        }
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Returns a pool configured with BOOKING_MAX_PAGES and BOOKING_CONTEXT_MAX_USES."""
+        return cls(max_pages=settings.getint('BOOKING_MAX_PAGES', 4),
+                   max_context_uses=settings.getint('BOOKING_CONTEXT_MAX_USES', 100))
+
+    @property
+    def open_pages(self):
+        """Number of pages currently taken from the pool."""
+        return sum(self._open_pages.values())
+
+    async def acquire(self, meta):
+        """
+        Waits for a free page and sets up the request meta to open it in the current browser context.
+
+        :param meta: Meta of the request that will use the page. It is updated in place.
+        """
+        if meta.get(CONTEXT_META_KEY) and not meta.get(RELEASED_META_KEY):
+            return  # Already holds a page
+        start = time.monotonic()
+        await self._take_slot()
+        self._counters['wait_seconds'] += time.monotonic() - start
+
+        if self._uses >= self.max_context_uses:
+            self._retire(self._context_name())
+            self._generation += 1
+            self._uses = 0
+        context_name = self._context_name()
+        if self._uses == 0:
+            self._counters['contexts_created'] += 1
+        self._uses += 1
+        self._open_pages[context_name] = self._open_pages.get(context_name, 0) + 1
+        self._counters['acquired'] += 1
+        self._counters['peak_open_pages'] = max(self._counters['peak_open_pages'], self.open_pages)
+
+        meta.update({
+            'playwright': True,
+            'playwright_include_page': True,
+            'playwright_context': context_name,
+            CONTEXT_META_KEY: context_name,
+            RELEASED_META_KEY: False,
+        })
+
+    async def release(self, meta):
+        """
+        Closes the page of a request and gives its slot back to the pool. Releasing twice does nothing,
+        so it is safe to call it from both the callback and the errback.
+
+        :param meta: Meta of the request (or of its response) that took the page
+        """
+        context_name = meta.get(CONTEXT_META_KEY)
+        if context_name is None or meta.get(RELEASED_META_KEY):
+            return
+        meta[RELEASED_META_KEY] = True
+        page = meta.pop('playwright_page', None)
+        try:
+            if page is not None:
+                self._contexts[context_name] = page.context
+                if not page.is_closed():
+                    await page.close()
+        finally:
+            self._open_pages[context_name] -= 1
+            self._counters['released'] += 1
+            self._give_back_slot()
+            if context_name in self._retired and self._open_pages[context_name] == 0:
+                await self._close_context(context_name)
+
+    def resize(self, max_pages):
+        """
+        Changes the maximum number of pages open at once. When it shrinks, open pages are not closed, but new ones
+        wait until enough are released.
+
+        :param max_pages: New maximum, at least 1
+        """
+        self.max_pages = max(1, max_pages)
+        self._wake_waiters()
+
+    async def _take_slot(self):
+        if self._in_use < self.max_pages and not self._waiters:
+            self._in_use += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        await waiter  # The slot is taken for this waiter when it is woken
+
+    def _give_back_slot(self):
+        self._in_use -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        while self._waiters and self._in_use < self.max_pages:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._in_use += 1
+                waiter.set_result(None)
+
+    def stats(self):
+        """
+        :return: Dict with the utilization of the pool: pages open now and at most, pages taken and given
+            back, contexts created and closed, and total time spent waiting for a free page
+        """
+        return {
+            'max_pages': self.max_pages,
+            'open_pages': self.open_pages,
+            'utilization': round(self.open_pages / self.max_pages, 2),
+            'peak_utilization': round(self._counters['peak_open_pages'] / self.max_pages, 2),
+            **self._counters,
+            'wait_seconds': round(self._counters['wait_seconds'], 3),
+        }
+
+    def _context_name(self):
+        return f"{self.context_prefix}-{self._generation}"
+
+    def _retire(self, context_name):
+        if self._open_pages.get(context_name, 0):
+            self._retired.add(context_name)
+        else:
+            # No page left: it is closed right away, if it was ever opened
+            asyncio.ensure_future(self._close_context(context_name))
+
+    async def _close_context(self, context_name):
+        self._retired.discard(context_name)
+        self._open_pages.pop(context_name, None)
+        context = self._contexts.pop(context_name, None)
+        if context is not None:
+            await context.close()
+            self._counters['contexts_closed'] += 1
+
+
+class PagePoolSpiderMiddleware:
+    """
+    Holds back the requests marked with `page_pool` meta that the spider yields until its `page_pool` has
+    a free page, takes it for them and only then schedules them. Requests waiting for a page in the
+    downloader would each take one of the CONCURRENT_REQUESTS slots the plain HTTP requests need.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        # Tasks of the requests waiting for a page
+        self._waiting = set()
+        crawler.signals.connect(self.spider_idle, signal=signals.spider_idle)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    async def process_start(self, start):
+        """Holds back the start requests that need a page (Scrapy 2.13 and later)."""
+        async for request in start:
+            if not self._hold(request):
+                yield request
+
+    def process_start_requests(self, start_requests, spider):
+        """Holds back the start requests that need a page."""
+        for request in start_requests:
+            if not self._hold(request):
+                yield request
+
+    def process_spider_output(self, response, result, spider):
+        """Holds back the requests of a callback that need a page."""
+        for request in result:
+            if not self._hold(request):
+                yield request
+
+    async def process_spider_output_async(self, response, result, spider):
+        """Holds back the requests of an asynchronous callback that need a page."""
+        async for request in result:
+            if not self._hold(request):
+                yield request
+
+    def spider_idle(self, spider):
+        """Keeps the spider open while requests wait for a page."""
+        if self._waiting:
+            raise DontCloseSpider
+
+    def _hold(self, request):
+        """:return: Whether the request was held back until it gets a page"""
+        if not isinstance(request, Request) or not request.meta.get(POOL_META_KEY):
+            return False
+        task = asyncio.ensure_future(self._schedule(request))
+        self._waiting.add(task)
+        task.add_done_callback(self._waiting.discard)
+        return True
+
+    async def _schedule(self, request):
+        page_pool = self.crawler.spider.page_pool
+        await page_pool.acquire(request.meta)
+        try:
+            self.crawler.engine.crawl(request)
+        except RuntimeError:
+            # The spider was closed while the request waited
+            await page_pool.release(request.meta)
+
+
+class PagePoolMiddleware:
+    """
+    Takes a page from the spider's `page_pool` for every request marked with `page_pool` meta right
+    before it is downloaded, and gives it back if the download fails. Requests scheduled by
+    PagePoolSpiderMiddleware already hold their page; retries of failed downloads wait for one here.
+    """
+
+    async def process_request(self, request, spider):
+        """
+        :param request: Scrapy Request object
+        :param spider: Scrapy Spider object, with a `page_pool` attribute
+        """
+        if request.meta.get(POOL_META_KEY):
+            await spider.page_pool.acquire(request.meta)
+
+    async def process_exception(self, request, exception, spider):
+        """
+        Releases the page of a failed download, so retries and errbacks do not keep it.
+
+        :param request: Scrapy Request object
+        :param exception: Exception raised by the download
+        :param spider: Scrapy Spider object, with a `page_pool` attribute
+        """
+        if request.meta.get(POOL_META_KEY):
+            await spider.page_pool.release(request.meta)
@@ -0,0 +1,255 @@
+# Parsers for the property pages of booking.com
+#
+# They work on the HTML as served, without rendering it in a browser, so they can be
+# used both on plain HTTP responses and on the HTML of pages rendered by Playwright.
+import json
+import logging
+import re
+from contextlib import nullcontext
+
+from booking.utils import canonical_property_url
+
+logger = logging.getLogger(__name__)
+
+# Selectors of the fields of a property page
+NAME_SELECTOR = 'h2.pp-header__title::text'
+LATLNG_SELECTOR = 'a#map_trigger_header_pin::attr(data-atlas-latlng)'
+ADDRESS_SELECTOR = 'div.a53cbfa6de.f17adf7576'
+RATING_SELECTOR = 'div#js--hp-gallery-scorecard::attr(data-review-score)'
+JSON_LD_SELECTOR = 'script[type="application/ld+json"]::text'
+
+# Schema.org types of the JSON-LD block describing the property
+PROPERTY_TYPES = {'Hotel', 'LodgingBusiness', 'Hostel', 'Motel', 'Resort', 'BedAndBreakfast', 'Apartment', 'House'}
+# Coordinates embedded in the static map URL or in inline scripts, e.g. center=40.41,-3.70
+LATLNG_PATTERNS = [
+    re.compile(r'[?&;]center=(-?\d+\.\d+),(-?\d+\.\d+)'),
+    re.compile(r'b_map_center_latitude\s*[:=]\s*["\']?(-?\d+\.\d+).*?b_map_center_longitude\s*[:=]\s*["\']?(-?\d+\.\d+)', re.S),
+]
+
+# Currency symbols shown in the prices, by ISO 4217 code. Longer symbols go first so US$ is not read as $
+CURRENCY_SYMBOLS = {'US$': 'USD', 'R$': 'BRL', 'A$': 'AUD', 'C$': 'CAD', '€': 'EUR', '£': 'GBP', '$': 'USD',
+                    '¥': 'JPY', '₹': 'INR', 'zł': 'PLN', 'kr': 'SEK', 'CHF': 'CHF'}
+# Amount of a price, with thousands and decimal separators, e.g. 1.234,56
+PRICE_AMOUNT_PATTERN = re.compile(r'\d[\d.,\s\u00a0\u202f]*')
+CURRENCY_CODE_PATTERN = re.compile(r'\b[A-Z]{3}\b')
+
+# Fields a property must have to be complete
+REQUIRED_FIELDS = ('name', 'latitude', 'longitude')
+
+
+def parse_property(response, metrics=None):
+    """
+    Extracts the name, coordinates, address and rating of a property page.
+
+    The visible markup is read first and the embedded JSON-LD and map data fill in what it lacks,
+    since the static HTML does not always include every element the rendered page shows.
+
+    :param response: Scrapy response (or any object with a `css` method) with the HTML of the page
+    :param metrics: CrawlMetrics recording the time of the extraction of every field, and the fields that failed
+        or were missing, or None
+    :return: Dict with the name, latitude, longitude, address and rating. Missing values, and values whose
+        extraction failed, are None.
+    """
+    json_ld = _extract(metrics, 'json_ld', parse_json_ld, response) or {}
+    latitude, longitude = _extract(metrics, 'coordinates', _parse_coordinates, response, json_ld) or (None, None)
+    return {
+        'name': _extract(metrics, 'name', _parse_name, response, json_ld),
+        'latitude': latitude,
+        'longitude': longitude,
+        'address': _extract(metrics, 'address', _parse_address, response, json_ld),
+        'rating': _extract(metrics, 'rating', _parse_rating, response, json_ld),
+    }
+
+
+def _extract(metrics, field, parser, response, *args):
+    """Returns parser(response, *args), or None if it fails, timing it and counting failures and misses as field."""
+    timer = metrics.timer(f"extract/{field}") if metrics is not None else nullcontext()
+    with timer:
+        try:
+            value = parser(response, *args)
+        except Exception as e:
+            logger.debug(f"Could not extract the {field} of {getattr(response, 'url', 'the page')}: {e}")
+            value = None
+            if metrics is not None:
+                metrics.inc(f"extraction_failures/{field}")
+    if metrics is not None and value in (None, (None, None)):
+        metrics.inc(f"extraction_missing/{field}")
+    return value
+
+
+def _parse_name(response, json_ld):
+    return _clean(response.css(NAME_SELECTOR).get()) or _clean(json_ld.get('name'))
+
+
+def _parse_coordinates(response, json_ld):
+    latitude, longitude = parse_coordinates(response.css(LATLNG_SELECTOR).get())
+    if latitude is None:
+        latitude, longitude = _find_coordinates(json_ld.get('hasMap') or response.text)
+    return latitude, longitude
+
+
+def _parse_address(response, json_ld):
+    # The address is the first node of its element, followed by other elements
+    address = _clean(response.css(ADDRESS_SELECTOR).xpath('string(./node()[1])').get())
+    return address or _clean(_json_ld_address(json_ld))
+
+
+def _parse_rating(response, json_ld):
+    return _clean(response.css(RATING_SELECTOR).get()) or _clean(_json_ld_rating(json_ld))
+
+
+def is_complete(fields):
+    """
+    :param fields: Dict returned by `parse_property`
+    :return: True if none of the REQUIRED_FIELDS is missing
+    """
+    return all(fields.get(field) not in (None, '') for field in REQUIRED_FIELDS)
+
+
+def parse_json_ld(response):
+    """
+    :param response: Scrapy response with the HTML of the page
+    :return: The JSON-LD object describing the property, or an empty dict if there is none
+    """
+    for script in response.css(JSON_LD_SELECTOR).getall():
+        try:
+            data = json.loads(script)
+        except ValueError:
+            continue
+        for entry in data if isinstance(data, list) else data.get('@graph', [data]):
+            if isinstance(entry, dict) and _types(entry) & PROPERTY_TYPES:
+                return entry
+    return {}
+
+
+def parse_coordinates(latlong):
+    """
+    :param latlong: Coordinates as "latitude,longitude"
+    :return: Tuple (latitude, longitude) as floats, or (None, None) if they are missing or invalid
+    """
+    if latlong:
+        try:
+            latitude, longitude = latlong.split(',')
+            return float(latitude), float(longitude)
+        except ValueError:
+            pass
+    return None, None
+
+
+def parse_search_payload(payload):
+    """
+    Extracts the properties of a search results payload, as returned by the GraphQL endpoint
+    the search page calls when loading more results.
+
+    :param payload: Decoded JSON of the response
+    :return: List of dicts with the fields of PropertyItem. Properties without a page name are skipped.
+    """
+    properties = []
+    for result in _search_results(payload):
+        data = result.get('basicPropertyData') or {}
+        location = data.get('location') or {}
+        page_name = data.get('pageName')
+        country_code = location.get('countryCode')
+        if not page_name or not country_code:
+            continue
+        address = ', '.join(part for part in (location.get('address'), location.get('city')) if part)
+        reviews = data.get('reviews') or {}
+        properties.append({
+            'name': _clean((result.get('displayName') or {}).get('text')),
+            'latitude': location.get('latitude'),
+            'longitude': location.get('longitude'),
+            'address': address or None,
+            'rating': str(reviews['totalScore']) if reviews.get('totalScore') is not None else None,
+            'price': _search_result_price(result),
+            'url': canonical_property_url(f"https://www.booking.com/hotel/{country_code}/{page_name}.html"),
+        })
+    return properties
+
+
+def _search_results(node):
+    """Yields the objects of the payload describing a property, wherever they are nested."""
+    if isinstance(node, dict):
+        if 'basicPropertyData' in node:
+            yield node
+            return
+        for value in node.values():
+            yield from _search_results(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _search_results(value)
+
+
+def _search_result_price(result):
+    price = ((result.get('priceDisplayInfoIrene') or {}).get('displayPrice') or {}).get('amountPerStay') or {}
+    return _clean(price.get('amount')) or 'N/A'
+
+
+def parse_price(price):
+    """
+    Splits a price as shown by booking.com, e.g. "€ 1.234", "1.234,50 €" or "US$120", into amount and currency.
+
+    :param price: Price text
+    :return: Tuple (amount, currency) with the amount as float and the currency as ISO 4217 code. Each is None
+        if it is missing or cannot be read.
+    """
+    if not isinstance(price, str):
+        return (float(price), None) if isinstance(price, (int, float)) else (None, None)
+    match = PRICE_AMOUNT_PATTERN.search(price)
+    amount = _parse_amount(match.group()) if match else None
+    currency = next((code for symbol, code in CURRENCY_SYMBOLS.items() if symbol in price), None)
+    if currency is None:
+        code = CURRENCY_CODE_PATTERN.search(price)
+        currency = code.group() if code else None
+    return amount, currency
+
+
+def _parse_amount(text):
+    digits = re.sub(r'[\s\u00a0\u202f]', '', text).rstrip('.,')
+    last_dot, last_comma = digits.rfind('.'), digits.rfind(',')
+    if last_dot >= 0 and last_comma >= 0:
+        # Both separators: the last one is the decimal separator
+        decimal = '.' if last_dot > last_comma else ','
+    elif max(last_dot, last_comma) >= 0:
+        separator = '.' if last_dot >= 0 else ','
+        # A single separator followed by three digits groups thousands, e.g. 1.234 or 1,234
+        decimal = None if digits.count(separator) > 1 or len(digits) - digits.rfind(separator) == 4 else separator
+    else:
+        decimal = None
+    thousands = {'.', ','} - {decimal}
+    digits = ''.join(char for char in digits if char not in thousands)
+    try:
+        return float(digits.replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def _find_coordinates(text):
+    for pattern in LATLNG_PATTERNS:
+        match = pattern.search(text or '')
+        if match:
+            return float(match.group(1)), float(match.group(2))
+    return None, None
+
+
+def _types(entry):
+    types = entry.get('@type', [])
+    return set(types) if isinstance(types, list) else {types}
+
+
+def _json_ld_address(json_ld):
+    address = json_ld.get('address')
+    if isinstance(address, dict):
+        parts = [address.get(key) for key in ('streetAddress', 'postalCode', 'addressLocality', 'addressCountry')]
+        return ', '.join(str(part) for part in parts if part and isinstance(part, (str, int)))
+    return address
+
+
+def _json_ld_rating(json_ld):
+    rating = json_ld.get('aggregateRating')
+    if isinstance(rating, dict) and rating.get('ratingValue') is not None:
+        return str(rating['ratingValue'])
+    return None
+
+
+def _clean(value):
+    return value.strip() if isinstance(value, str) and value.strip() else None
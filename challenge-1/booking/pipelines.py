@@ -0,0 +1,262 @@
+# Define your item pipelines here
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/item-pipeline.html
+import csv
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem, NotConfigured
+
+from booking.items import to_float
+from booking.parsers import parse_price
+from booking.utils import canonical_property_url
+
+logger = logging.getLogger(__name__)
+
+# Exported fields, in order, and their types
+FIELDS = ['name', 'latitude', 'longitude', 'address', 'price', 'price_amount', 'price_currency', 'rating', 'url']
+FLOAT_FIELDS = {'latitude', 'longitude', 'price_amount', 'rating'}
+
+
+class PropertyNormalizationPipeline:
+    """
+    Validates and normalizes the properties: strips the texts, converts coordinates and rating to float, splits
+    the price into amount and currency and makes the URL canonical. Properties without name or URL, and properties
+    already exported with the same URL, are dropped. Coordinates out of range are left empty, and properties without
+    coordinates are kept unless BOOKING_DROP_WITHOUT_COORDINATES is set.
+    """
+
+    def __init__(self, drop_without_coordinates=False):
+        """
+        :param drop_without_coordinates: Whether to drop the properties without valid coordinates
+        """
+        self.drop_without_coordinates = drop_without_coordinates
+        # 64-bit digests of the URLs exported, as ints: 36 bytes each plus its slot in the set, instead of
+        # the whole URL
+        self.seen = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Returns an instance of PropertyNormalizationPipeline configured with BOOKING_DROP_WITHOUT_COORDINATES."""
+        return cls(drop_without_coordinates=crawler.settings.getbool('BOOKING_DROP_WITHOUT_COORDINATES'))
+
+    def process_item(self, item, spider):
+        """
+        :param item: PropertyRecord or PropertyItem
+        :param spider: Scrapy Spider object
+        """
+        adapter = ItemAdapter(item)
+        for field in ('name', 'address', 'price', 'url'):
+            value = adapter.get(field)
+            adapter[field] = ' '.join(value.split()) if isinstance(value, str) and value.strip() else None
+        for field in ('latitude', 'longitude', 'rating'):
+            adapter[field] = to_float(adapter.get(field))
+        adapter['price_amount'], adapter['price_currency'] = parse_price(adapter.get('price'))
+
+        if not adapter['name'] or not adapter['url']:
+            raise DropItem(f"Property without name or URL: {adapter.get('url')}")
+        latitude, longitude = adapter['latitude'], adapter['longitude']
+        if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            if self.drop_without_coordinates:
+                raise DropItem(f"Property without valid coordinates: {adapter['url']}")
+            adapter['latitude'] = adapter['longitude'] = None
+
+        adapter['url'] = canonical_property_url(adapter['url'])
+        digest = int.from_bytes(hashlib.blake2b(adapter['url'].encode('utf-8'), digest_size=8).digest(), 'little')
+        if digest in self.seen:
+            raise DropItem(f"Duplicate property: {adapter['url']}")
+        self.seen.add(digest)
+        return item
+
+
+class BatchExportPipeline:
+    """
+    Buffers the properties and writes them in batches of BOOKING_EXPORT_BATCH_SIZE to every sink of
+    BOOKING_EXPORT_SINKS, a dict from format (csv, jsonl, parquet or sqlite) to output path.
+
+    Batches are written by a background thread, one at a time and in order, so the crawl does not wait for disk.
+    Batches that fail to be written are logged and counted in the export/failed_batches stat.
+    """
+
+    def __init__(self, sinks, batch_size=500, stats=None):
+        """
+        :param sinks: List of sinks to write to
+        :param batch_size: Properties per batch
+        :param stats: Scrapy stats collector, to count the failed batches
+        """
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.stats = stats
+        self.batch = []
+        self._executor = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Returns an instance of BatchExportPipeline with the sinks of BOOKING_EXPORT_SINKS."""
+        settings = crawler.settings
+        sinks = []
+        for sink_format, path in settings.getdict('BOOKING_EXPORT_SINKS').items():
+            if sink_format not in SINKS:
+                raise ValueError(f"Unknown export format: {sink_format}. Expected one of {list(SINKS)}")
+            sinks.append(SINKS[sink_format](path))
+        if not sinks:
+            raise NotConfigured
+        return cls(sinks, batch_size=settings.getint('BOOKING_EXPORT_BATCH_SIZE', 500), stats=crawler.stats)
+
+    def open_spider(self, spider):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='export')
+        for sink in self.sinks:
+            sink.open()
+
+    def process_item(self, item, spider):
+        self.batch.append({field: ItemAdapter(item).get(field) for field in FIELDS})
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+        return item
+
+    def flush(self):
+        """Hands the buffered properties to the writer thread."""
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        self._executor.submit(self._write, batch).add_done_callback(self._batch_done)
+
+    def _write(self, batch):
+        for sink in self.sinks:
+            sink.write(batch)
+
+    def _batch_done(self, future):
+        """Logs and counts a batch that failed to be written. Called from the writer thread."""
+        error = future.exception()
+        if error is None:
+            return
+        logger.error(f"Could not export a batch of properties: {error!r}", exc_info=error)
+        if self.stats is not None:
+            self.stats.inc_value('export/failed_batches')
+
+    def close_spider(self, spider):
+        """
+        Writes the last batch, waits for the writer thread and closes the sinks. It is synchronous, since
+        Scrapy 2.12 does not await item pipeline coroutines here.
+        """
+        self.flush()
+        self._executor.shutdown(wait=True)
+        for sink in self.sinks:
+            sink.close()
+
+
+class CsvSink:
+    """
+    Appends the properties to a CSV file, with a header if the file is new. A file left by a run that exported
+    other columns is renamed with the time it was rotated, e.g. output.1700000000.csv, and a new one is started.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._writer = None
+
+    def open(self):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        if not new_file and self._header() != FIELDS:
+            root, extension = os.path.splitext(self.path)
+            rotated = f"{root}.{int(time.time())}{extension}"
+            os.replace(self.path, rotated)
+            logger.warning(f"{self.path} has other columns than {FIELDS}, moved it to {rotated}")
+            new_file = True
+        self._file = open(self.path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=FIELDS)
+        if new_file:
+            self._writer.writeheader()
+
+    def _header(self):
+        """:return: Columns of the header of the existing file"""
+        with open(self.path, newline='', encoding='utf-8') as f:
+            return next(csv.reader(f), [])
+
+    def write(self, batch):
+        self._writer.writerows(batch)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class JsonLinesSink(CsvSink):
+    """Appends the properties to a JSON Lines file."""
+
+    def open(self):
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def write(self, batch):
+        self._file.write(''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in batch))
+        self._file.flush()
+
+
+class ParquetSink:
+    """
+    Writes the properties to a Parquet file, a row group per batch. Requires pyarrow. Unlike the other sinks, the
+    file is replaced on every run, since Parquet files cannot be appended to.
+    """
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet export requires pyarrow. Install it with: pip install pyarrow") from e
+        self.path = path
+        self._pa, self._pq = pa, pq
+        self.schema = pa.schema([(field, pa.float64() if field in FLOAT_FIELDS else pa.string()) for field in FIELDS])
+        self._writer = None
+
+    def open(self):
+        self._writer = self._pq.ParquetWriter(self.path, self.schema)
+
+    def write(self, batch):
+        self._writer.write_table(self._pa.Table.from_pylist(batch, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+
+class SQLiteSink:
+    """Upserts the properties into the `properties` table of a SQLite database, keyed by URL."""
+
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+
+    def open(self):
+        # Used from the writer thread
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        columns = ', '.join(f"{field} {'REAL' if field in FLOAT_FIELDS else 'TEXT'}" for field in FIELDS if field != 'url')
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS properties ({columns}, url TEXT PRIMARY KEY)")
+
+    def write(self, batch):
+        columns = [field for field in FIELDS if field != 'url'] + ['url']
+        updates = ', '.join(f"{column} = excluded.{column}" for column in columns[:-1])
+        with self._db:
+            self._db.executemany(
+                f"INSERT INTO properties ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT(url) DO UPDATE SET {updates}",
+                [[row[column] for column in columns] for row in batch])
+
+    def close(self):
+        self._db.close()
+
+
+SINKS = {
+    'csv': CsvSink,
+    'jsonl': JsonLinesSink,
+    'parquet': ParquetSink,
+    'sqlite': SQLiteSink,
+}
+
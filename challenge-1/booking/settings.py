@@ -27,6 +27,65 @@ PLAYWRIGHT_BROWSER_TYPE = 'chromium'
 
 PLAYWRIGHT_LAUNCH_OPTIONS = {"headless": False}
 
+# Lean mode: the browser runs headless and images, media, fonts and trackers are aborted (booking/network.py)
+BOOKING_LEAN_MODE = False
+# Read the properties straight from the search results responses received while paginating, so their hotel
+# pages are only requested when the response lacks some field
+BOOKING_INTERCEPT_RESULTS = False
+
+##################### PAGE POOL SETTINGS ######################
+# Playwright pages open at once. Hotel pages are only rendered when the plain HTTP fetch lacks their data
+BOOKING_MAX_PAGES = 4
+# Pages opened in a browser context before it is replaced by a fresh one, which keeps Chromium memory flat
+BOOKING_CONTEXT_MAX_USES = 100
+
+PLAYWRIGHT_MAX_PAGES_PER_CONTEXT = BOOKING_MAX_PAGES
+
+##################### CRAWL STATE SETTINGS ######################
+# SQLite file with the properties found and scraped and the shards finished, to resume interrupted crawls.
+# Defaults to JOBDIR/booking_state.sqlite when JOBDIR is set; without any of them nothing is kept between runs
+BOOKING_STATE_FILE = None
+# Expected number of properties, to size the Bloom filter in front of the state file
+BOOKING_STATE_CAPACITY = 1_000_000
+
+##################### CONCURRENCY SETTINGS ######################
+CONCURRENT_REQUESTS = 32
+
+# Hotel pages are fetched over plain HTTP in their own download slot, with its own concurrency
+DOWNLOAD_SLOTS = {
+    "hotel-pages": {"concurrency": 16, "delay": 0},
+}
+
+##################### HTTP CACHE SETTINGS ######################
+# Cache of the plain HTTP and rendered responses, compressed in SQLite (booking/http_cache.py). Enable it with
+# -s HTTPCACHE_ENABLED=True, and add -s HTTPCACHE_IGNORE_MISSING=True to replay a crawl offline from the cache
+HTTPCACHE_ENABLED = False
+HTTPCACHE_STORAGE = 'booking.http_cache.SQLiteCacheStorage'
+HTTPCACHE_EXPIRATION_SECS = 24 * 60 * 60  # Time to live of the cached responses
+HTTPCACHE_IGNORE_HTTP_CODES = [403, 429, 500, 502, 503, 504]  # Blocks and server errors are not cached
+BOOKING_HTTPCACHE_MAX_MB = 1024  # The least recently used responses are evicted over this size
+
+##################### ADAPTIVE CONCURRENCY SETTINGS ######################
+# The concurrency of every download slot and the pages of the pool follow the latency, errors and blocks of their
+# responses (AIMD), and blocked requests are retried with exponential backoff (booking.middlewares)
+BOOKING_ADAPTIVE_ENABLED = True
+BOOKING_ADAPTIVE_MIN_CONCURRENCY = 1
+BOOKING_ADAPTIVE_MAX_CONCURRENCY = 32
+BOOKING_ADAPTIVE_TARGET_LATENCY = 5.0  # Seconds. Rendered pages take a few seconds, plain HTTP ones much less
+BOOKING_ADAPTIVE_DECREASE_FACTOR = 0.5
+BOOKING_BLOCK_STATUS = [403, 429, 503]
+# Lower case markers only found in captcha and challenge interstitials. Client scripts of bot protections, such as
+# the AwsWafIntegration one booking.com serves on every page, are not markers
+BOOKING_BLOCK_MARKERS = ['g-recaptcha', 'px-captcha', 'gokuprops', 'challenge-container', 'challenge-form']
+BOOKING_BLOCK_MAX_RETRIES = 5
+BOOKING_BACKOFF_BASE = 2.0  # Seconds
+BOOKING_BACKOFF_MAX = 60.0
+
+# Other download errors are retried right away by RetryMiddleware
+RETRY_TIMES = 3
+RETRY_HTTP_CODES = [500, 502, 504, 522, 524, 408]
+DOWNLOAD_TIMEOUT = 60
+
 ##################### DOWNLOAD HANDLER SETTINGS ######################
 DOWNLOAD_HANDLERS = {
     "http": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
@@ -34,14 +93,38 @@ DOWNLOAD_HANDLERS = {
 }
 
 ####################### MIDDLEWARE SETTINGS ######################
+SPIDER_MIDDLEWARES = {
+    'booking.page_pool.PagePoolSpiderMiddleware': 50,  # Schedules pooled requests once they have a page
+}
 DOWNLOADER_MIDDLEWARES = {
     'booking.middlewares.RotateUserAgentMiddleware': 543,  # Custom middleware with priority 543
+    'booking.middlewares.AdaptiveConcurrencyMiddleware': 560,  # Sees responses and errors before RetryMiddleware
+    'booking.page_pool.PagePoolMiddleware': 950,  # Takes pooled Playwright pages right before downloading
 }
 
+##################### METRICS SETTINGS ######################
+# Timings of every stage and counters of the crawl are copied to the Scrapy stats every BOOKING_METRICS_INTERVAL
+# seconds and, if BOOKING_METRICS_FILE is set, dumped to it as JSON or, for a .prom file, in Prometheus text format
+EXTENSIONS = {
+    'booking.metrics.MetricsExtension': 500,
+}
+BOOKING_METRICS_FILE = None
+BOOKING_METRICS_INTERVAL = 30
+
 ##################### ITEM PIPELINE SETTINGS ######################
 ITEM_PIPELINES = {
     #'booking.pipelines.HtmlWriterPipeline': 1,  # 1 ensures it runs first MIDDLEWARE FOR DEBUGGING PURPOSES
+    'booking.pipelines.PropertyNormalizationPipeline': 100,  # Validates, types and deduplicates the properties
+    'booking.pipelines.BatchExportPipeline': 800,  # Writes them in batches from a background thread
+}
+
+# Outputs of the properties, as format (csv, jsonl, parquet or sqlite) to path. Parquet requires pyarrow
+BOOKING_EXPORT_SINKS = {
+    'csv': 'booking_properties_output.csv',
 }
+BOOKING_EXPORT_BATCH_SIZE = 500
+# Drop the properties without valid coordinates instead of exporting them with empty latitude and longitude
+BOOKING_DROP_WITHOUT_COORDINATES = False
 
 ROTATE_USER_AGENTS = [
         # Google Chrome (Windows)
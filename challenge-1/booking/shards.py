@@ -0,0 +1,154 @@
+# Search shards of the booking spiders
+#
+# A shard is one search: a destination, a date range, an occupancy and optionally a filter of the results.
+# Booking stops paginating a search after about a thousand results, so large crawls are split in many shards
+# that are crawled at the same time, each from its own Playwright page and with its own `max_results`.
+from datetime import datetime, timedelta
+from itertools import product
+from urllib.parse import urlencode
+
+SEARCH_URL = "https://www.booking.com/searchresults.es.html"
+
+# Separator of the values of list arguments, e.g. -a keywords="Madrid;Barcelona"
+LIST_SEPARATOR = ';'
+# Prefix of list arguments read from a file, one value per line, e.g. -a keywords=@keywords.txt
+FILE_PREFIX = '@'
+
+# Destinations split in smaller ones when sharding by region
+SUB_REGIONS = {
+    'Spain': [
+        'A Coruña', 'Álava', 'Albacete', 'Alicante', 'Almería', 'Asturias', 'Ávila', 'Badajoz', 'Baleares',
+        'Barcelona', 'Burgos', 'Cáceres', 'Cádiz', 'Cantabria', 'Castellón', 'Ceuta', 'Ciudad Real', 'Córdoba',
+        'Cuenca', 'Girona', 'Granada', 'Guadalajara', 'Guipúzcoa', 'Huelva', 'Huesca', 'Jaén', 'La Rioja',
+        'Las Palmas', 'León', 'Lleida', 'Lugo', 'Madrid', 'Málaga', 'Melilla', 'Murcia', 'Navarra', 'Ourense',
+        'Palencia', 'Pontevedra', 'Salamanca', 'Santa Cruz de Tenerife', 'Segovia', 'Sevilla', 'Soria',
+        'Tarragona', 'Teruel', 'Toledo', 'Valencia', 'Valladolid', 'Vizcaya', 'Zamora', 'Zaragoza',
+    ],
+}
+
+# Filters slicing the results of a search by star rating (`nflt` parameter of the search URL)
+STAR_FILTERS = ['class=0', 'class=1', 'class=2', 'class=3', 'class=4', 'class=5']
+
+
+class Shard:
+    """One search of a sharded crawl, the number of properties found in it and whether it was finished."""
+
+    def __init__(self, keyword, checkin, checkout, group_adults=1, group_children=0, search_filter=None,
+                 max_results=200):
+        """
+        :param keyword: Destination to search for
+        :param checkin: Check-in date as YYYY-MM-DD
+        :param checkout: Check-out date as YYYY-MM-DD
+        :param group_adults: Number of adults
+        :param group_children: Number of children
+        :param search_filter: Value of the `nflt` parameter filtering the results, e.g. "class=4", or None
+        :param max_results: Maximum number of properties requested from this shard
+        """
+        self.keyword = keyword
+        self.checkin = checkin
+        self.checkout = checkout
+        self.group_adults = group_adults
+        self.group_children = group_children
+        self.search_filter = search_filter
+        self.max_results = max_results
+        self.requested = 0
+        self.finished = False
+
+    @property
+    def name(self):
+        """Readable identifier of the shard, used in logs and request meta."""
+        parts = [self.keyword, f"{self.checkin}/{self.checkout}", f"{self.group_adults}:{self.group_children}"]
+        if self.search_filter:
+            parts.append(self.search_filter)
+        return '|'.join(parts)
+
+    @property
+    def query_params(self):
+        params = {
+            'ss': self.keyword,
+            'checkin': self.checkin,
+            'checkout': self.checkout,
+            'group_adults': self.group_adults,
+            'group_children': self.group_children,
+        }
+        if self.search_filter:
+            params['nflt'] = self.search_filter
+        return params
+
+    @property
+    def url(self):
+        return f"{SEARCH_URL}?{urlencode(self.query_params)}"
+
+    @property
+    def is_full(self):
+        """True once max_results properties were requested from the shard."""
+        return self.requested >= self.max_results
+
+
+def build_shards(keywords, date_ranges, occupancies, search_filters=None, max_results=200, split_regions=False):
+    """
+    Returns a shard for every combination of keyword, date range, occupancy and filter.
+
+    :param keywords: Destinations to search for
+    :param date_ranges: Tuples (checkin, checkout) as YYYY-MM-DD
+    :param occupancies: Tuples (group_adults, group_children)
+    :param search_filters: Filters slicing the results of every search, or None not to slice them
+    :param max_results: Maximum number of properties requested from each shard
+    :param split_regions: Whether to replace the keywords found in SUB_REGIONS by their sub-regions
+    :return: List of Shard, without repeated searches
+    """
+    if split_regions:
+        keywords = [region for keyword in keywords for region in SUB_REGIONS.get(keyword, [keyword])]
+    shards = {}
+    for keyword, (checkin, checkout), (adults, children), search_filter in product(
+            keywords, date_ranges, occupancies, search_filters or [None]):
+        shard = Shard(keyword, checkin, checkout, adults, children, search_filter, max_results)
+        shards.setdefault(shard.name, shard)
+    return list(shards.values())
+
+
+def parse_list(value):
+    """
+    :param value: List, values separated by LIST_SEPARATOR, or FILE_PREFIX followed by the path of a file with
+        a value per line (blank lines and lines starting with # are skipped)
+    :return: List of the values, stripped
+    """
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if value.startswith(FILE_PREFIX):
+        with open(value[len(FILE_PREFIX):], encoding='utf-8') as f:
+            lines = [line.strip() for line in f]
+        return [line for line in lines if line and not line.startswith('#')]
+    return [part.strip() for part in value.split(LIST_SEPARATOR) if part.strip()]
+
+
+def parse_date(value):
+    """
+    :param value: datetime, or date as an ISO 8601 string, e.g. "2024-01-15" or "2024-01-15T14:30"
+    :return: The date as YYYY-MM-DD
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.strftime("%Y-%m-%d")
+
+
+def parse_date_range(value):
+    """
+    :param value: Date range as "checkin/checkout", or "checkin+nights", e.g. "2024-01-15/2024-01-17" or "2024-01-15+2"
+    :return: Tuple (checkin, checkout) as YYYY-MM-DD
+    """
+    if '+' in value:
+        checkin, nights = value.split('+')
+        checkin = datetime.fromisoformat(checkin.strip())
+        return parse_date(checkin), parse_date(checkin + timedelta(days=int(nights)))
+    checkin, checkout = value.split('/')
+    return parse_date(checkin.strip()), parse_date(checkout.strip())
+
+
+def parse_occupancy(value):
+    """
+    :param value: Occupancy as "adults:children", e.g. "2:1"
+    :return: Tuple (group_adults, group_children)
+    """
+    adults, _, children = value.partition(':')
+    return int(adults), int(children or 0)
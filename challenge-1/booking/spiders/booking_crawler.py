@@ -1,8 +1,39 @@
 from datetime import datetime, timedelta
 import logging
-from urllib.parse import urlencode
+import time
 import scrapy
-from booking.items import PropertyItem
+from booking.crawl_state import SCRAPED, CrawlState
+from booking.http_cache import REPLAY_ONLY_META_KEY
+from booking.items import PropertyRecord
+from booking.metrics import CrawlMetrics
+from booking.network import SearchResultsListener, should_abort_request
+from booking.page_pool import POOL_META_KEY, PagePool
+from booking.parsers import is_complete, parse_coordinates, parse_property
+from booking.shards import (STAR_FILTERS, build_shards, parse_date, parse_date_range, parse_list,
+                            parse_occupancy)
+from booking.utils import canonical_property_url
+
+# Download slot of the hotel pages, whose concurrency is set in DOWNLOAD_SLOTS
+HOTEL_PAGES_SLOT = "hotel-pages"
+# Meta key with the name of the shard of a search results request
+SHARD_META_KEY = "shard"
+# Meta key with the canonical URL of the property of a hotel page request
+CANONICAL_URL_META_KEY = "canonical_url"
+# Meta keys set by the spider on hotel page requests, the only ones carried over to their Playwright fallback
+HOTEL_META_KEYS = ('price', 'download_slot', SHARD_META_KEY, CANONICAL_URL_META_KEY)
+
+# Selectors of the search results page
+PROPERTY_CARD_SELECTOR = '[data-testid="property-card"]'
+PROPERTY_LINK_SELECTOR = '[data-testid="property-card-desktop-single-image"]'
+PRICE_SELECTOR = 'span[data-testid="price-and-discounted-price"]'
+LOAD_MORE_SELECTOR = 'div.c82435a4b8 button.a83ed08757.c0e0affd09 span.e4adce92df, button:has-text("Load more results")'
+# Milliseconds to wait for the "Load more results" button and for the results it loads
+LOAD_MORE_TIMEOUT = 5000
+RESULTS_TIMEOUT = 15000
+# Seconds to wait for an intercepted search results response once its cards are rendered
+INTERCEPT_TIMEOUT = 2
+# True in the page once it shows more property cards than the given number
+MORE_CARDS_FUNCTION = "([selector, count]) => document.querySelectorAll(selector).length > count"
 
 class BookingPropertiesCrawler(scrapy.Spider):
     """
@@ -15,166 +46,352 @@ class BookingPropertiesCrawler(scrapy.Spider):
         'LOG_LEVEL': "INFO",  # Set the log level to INFO for better readability
         'LOG_FILE': 'booking_properties.log',
         'LOG_FILE_APPEND': True,
-        
-        'FEEDS': {
-            'booking_properties_output.csv': {
-                'format': 'csv',
-                'fields': ['name', 'latitude', 'longitude', 'address', 'price', 'rating', 'url']
-            }
-        }
     }
     
     def __init__(self, search_keyword="Spain", checkin=datetime.now(), checkout=datetime.now() + timedelta(days=1),
-                 group_adults=1, group_children=0, max_results=200, **kwargs):
+                 group_adults=1, group_children=0, max_results=200, keywords=None, date_ranges=None, occupancies=None,
+                 search_filters=None, split_regions=False, shard_max_results=None, **kwargs):
         self.search_keyword = search_keyword
-        self.checkin = checkin.strftime("%Y-%m-%d")
-        self.checkout = checkout.strftime("%Y-%m-%d")
-        self.group_adults = group_adults
-        self.group_children = group_children
-        self.max_results = max_results
-        self.query_params = {
-            'ss': self.search_keyword,
-            'checkin': self.checkin,
-            'checkout': self.checkout,
-            'group_adults': self.group_adults,
-            'group_children': self.group_children
-        }
-        self.start_urls = [f"https://www.booking.com/searchresults.es.html?{urlencode(self.query_params)}"]
-        self.processed_items = set()
-        self.processed_urls = set()
+        self.checkin = parse_date(checkin)
+        self.checkout = parse_date(checkout)
+        self.group_adults = int(group_adults)
+        self.group_children = int(group_children)
+        self.max_results = int(max_results)
+
+        # Every combination of keyword, date range, occupancy and filter is a shard, crawled from its own page
+        if search_filters == 'stars':
+            search_filters = STAR_FILTERS
+        self.shards = {shard.name: shard for shard in build_shards(
+            keywords=parse_list(keywords) if keywords else [self.search_keyword],
+            date_ranges=[parse_date_range(value) for value in parse_list(date_ranges)] if date_ranges
+            else [(self.checkin, self.checkout)],
+            occupancies=[parse_occupancy(value) for value in parse_list(occupancies)] if occupancies
+            else [(self.group_adults, self.group_children)],
+            search_filters=parse_list(search_filters) if search_filters else None,
+            max_results=int(shard_max_results) if shard_max_results else self.max_results,
+            split_regions=str(split_regions).lower() in ('true', '1', 'yes'),
+        )}
+        self.query_params = next(iter(self.shards.values())).query_params
+        self.start_urls = [shard.url for shard in self.shards.values()]
 
         super().__init__(**kwargs)
 
+    @classmethod
+    def update_settings(cls, settings):
+        """In lean mode, runs the browser headless and aborts the requests the crawler does not need."""
+        super().update_settings(settings)
+        if settings.getbool('BOOKING_LEAN_MODE'):
+            settings.set('PLAYWRIGHT_ABORT_REQUEST', should_abort_request, priority='spider')
+            settings.set('PLAYWRIGHT_LAUNCH_OPTIONS', {**settings.getdict('PLAYWRIGHT_LAUNCH_OPTIONS'), 'headless': True},
+                         priority='spider')
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        """Creates the spider with the pool of Playwright pages its requests take their pages from and the state
+        of the crawl."""
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.page_pool = PagePool.from_settings(crawler.settings)
+        # Canonical URLs of the properties found and scraped, shared by all the shards and kept on disk
+        spider.crawl_state = CrawlState.from_settings(crawler.settings)
+        spider.restore_shards()
+        # Stage timings and counters, published by booking.metrics.MetricsExtension
+        spider.metrics = CrawlMetrics()
+        spider.metrics.gauge('open_pages', lambda: spider.page_pool.open_pages)
+        spider.metrics.gauge('max_pages', lambda: spider.page_pool.max_pages)
+        spider.metrics.gauge('properties_scraped', lambda: spider.crawl_state.scraped)
+        return spider
+
+    def restore_shards(self):
+        """Restores the properties found in every shard, and which are finished, from a previous run."""
+        finished = self.crawl_state.finished_shards()
+        for name, requested in self.crawl_state.shard_counts().items():
+            if name in self.shards:
+                self.shards[name].requested = requested
+        for name in finished & self.shards.keys():
+            self.shards[name].finished = True
+
     def start_requests(self):
-        for url in self.start_urls:
+        # Hotel pages requested by an interrupted run go first
+        for url, request_url, shard_name, price in self.crawl_state.pending():
+            self.crawler.stats.inc_value("booking/hotel_pages/resumed")
+            yield self.hotel_request(request_url, url, shard_name, price)
+
+        shards = [shard for shard in self.shards.values() if not shard.finished]
+        self.log(f"Crawling {len(shards)} search shards ({len(self.shards) - len(shards)} already finished, "
+                 f"{self.crawl_state.scraped} properties already scraped)", logging.INFO)
+        self.crawler.stats.set_value("booking/shards/total", len(self.shards))
+        for shard in shards:
             yield scrapy.Request(
-                url=url,
+                url=shard.url,
                 callback=self.parse_search_results,
-                meta={
-                    'playwright': True,
-                    'playwright_include_page': True,
-                },
+                errback=self.release_page,
+                meta={POOL_META_KEY: True, SHARD_META_KEY: shard.name, REPLAY_ONLY_META_KEY: True},
             )
 
+    def hotel_request(self, url, canonical_url, shard_name, price):
+        """
+        Returns the request of a hotel page. It is fetched over plain HTTP and only rendered if needed.
+
+        :param url: URL of the hotel page
+        :param canonical_url: Canonical URL of the property, under which it is recorded as scraped
+        :param shard_name: Name of the shard the property was found in
+        :param price: Price shown in the search results
+        """
+        return scrapy.Request(
+            url=url,
+            callback=self.parse_hotel_page,
+            meta={
+                'price': price,
+                'download_slot': HOTEL_PAGES_SLOT,
+                SHARD_META_KEY: shard_name,
+                CANONICAL_URL_META_KEY: canonical_url,
+            },
+        )
+
+    async def release_page(self, failure):
+        """Errback of the requests with a pooled page: gives the page back to the pool."""
+        self.log(f"Request failed: {failure.value}. With url: {failure.request.url}", logging.ERROR)
+        await self.page_pool.release(failure.request.meta)
+
     async def parse_search_results(self, response):
+        shard = self.shards[response.meta[SHARD_META_KEY]]
+        self.metrics.observe('search_page_load', response.meta.get('download_latency', 0.0))
+        try:
+            async for request in self._parse_search_results(response, shard):
+                yield request
+        finally:
+            await self.page_pool.release(response.meta)
+            if shard.finished:
+                self.crawl_state.finish_shard(shard.name)
+                self.crawler.stats.inc_value("booking/shards/finished")
+                self.log(f"Shard {shard.name} finished with {shard.requested} properties", logging.INFO)
+
+    async def _parse_search_results(self, response, shard):
         page = response.meta.get("playwright_page")
         if not page:
+            if 'cached' in response.flags:
+                # Replayed from the HTTP cache: only the first page of results is available
+                for request in self._parse_cached_search_results(response, shard):
+                    yield request
+                return
             self.log("Playwright page not found in response meta.", logging.ERROR)
             return
 
+        # With interception, properties are read from the search results responses as they arrive
+        listener = None
+        if self.settings.getbool('BOOKING_INTERCEPT_RESULTS'):
+            listener = SearchResultsListener()
+            page.on("response", listener)
+
         try:
+            seen_cards = 0
             while True: #Infinite loop 
 
-                await page.wait_for_selector('[data-testid="property-card"]', timeout=10000)
-                hotel_cards = await page.query_selector_all('[data-testid="property-card"]')
-                
-                for hotel in hotel_cards:
-                    hotel_element = await hotel.query_selector('[data-testid="property-card-desktop-single-image"]')
+                await page.wait_for_selector(PROPERTY_CARD_SELECTOR, timeout=10000)
+                hotel_cards = await page.query_selector_all(PROPERTY_CARD_SELECTOR)
+                # Results are appended to the list, so only the cards loaded since the last pass are new
+                new_cards = hotel_cards[seen_cards:] if len(hotel_cards) >= seen_cards else hotel_cards
+                seen_cards = len(hotel_cards)
+                self.metrics.inc('cards_seen', len(new_cards))
+
+                if listener:
+                    for item in self._intercepted_items(listener, shard):
+                        if item is None:
+                            return
+                        yield item
+
+                for hotel in new_cards:
+                    hotel_element = await hotel.query_selector(PROPERTY_LINK_SELECTOR)
                     if not hotel_element:
                         continue
                     
                     hotel_link = await hotel_element.get_attribute("href")
                     if not hotel_link:
                         continue
+                    hotel_url = response.urljoin(hotel_link)
 
-                    # Skip hotel if URL is already processed
-                    if hotel_link in self.processed_urls:
+                    # Skip hotel if URL is already processed, whatever its language or tracking parameters
+                    canonical_url = canonical_property_url(hotel_url)
+                    if canonical_url in self.crawl_state:
+                        self.metrics.inc('duplicates_skipped')
                         continue
 
-                    # Add URL to processed list
-                    self.processed_urls.add(hotel_link)
+                    if self._reached_max_results(shard):
+                        return
 
-                    self.log(f"Found hotel link: {hotel_link}", logging.INFO)
+                    self.log(f"Found hotel link: {hotel_link}", logging.DEBUG)
                     
-                    price_element = await hotel.query_selector('span[data-testid="price-and-discounted-price"]')
+                    price_element = await hotel.query_selector(PRICE_SELECTOR)
                     price = (await price_element.inner_text()).replace('\xa0', '').strip() if price_element else 'N/A'
-                    hotel_url = response.urljoin(hotel_link)
-                    
-                    if len(self.processed_items) >= self.max_results:
-                        self.log(f"Reached max results ({self.max_results}), stopping further processing.", logging.INFO)
-                        await page.context.close()
-                        self.crawler.engine.close_spider(self, reason="max_results_reached")
-                        return 
-                    
-                    yield scrapy.Request(
-                        url=hotel_url,
-                        callback=self.parse_hotel_page,
-                        meta={
-                            'playwright': True,
-                            'playwright_include_page': True,
-                            'price': price
-                        },
-                    )
-
-                # Scroll to the bottom of the page to ensure the "Load more results" button is visible
-                self.log("Scrolling to the bottom of the page", logging.INFO)
+                    yield self._queue_hotel(shard, hotel_url, canonical_url, price)
+
+                # Scroll to the bottom of the page so the "Load more results" button is rendered
+                self.log("Scrolling to the bottom of the page", logging.DEBUG)
+                cycle_start = time.perf_counter()
                 await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                await page.wait_for_timeout(2000)  # Wait for scroll to complete
 
-                # Look for the "Load More" button - try multiple possible selectors
-                load_more_button = await page.query_selector('div.c82435a4b8 button.a83ed08757.c0e0affd09 span.e4adce92df')
+                load_more_button = await self._wait_for_load_more_button(page)
                 if not load_more_button:
-                    # If not found by class name, try with the text content
-                    load_more_button = await page.query_selector('button:has-text("Load more results")')
-                    self.log("Found 'Load more results' button by text", logging.INFO)
-                
-                if load_more_button:
-                    self.log("Clicking 'Show more results' button to load more hotels", logging.INFO)
-                    # Scroll to the button to make sure it's visible
-                    await load_more_button.scroll_into_view_if_needed()
-                    await load_more_button.click()
-                    # Wait for new content to load
-                    await page.wait_for_timeout(3000)
-                    await page.wait_for_load_state("domcontentloaded")
-                else:
                     self.log("No more results to load - button not found", logging.INFO)
+                    shard.finished = True
                     break  # No more results, exit loop
+
+                self.log("Clicking 'Show more results' button to load more hotels", logging.INFO)
+                # Scroll to the button to make sure it's visible
+                await load_more_button.scroll_into_view_if_needed()
+                await load_more_button.click()
+                loaded = await self._wait_for_more_results(page, seen_cards, listener)
+                self.metrics.observe('load_more_cycle', time.perf_counter() - cycle_start)
+                if not loaded:
+                    self.log("No new results loaded after clicking 'Load more results'", logging.INFO)
+                    break
         except Exception as e:
             self.log(f"Error parsing search results: {e}. With url: {response.url}", logging.ERROR)
 
+    def _parse_cached_search_results(self, response, shard):
+        """Yields the requests of the hotel pages of the property cards in the HTML of the search results."""
+        cards = response.css(PROPERTY_CARD_SELECTOR)
+        self.metrics.inc('cards_seen', len(cards))
+        for card in cards:
+            hotel_link = card.css(PROPERTY_LINK_SELECTOR).attrib.get('href')
+            if not hotel_link:
+                continue
+            hotel_url = response.urljoin(hotel_link)
+            canonical_url = canonical_property_url(hotel_url)
+            if canonical_url in self.crawl_state:
+                self.metrics.inc('duplicates_skipped')
+                continue
+            if self._reached_max_results(shard):
+                return
+            price = ''.join(card.css(PRICE_SELECTOR).css('::text').getall()).replace('\xa0', '').strip() or 'N/A'
+            yield self._queue_hotel(shard, hotel_url, canonical_url, price)
+        shard.finished = True
+
+    def _reached_max_results(self, shard):
+        """
+        :return: True if the max_results of the shard or of the crawl is reached. In the latter case the
+            spider is closed.
+        """
+        if shard.is_full:
+            self.log(f"Reached max results ({shard.max_results}) of shard {shard.name}", logging.INFO)
+            shard.finished = True
+            return True
+        if self.crawl_state.scraped >= self.max_results:
+            self.log(f"Reached max results ({self.max_results}), stopping further processing.", logging.INFO)
+            self.crawler.engine.close_spider(self, reason="max_results_reached")
+            return True
+        return False
+
+    def _queue_hotel(self, shard, hotel_url, canonical_url, price):
+        """Records a property found in a shard, pending until its hotel page is scraped, and returns its request."""
+        self.crawl_state.add(canonical_url, hotel_url, shard.name, price)
+        shard.requested += 1
+        return self.hotel_request(hotel_url, canonical_url, shard.name, price)
+
+    async def _wait_for_load_more_button(self, page):
+        """Returns the "Load more results" button once it is visible, or None if it does not show up."""
+        try:
+            return await page.wait_for_selector(LOAD_MORE_SELECTOR, state="visible", timeout=LOAD_MORE_TIMEOUT)
+        except Exception:
+            return None
+
+    async def _wait_for_more_results(self, page, seen_cards, listener=None):
+        """
+        Waits until the page shows more property cards than seen_cards, instead of sleeping a fixed time.
+        With interception, it then waits for the search results response that brought them to be read.
+
+        :return: True if new results were loaded before RESULTS_TIMEOUT
+        """
+        try:
+            await page.wait_for_function(MORE_CARDS_FUNCTION, arg=[PROPERTY_CARD_SELECTOR, seen_cards],
+                                         timeout=RESULTS_TIMEOUT)
+        except Exception:
+            return False
+        if listener:
+            # The response arrives before the cards are rendered, so it is usually read already
+            await listener.wait_for_results(INTERCEPT_TIMEOUT)
+        return True
+
+    def _intercepted_items(self, listener, shard):
+        """
+        Yields the complete properties read from the search results responses that were not found
+        yet, so their hotel pages are not requested. Yields None when the max_results of the crawl or of
+        the shard is reached.
+        """
+        for fields in listener.pop_properties():
+            if not is_complete(fields) or fields['url'] in self.crawl_state:
+                continue
+            if self._reached_max_results(shard):
+                yield None
+                return
+            self.crawl_state.add(fields['url'], shard=shard.name, price=fields['price'], state=SCRAPED)
+            shard.requested += 1
+            self.crawler.stats.inc_value("booking/search_results/intercepted")
+            yield PropertyRecord(**fields)
+
     async def parse_hotel_page(self, response):
-        page = response.meta.get("playwright_page")
-        await page.wait_for_load_state('domcontentloaded')
+        """
+        Extracts a property from its page. Pages fetched over plain HTTP whose fields are not in the
+        static HTML are requested again rendered by Playwright, and parsed the same way.
+        """
         price = response.meta.get("price", "N/A")
         url = response.url
+        rendered = response.meta.get(POOL_META_KEY, False)
+        if rendered:
+            # The rendered HTML is already in the response, so the page goes back to the pool right away
+            await self.page_pool.release(response.meta)
 
-        if len(self.processed_items) >= self.max_results:
+        if self.crawl_state.scraped >= self.max_results:
             self.log(f"Reached max results ({self.max_results}), stopping further processing.", logging.INFO)
-            await page.context.close()
             self.crawler.engine.close_spider(self, reason="max_results_reached")
-            return 
-
-        if not page:
-            self.log("Playwright page not found in response meta for hotel page.", logging.ERROR)
             return
-        
+
+        self.log(f"Processing hotel page: {url}", logging.DEBUG)
+        self.metrics.observe('hotel_page_render' if rendered else 'hotel_page_fetch',
+                             response.meta.get('download_latency', 0.0))
         try:
-            self.log(f"Processing hotel page: {url}", logging.INFO)
-            name = (await page.locator('h2.d2fee87262.pp-header__title').text_content() or "").strip()
-            latlong = (await page.locator('a#map_trigger_header_pin').get_attribute('data-atlas-latlng') or "").strip()
-            latitude, longitude = self.get_coordinates(latlong)
-    
-            address_element = page.locator('div.a53cbfa6de.f17adf7576').first
-            address = (await address_element.evaluate('(el) => el.childNodes[0].textContent') or "").strip()
-            
-            rating = (await page.locator('div#js--hp-gallery-scorecard').get_attribute('data-review-score') or "").strip()
+            with self.metrics.timer('extract/property'):
+                fields = parse_property(response, self.metrics)
         except Exception as e:
             self.log(f"Error parsing hotel page: {e}. With url: {url}", logging.ERROR)
-        
-        item = PropertyItem(name=name, latitude=latitude, longitude=longitude, address=address, rating=rating, price=price, url=url)
-        self.log(f'Property extracted: {item}', logging.INFO)
-        self.processed_items.add(item)
+            fields = {}
+
+        if not is_complete(fields) and not rendered:
+            self.crawler.stats.inc_value("booking/hotel_pages/playwright_fallback")
+            meta = {key: response.meta[key] for key in HOTEL_META_KEYS if key in response.meta}
+            yield response.request.replace(
+                dont_filter=True,
+                errback=self.release_page,
+                meta={**meta, POOL_META_KEY: True},
+            )
+            return
+
+        self.crawler.stats.inc_value("booking/hotel_pages/rendered" if rendered else "booking/hotel_pages/static")
+        item = PropertyRecord(name=fields.get('name'), latitude=fields.get('latitude'), longitude=fields.get('longitude'),
+                              address=fields.get('address'), rating=fields.get('rating'), price=price, url=url)
+        self.log(f"Property extracted: {url}", logging.DEBUG)
+        self.crawl_state.mark_scraped(response.meta.get(CANONICAL_URL_META_KEY) or canonical_property_url(url))
         yield item
-        
-        # Close the page and context after processing each hotel page
-        await page.close()
 
+    def closed(self, reason):
+        """Saves the state of the crawl and logs its throughput in items per minute."""
+        self.crawl_state.close()
+        stats = self.crawler.stats
+        start_time = stats.get_value("start_time")
+        if start_time is None:
+            return
+        elapsed = (datetime.now(start_time.tzinfo) - start_time).total_seconds()
+        items = stats.get_value("item_scraped_count", 0)
+        items_per_minute = items / elapsed * 60 if elapsed else 0
+        stats.set_value("booking/items_per_minute", round(items_per_minute, 1))
+        for key, value in self.page_pool.stats().items():
+            stats.set_value(f"booking/page_pool/{key}", value)
+        self.log(f"Scraped {items} items in {elapsed:.0f} s ({items_per_minute:.1f} items/min). "
+                 f"Static pages: {stats.get_value('booking/hotel_pages/static', 0)}, "
+                 f"rendered: {stats.get_value('booking/hotel_pages/rendered', 0)}.", logging.INFO)
 
     def get_coordinates(self, latlong):
-        if latlong:
-            try:
-                latitude, longitude = latlong.split(',')
-                return float(latitude), float(longitude)
-            except ValueError:
-                self.log(f"Invalid coordinates format: {latlong}", logging.WARNING)
-        return None, None
+        latitude, longitude = parse_coordinates(latlong)
+        if latlong and latitude is None:
+            self.log(f"Invalid coordinates format: {latlong}", logging.WARNING)
+        return latitude, longitude
@@ -0,0 +1,19 @@
+# URL helpers for the booking spiders
+import re
+from urllib.parse import urlsplit, urlunsplit
+
+# Language suffix of property pages, e.g. hotel/es/name.es.html
+LANGUAGE_SUFFIX = re.compile(r'\.[a-z]{2}(?:-[a-z]{2})?\.html$')
+
+
+def canonical_property_url(url):
+    """
+    Returns the URL that identifies a property, so the same property found through different
+    searches, languages or tracking parameters is recognized as one.
+
+    :param url: Absolute URL of a property page
+    :return: The URL in https, lower-case host, without language suffix, query string nor fragment
+    """
+    parts = urlsplit(url)
+    path = LANGUAGE_SUFFIX.sub('.html', parts.path)
+    return urlunsplit(('https', parts.netloc.lower(), path, '', ''))
@@ -0,0 +1,98 @@
+"""
+Benchmark of the grid index of geo_index against a brute-force vectorized haversine over all the points.
+
+Points are clustered around random centers, like companies and hotels around cities, and queries are made
+around points of the set. Every query of the brute-force baseline is checked to return the same points.
+
+Usage (from the repository root):
+    python challenge-2/benchmarks/bench_geo_index.py --points 5M --queries 2000
+"""
+import argparse
+import os
+import sys
+import time
+from functools import partial
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo_index import DEFAULT_CELL_DEGREES, GeoIndex, haversine
+from synthetic_data import parse_count
+
+# Clusters of the synthetic points and their spread in degrees
+CLUSTERS = 500
+CLUSTER_SPREAD = 0.5
+# Queries checked against the brute-force baseline, which takes tens of milliseconds each on millions of points
+BASELINE_QUERIES = 20
+
+
+def clustered_points(count, seed=0):
+    """Returns latitudes and longitudes of count points clustered around random centers."""
+    rng = np.random.default_rng(seed)
+    centers_lat = rng.uniform(-60, 70, CLUSTERS)
+    centers_lng = rng.uniform(-180, 180, CLUSTERS)
+    cluster = rng.integers(0, CLUSTERS, count)
+    lat = np.clip(centers_lat[cluster] + rng.normal(0, CLUSTER_SPREAD, count), -90, 90)
+    lng = (centers_lng[cluster] + rng.normal(0, CLUSTER_SPREAD, count) + 180) % 360 - 180
+    return lat, lng
+
+
+def brute_force_radius(points_lat, points_lng, lat, lng, radius_km):
+    """Returns the distances to the points within radius_km, computed to every point, nearest first."""
+    distances = haversine(lat, lng, points_lat, points_lng)
+    return np.sort(distances[distances <= radius_km])
+
+
+def brute_force_knn(points_lat, points_lng, lat, lng, k):
+    """Returns the distances to the k nearest points, computed to every point, nearest first."""
+    return np.sort(haversine(lat, lng, points_lat, points_lng))[:k]
+
+
+def time_queries(query, locations):
+    """Returns the seconds every query took."""
+    timings = np.empty(len(locations))
+    for i, (lat, lng) in enumerate(locations):
+        start = time.perf_counter()
+        query(lat, lng)
+        timings[i] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=parse_count, default=1_000_000, help="Number of points, e.g. 5M.")
+    parser.add_argument("--queries", type=int, default=1000, help="Queries timed per kind.")
+    parser.add_argument("--radius", type=float, nargs="+", default=[1.0, 10.0], help="Radiuses in km to query.")
+    parser.add_argument("--k", type=int, default=10, help="Neighbors of the k-nearest queries.")
+    parser.add_argument("--cell-degrees", type=float, default=DEFAULT_CELL_DEGREES, help="Side of the grid cells.")
+    args = parser.parse_args()
+
+    lat, lng = clustered_points(args.points)
+    start = time.perf_counter()
+    index = GeoIndex(lat, lng, args.cell_degrees)
+    print(f"Indexed {args.points:,} points in {time.perf_counter() - start:.2f} s")
+
+    sample = np.random.default_rng(1).integers(0, args.points, args.queries)
+    locations = list(zip(lat[sample], lng[sample]))
+    queries = {}
+    for radius in args.radius:
+        queries[f"radius {radius:g} km"] = (partial(index.query_radius, radius_km=radius),
+                                            partial(brute_force_radius, lat, lng, radius_km=radius))
+    queries[f"{args.k} nearest"] = (partial(index.query_knn, k=args.k), partial(brute_force_knn, lat, lng, k=args.k))
+
+    print(f"{'Query':<18}{'p50 us':>10}{'p99 us':>10}{'Queries/s':>12}{'Brute force us':>16}{'Speedup':>9}")
+    for name, (query, brute_force) in queries.items():
+        timings = time_queries(query, locations)
+        baseline = time_queries(brute_force, locations[:BASELINE_QUERIES])
+        for la, ln in locations[:BASELINE_QUERIES]:
+            _, distances = query(la, ln)
+            if not np.allclose(distances, brute_force(la, ln)):
+                sys.exit(f"{name} around ({la}, {ln}) returned other points than the brute-force search")
+        p50 = np.median(timings)
+        print(f"{name:<18}{p50 * 1e6:>10.1f}{np.percentile(timings, 99) * 1e6:>10.1f}{1 / timings.mean():>12,.0f}"
+              f"{np.median(baseline) * 1e6:>16,.0f}{np.median(baseline) / p50:>8.0f}x")
+
+
+if __name__ == '__main__':
+    main()
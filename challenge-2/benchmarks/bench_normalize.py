@@ -0,0 +1,121 @@
+"""
+Benchmark of the single-pass normalization engine against the previous implementation,
+which ran one projection + drop_duplicates per table over the fully loaded file.
+
+Usage (from the repository root):
+    python challenge-2/benchmarks/bench_normalize.py --rows 1000000
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from io_utils import EMPLOYEES_HEADER, DEFAULT_CHUNK_SIZE
+from data_processor import normalize_employee_data
+from instrumentation import peak_rss_mib
+
+
+def make_employees_csv(path, rows, companies=5_000, seed=0):
+    """
+    Writes a synthetic processed employees CSV with the columns of EMPLOYEES_HEADER.
+    Args:
+        path (str): Path of the CSV file to write.
+        rows (int): Number of employees.
+        companies (int): Number of distinct companies.
+        seed (int): Seed of the random generator.
+    """
+    rng = np.random.default_rng(seed)
+    company = rng.integers(0, companies, rows)
+    activity = company % 300
+    country = company % 150
+    job = rng.integers(0, 500, rows)
+    df = pd.DataFrame({
+        "EMPLOYEE_NAME": [f"Employee {i}" for i in range(rows)],
+        "EMPLOYEE_EMAIL": [f"employee{i}@example.com" for i in range(rows)],
+        "JOB_NAME": [f"Job {j}" for j in job],
+        "JOB_TYPE": [f"Job type {j % 20}" for j in job],
+        "COMPANY_NAME": [f"Company {c}" for c in company],
+        "TAX_ID": [f"TAX{c:08d}" for c in company],
+        "ACTIVITY": [f"Activity {a}" for a in activity],
+        "ACTIVITY_PARENT": [f"Parent activity {a % 40}" for a in activity],
+        "ACTIVITY_GRAND_PARENT": [f"Grand parent activity {a % 8}" for a in activity],
+        "LAT": np.round(company / companies * 180 - 90, 6),
+        "LNG": np.round(company / companies * 360 - 180, 6),
+        "CONTINENT": [f"Continent {c % 6}" for c in country],
+        "COUNTRY_NAME": [f"Country {c}" for c in country],
+        "ISO2_CODE": [f"C{c:03d}" for c in country],
+    }, columns=EMPLOYEES_HEADER)
+    df.to_csv(path, index=False)
+
+
+def legacy_normalize(employees_file, output_path):
+    """Previous implementation: one projection and drop_duplicates per table over the whole frame."""
+    df = pd.read_csv(employees_file, sep=",")
+    tables = {
+        'Employee.csv': ['EMPLOYEE_NAME', 'EMPLOYEE_EMAIL', 'COMPANY_NAME', 'JOB_NAME'],
+        'Job.csv': ['JOB_NAME', 'JOB_TYPE'],
+        'Job_Type.csv': ['JOB_TYPE'],
+        'Company.csv': ['COMPANY_NAME', 'LAT', 'LNG', 'COUNTRY_NAME'],
+        'Activities.csv': ['ACTIVITY', 'ACTIVITY_PARENT'],
+        'Countries.csv': ['COUNTRY_NAME', 'CONTINENT'],
+    }
+    for file_name, columns in tables.items():
+        table = df[columns].drop_duplicates().reset_index(drop=True)
+        table.insert(0, 'ID', table.index + 1)
+        table.to_csv(os.path.join(output_path, file_name), index=False)
+
+
+def _timed_call(function, args, kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    return elapsed, peak_rss_mib()
+
+
+def measure(function, *args, **kwargs):
+    """
+    Runs function in a fresh process so its memory is measured in isolation.
+    Returns:
+        tuple: Wall time in seconds and peak resident memory of the process in MiB.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(_timed_call, function, args, kwargs).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of synthetic employees.")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per chunk of the new engine.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        employees_file = os.path.join(tmp, "raw_employee.csv")
+        make_employees_csv(employees_file, args.rows)
+        print(f"Input: {args.rows:,} rows, {os.path.getsize(employees_file) / 2 ** 20:.1f} MiB")
+
+        results = {
+            "legacy (six passes)": measure(legacy_normalize, employees_file, _fresh_dir(tmp, "legacy")),
+            "single pass": measure(normalize_employee_data, employees_file, _fresh_dir(tmp, "single"),
+                                   chunksize=args.chunksize),
+        }
+
+    for name, (elapsed, peak) in results.items():
+        print(f"{name:<22} {elapsed:8.2f} s  {args.rows / elapsed:12,.0f} rows/s  peak RSS {peak:8.1f} MiB")
+
+
+def _fresh_dir(parent, name):
+    path = os.path.join(parent, name)
+    os.makedirs(path)
+    return path
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark of the extraction, normalization and reports parsing the employees data with several processes.
+
+Every run starts from the same synthetic tar.gz archive and writes to an empty directory, so nothing
+is reused from a previous run. The speedup is relative to the first number of workers given.
+Peak RSS is the one of the main process only, workers are not included.
+
+Usage (from the repository root):
+    python challenge-2/benchmarks/bench_parallel.py --rows 5000000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_normalize import measure
+from io_utils import CSV_FORMAT, DEFAULT_CHUNK_SIZE, TABLE_EXTENSIONS, load_employees_from_gz_file
+from data_processor import normalize_and_report
+from synthetic_data import generate_employees_archive, parse_count
+
+
+def run_pipeline(archive, output_path, chunksize, table_format, workers):
+    """Extracts, normalizes and reports the archive the way main.process_employee_data does."""
+    employees = load_employees_from_gz_file(archive, output_path, chunksize=chunksize, table_format=table_format,
+                                            workers=workers)
+    normalize_and_report(employees, output_path, table_format=table_format)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=parse_count, default=5_000_000, help="Number of synthetic employees, e.g. 5M.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1],
+                        help="Numbers of worker processes to compare.")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per chunk of serial runs.")
+    parser.add_argument("--format", default=CSV_FORMAT, choices=sorted(TABLE_EXTENSIONS), help="Format of the tables.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = os.path.join(tmp, "employees.tar.gz")
+        generate_employees_archive(archive, args.rows)
+        print(f"Input: {args.rows:,} rows, {os.path.getsize(archive) / 2 ** 20:.1f} MiB compressed")
+
+        results = {}
+        for workers in args.workers:
+            output_path = os.path.join(tmp, f"workers-{workers}")
+            results[workers] = measure(run_pipeline, archive, output_path, args.chunksize, args.format, workers)
+
+    baseline, _ = results[args.workers[0]]
+    for workers, (elapsed, peak) in results.items():
+        print(f"{workers:>3} workers {elapsed:8.2f} s  {args.rows / elapsed:12,.0f} rows/s  "
+              f"speedup {baseline / elapsed:5.2f}x  peak RSS {peak:8.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
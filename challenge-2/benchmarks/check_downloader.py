@@ -0,0 +1,215 @@
+"""
+Checks of downloader.RangedDownloader against a local HTTP server standing in for S3.
+
+The server serves random bytes with an MD5 ETag and can ignore Range headers, fail some segments and corrupt the
+bytes of others, so every scenario runs without network:
+- ranged: the file is downloaded in parallel segments and matches the source.
+- resume: a download interrupted by failing segments keeps its sidecar state, and the next attempt only requests
+  the segments still missing.
+- no-range: a server without Range support is downloaded in a single stream.
+- corrupt-etag / corrupt-sha256: a corrupted segment is rejected by the ETag or by the expected SHA-256, and the
+  partial file and its state are removed.
+
+Exits with status 1 when a scenario fails.
+
+Usage (from the repository root):
+    python challenge-2/benchmarks/check_downloader.py --size 5000000
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader import RangedDownloader, make_session
+from synthetic_data import parse_count
+
+SEGMENT_SIZE = 256 * 1024
+WORKERS = 4
+RANGE = re.compile(r'^bytes=(\d+)-(\d+)$')
+
+
+class FileServer:
+    """Local HTTP server of a bytes object, in a background thread, recording the ranges requested."""
+
+    def __init__(self, data, ranges=True):
+        """
+        Args:
+            data (bytes): Content of the file.
+            ranges (bool): Whether Range headers are honored.
+        """
+        self.data = data
+        self.ranges = ranges
+        self.etag = f'"{hashlib.md5(data).hexdigest()}"'
+        # Start offsets of the segments answered with 503, and of the segments served with a flipped byte
+        self.failing = set()
+        self.corrupt = set()
+        self.requested = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/employees.tar.gz?X-Amz-Signature=fixture"
+
+    def start(self):
+        files = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, headers, body = files.serve(self.headers.get('Range'))
+                self.send_response(status)
+                for name, value in {**headers, 'Content-Length': str(len(body))}.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve(self, range_header):
+        """Returns the status, headers and body of a GET with the given Range header."""
+        headers = {'ETag': self.etag, 'Content-Type': 'application/octet-stream'}
+        match = RANGE.match(range_header or '')
+        if not self.ranges or match is None:
+            return 200, headers, self.data
+        start, end = int(match.group(1)), min(int(match.group(2)), len(self.data) - 1)
+        with self._lock:
+            self.requested.append(start)
+        if start in self.failing:
+            return 503, {}, b'Service unavailable'
+        body = self.data[start:end + 1]
+        if start in self.corrupt:
+            body = bytes([body[0] ^ 0xFF]) + body[1:]
+        headers['Content-Range'] = f"bytes {start}-{end}/{len(self.data)}"
+        return 206, headers, body
+
+
+def downloader(server, path, **kwargs):
+    """Returns a RangedDownloader of the server file, failing segments on their first attempt."""
+    return RangedDownloader(server.url, path, workers=WORKERS, segment_size=SEGMENT_SIZE, retries=1,
+                            session=make_session(pool_size=WORKERS, retries=0), **kwargs)
+
+
+def segment_starts(size):
+    return list(range(0, size, SEGMENT_SIZE))
+
+
+def check_ranged(data, path):
+    server = FileServer(data).start()
+    try:
+        downloader(server, path).download()
+    finally:
+        server.stop()
+    _check_file(path, data)
+    # The probe asks for the first byte, then every segment is requested once
+    if sorted(server.requested) != [0] + segment_starts(len(data)):
+        return f"requested the offsets {sorted(server.requested)}"
+
+
+def check_resume(data, path):
+    server = FileServer(data).start()
+    starts = segment_starts(len(data))
+    server.failing = set(starts[len(starts) // 2:])
+    try:
+        try:
+            downloader(server, path).download()
+            return "the interrupted download did not fail"
+        except IOError:
+            pass
+        with open(path + ".part.json", encoding='utf-8') as f:
+            done = json.load(f)['done']
+        if not done or len(done) >= len(starts):
+            return f"the state recorded {len(done)} of {len(starts)} segments as done"
+        server.failing.clear()
+        server.requested.clear()
+        downloader(server, path).download()
+    finally:
+        server.stop()
+    _check_file(path, data)
+    resumed = sorted(server.requested)[1:]
+    missing = [start for index, start in enumerate(starts) if index not in done]
+    if resumed != missing:
+        return f"resumed with the offsets {resumed} instead of the missing {missing}"
+
+
+def check_no_range(data, path):
+    server = FileServer(data, ranges=False).start()
+    try:
+        downloader(server, path).download()
+    finally:
+        server.stop()
+    _check_file(path, data)
+
+
+def check_corrupt(data, path, sha256=False):
+    server = FileServer(data).start()
+    server.corrupt = {segment_starts(len(data))[-1]}
+    expected_sha256 = hashlib.sha256(data).hexdigest() if sha256 else None
+    try:
+        downloader(server, path, expected_sha256=expected_sha256).download()
+        return "the corrupted download was accepted"
+    except IOError as e:
+        if "corrupt" not in str(e):
+            return f"failed with {e!r} instead of rejecting the file"
+    finally:
+        server.stop()
+    leftovers = [file for file in (path, path + ".part", path + ".part.json") if os.path.exists(file)]
+    if leftovers:
+        return f"left {leftovers} behind"
+
+
+def _check_file(path, data):
+    with open(path, 'rb') as f:
+        if f.read() != data:
+            raise AssertionError(f"{path} does not match the served file")
+    if os.path.exists(path + ".part") or os.path.exists(path + ".part.json"):
+        raise AssertionError(f"the partial download of {path} was left behind")
+
+
+SCENARIOS = {
+    'ranged': check_ranged,
+    'resume': check_resume,
+    'no-range': check_no_range,
+    'corrupt-etag': check_corrupt,
+    'corrupt-sha256': lambda data, path: check_corrupt(data, path, sha256=True),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=parse_count, default=3_000_000, help="Bytes of the served file, e.g. 5M.")
+    args = parser.parse_args()
+
+    data = os.urandom(args.size)
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, check in SCENARIOS.items():
+            try:
+                error = check(data, os.path.join(tmp, f"{name}.tar.gz"))
+            except (AssertionError, IOError) as e:
+                error = str(e)
+            print(f"{name:<16}{'FAILED: ' + error if error else 'ok'}")
+            failures += bool(error)
+    if failures:
+        sys.exit(f"{failures} of {len(SCENARIOS)} downloader checks failed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+Benchmark suite of the employees pipeline on synthetic archives of several sizes.
+
+For every size it measures the extraction, the normalization and each report in a fresh process, recording
+wall time, peak RSS and rows per second. Results are appended to a JSON Lines history, and every measurement
+is compared with the last one recorded on the same host for the same size, stage and parameters: a stage
+slower than that by more than the tolerance is reported as a regression and the suite exits with status 1.
+
+Usage (from the repository root):
+    python challenge-2/benchmarks/run_benchmarks.py --sizes 10k 100k 1M 10M 50M
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_normalize import measure
+from build_cache import MANIFEST_FILE, BuildCache
+from io_utils import CSV_FORMAT, DEFAULT_CHUNK_SIZE, TABLE_EXTENSIONS, as_employee_dataset, extract_employees_from_gz_file
+from data_processor import (COMPANIES_BY_ACTIVITY_REPORT, EMPLOYEES_BY_COMPANY_REPORT, REPORT_COLUMNS, ReportAggregator,
+                            normalize_and_report)
+from synthetic_data import generate_employees_archive, parse_count
+
+# Sizes benchmarked by default
+DEFAULT_SIZES = ["10k", "100k", "1M", "10M", "50M"]
+# History of the results, one JSON object per measurement
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "benchmarks.jsonl")
+# Relative slowdown against the previous result reported as a regression
+DEFAULT_TOLERANCE = 0.2
+# Slowdowns shorter than this are noise, whatever their relative size
+MIN_REGRESSION_SECONDS = 0.1
+
+# Report stages: method of ReportAggregator building it, and file it is saved to
+REPORTS = {
+    "report_employees_by_company": ("employees_by_company_report", EMPLOYEES_BY_COMPANY_REPORT),
+    "report_companies_by_activity": ("companies_by_activity_report", COMPANIES_BY_ACTIVITY_REPORT),
+}
+
+
+def extract_stage(archive, output_path, chunksize, table_format):
+    """Extracts the employees member of the archive into raw_employee."""
+    return extract_employees_from_gz_file(archive, output_path, chunksize=chunksize, table_format=table_format,
+                                          cache=_empty_cache(output_path))
+
+
+def normalize_stage(employees_file, output_path, chunksize, table_format):
+    """Builds the normalized tables from raw_employee."""
+    normalize_and_report(employees_file, output_path, chunksize=chunksize, table_format=table_format,
+                         cache=_empty_cache(output_path), reports=False)
+
+
+def _empty_cache(output_path):
+    """Returns a build cache without records, so repeated runs rebuild every output."""
+    manifest_path = os.path.join(output_path, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    return BuildCache(manifest_path)
+
+
+def report_stage(employees_file, output_path, chunksize, stage):
+    """Counts raw_employee and saves a single report."""
+    method, report_file = REPORTS[stage]
+    aggregator = ReportAggregator()
+    for chunk in as_employee_dataset(employees_file, chunksize).chunks(REPORT_COLUMNS):
+        aggregator.update(chunk)
+    getattr(aggregator, method)().to_csv(os.path.join(output_path, report_file), index=False, sep=";")
+
+
+def run_size(rows, data_dir, args):
+    """
+    Generates (or reuses) the archive of a size and measures every stage over it.
+    Returns:
+        list: One result per stage.
+    """
+    archive = os.path.join(data_dir, f"employees-{rows}-s{args.skew:g}-seed{args.seed}.tar.gz")
+    if not os.path.exists(archive):
+        print(f"Generating {rows:,} employees...")
+        generate_employees_archive(archive, rows, skew=args.skew, seed=args.seed)
+
+    results = []
+    with tempfile.TemporaryDirectory(dir=data_dir) as output_path:
+        elapsed, peak = measure_best(args.repeat, extract_stage, archive, output_path, args.chunksize, args.format)
+        results.append(_result("extract", rows, elapsed, peak, os.path.getsize(archive)))
+
+        employees_file = os.path.join(output_path, "raw_employee" + TABLE_EXTENSIONS[args.format])
+        elapsed, peak = measure_best(args.repeat, normalize_stage, employees_file, output_path, args.chunksize, args.format)
+        results.append(_result("normalize", rows, elapsed, peak, os.path.getsize(employees_file)))
+
+        for stage in REPORTS:
+            elapsed, peak = measure_best(args.repeat, report_stage, employees_file, output_path, args.chunksize, stage)
+            results.append(_result(stage, rows, elapsed, peak, os.path.getsize(employees_file)))
+    return results
+
+
+def measure_best(repeat, function, *args):
+    """
+    Measures function repeat times, each in a fresh process.
+    Returns:
+        tuple: Best wall time in seconds and highest peak resident memory in MiB.
+    """
+    measurements = [measure(function, *args) for _ in range(repeat)]
+    return min(elapsed for elapsed, _ in measurements), max(peak for _, peak in measurements)
+
+
+def _result(stage, rows, elapsed, peak, input_bytes):
+    return {
+        "stage": stage,
+        "rows": rows,
+        "wall_s": round(elapsed, 4),
+        "peak_rss_mib": round(peak, 1),
+        "rows_per_s": round(rows / elapsed),
+        "input_bytes": input_bytes,
+    }
+
+
+def load_history(path):
+    """Returns the results recorded so far, oldest first."""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_result(history, result):
+    """Returns the last recorded result comparable with result, or None."""
+    for previous in reversed(history):
+        if all(previous.get(key) == result[key] for key in ("host", "stage", "rows", "params")):
+            return previous
+    return None
+
+
+def run_metadata(args):
+    """Describes the run, so only results of the same machine and parameters are compared."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "params": {"chunksize": args.chunksize, "format": args.format, "skew": args.skew, "seed": args.seed,
+                   "repeat": args.repeat},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=parse_count, nargs="+", default=[parse_count(size) for size in DEFAULT_SIZES],
+                        help="Numbers of employees, e.g. 10k 1M.")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per chunk.")
+    parser.add_argument("--format", default=CSV_FORMAT, choices=sorted(TABLE_EXTENSIONS), help="Format of the tables.")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of the employees per company.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data.")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage, keeping the fastest.")
+    parser.add_argument("--data-dir", help="Directory where the archives are generated and kept between runs. "
+                                           "A temporary one by default.")
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSON Lines file the results are appended to.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Relative slowdown reported as a regression.")
+    parser.add_argument("--no-save", action="store_true", help="Do not append the results to the history.")
+    args = parser.parse_args()
+
+    history = load_history(args.results)
+    metadata = run_metadata(args)
+    regressions = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        results = []
+        for rows in args.sizes:
+            for result in run_size(rows, data_dir, args):
+                result = {**metadata, **result}
+                previous = previous_result(history, result)
+                change = ""
+                if previous is not None:
+                    ratio = result["wall_s"] / previous["wall_s"]
+                    change = f"  {ratio - 1:+6.1%} vs {previous['commit']}"
+                    if ratio > 1 + args.tolerance and result["wall_s"] - previous["wall_s"] > MIN_REGRESSION_SECONDS:
+                        change += "  REGRESSION"
+                        regressions.append(result)
+                print(f"{rows:>12,} rows  {result['stage']:<30} {result['wall_s']:9.2f} s  "
+                      f"{result['rows_per_s']:12,} rows/s  peak RSS {result['peak_rss_mib']:8.1f} MiB{change}")
+                results.append(result)
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+        with open(args.results, 'a', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(result, sort_keys=True) + "\n")
+        print(f"Results appended to {args.results}")
+
+    if regressions:
+        print(f"{len(regressions)} stage(s) slower than the previous run by more than {args.tolerance:.0%}.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+# Name of the manifest file kept next to the built artifacts
+MANIFEST_FILE = ".build_manifest.json"
+
+# Size of the blocks read when hashing files
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Source files whose changes invalidate every artifact built with them
+SOURCE_FILES = ["io_utils.py", "data_processor.py", "build_cache.py", "parallel.py"]
+
+
+def file_hash(path):
+    """
+    Args:
+        path (str): Path of the file to hash.
+    Returns:
+        str: SHA-256 hex digest of the contents of the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_version():
+    """
+    Returns:
+        str: Hash of the pipeline source files, so changing the code rebuilds the artifacts.
+    """
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for source_file in SOURCE_FILES:
+        with open(os.path.join(directory, source_file), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def partial_path(path):
+    """
+    Returns the temporary path where path is written before being moved into place.
+    It keeps the extension of path, since it may be used to pick the file format.
+    """
+    directory, file_name = os.path.split(path)
+    root, extension = os.path.splitext(file_name)
+    return os.path.join(directory, f".{root}.{os.getpid()}.partial{extension}")
+
+
+@contextmanager
+def atomic_output(path):
+    """
+    Yields a temporary path next to path, which replaces path only if the block finishes without errors.
+    A crash halfway therefore never leaves a partial file behind that looks complete.
+    Args:
+        path (str): Final path of the file.
+    """
+    temp_path = partial_path(path)
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class BuildCache:
+    """
+    Manifest of the artifacts built by the pipeline, used to rebuild only the outputs whose inputs changed.
+
+    For every artifact it records the size, modification time and hash of the artifact and of its input
+    files, the parameters it was built with and the version of the code. An artifact is up to date when it
+    still matches its record and none of those changed. Artifacts recorded as unversioned, like downloads, do not
+    depend on the code, so changing it does not invalidate them. Sizes and modification times are checked first,
+    so files are only hashed again when they look different.
+    """
+
+    def __init__(self, manifest_path):
+        """
+        Args:
+            manifest_path (str): Path of the JSON manifest. It is created on the first record.
+        """
+        self.manifest_path = manifest_path
+        self.code_version = code_version()
+        self.entries = {}
+        # Whether a recorded mtime was refreshed after finding the file unchanged
+        self._touched = False
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    @classmethod
+    def in_directory(cls, directory):
+        """Returns the build cache whose manifest is in the given directory."""
+        return cls(os.path.join(directory, MANIFEST_FILE))
+
+    def is_fresh(self, output, inputs=(), params=None, versioned=True):
+        """
+        Checks whether an artifact is up to date.
+        Args:
+            output (str): Path of the artifact.
+            inputs (list): Paths of the files it is built from.
+            params (dict, optional): JSON-serializable parameters it is built with.
+            versioned (bool): Whether a change of the code makes the artifact stale.
+        Returns:
+            bool: True if the artifact exists and neither it, its inputs, its parameters nor the code changed.
+        """
+        entry = self.entries.get(self._key(output))
+        if entry is None or not os.path.exists(output):
+            return False
+        if versioned and entry['code_version'] != self.code_version:
+            return False
+        if entry['params'] != (params or {}):
+            return False
+        if sorted(entry['inputs']) != sorted(self._key(path) for path in inputs):
+            return False
+        fresh = (self._matches(output, entry['output'])
+                 and all(os.path.exists(path) and self._matches(path, entry['inputs'][self._key(path)]) for path in inputs))
+        if fresh and self._touched:
+            self.save()
+        return fresh
+
+    def record(self, output, inputs=(), params=None, versioned=True):
+        """
+        Records a freshly built artifact and saves the manifest.
+        Args:
+            output (str): Path of the artifact.
+            inputs (list): Paths of the files it was built from.
+            params (dict, optional): JSON-serializable parameters it was built with.
+            versioned (bool): Whether a change of the code makes the artifact stale.
+        """
+        self.entries[self._key(output)] = {
+            'output': self._signature(output),
+            'inputs': {self._key(path): self._signature(path) for path in inputs},
+            'params': params or {},
+            'code_version': self.code_version if versioned else None,
+        }
+        self.save()
+
+    def save(self):
+        """Writes the manifest atomically."""
+        self._touched = False
+        directory = os.path.dirname(self.manifest_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with atomic_output(self.manifest_path) as temp_path:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+
+    def _signature(self, path):
+        """Returns the size, modification time and hash of a file, reusing the recorded hash if it looks unchanged."""
+        stat = os.stat(path)
+        for signature in self._known_signatures(path):
+            if signature['size'] == stat.st_size and signature['mtime_ns'] == stat.st_mtime_ns:
+                return dict(signature)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_hash(path)}
+
+    def _known_signatures(self, path):
+        """Yields the signatures recorded for a file, either as an artifact or as an input."""
+        key = self._key(path)
+        for output, entry in self.entries.items():
+            if output == key:
+                yield entry['output']
+            if key in entry['inputs']:
+                yield entry['inputs'][key]
+
+    def _matches(self, path, signature):
+        """Checks a file against a recorded signature, hashing it only if its size is the same but its mtime is not."""
+        stat = os.stat(path)
+        if stat.st_size != signature['size']:
+            return False
+        if stat.st_mtime_ns == signature['mtime_ns']:
+            return True
+        digest = file_hash(path)
+        if digest != signature['sha256']:
+            return False
+        # Same contents: remember the new mtime so the file is not hashed again next time
+        for known_signature in self._known_signatures(path):
+            if known_signature['sha256'] == digest:
+                known_signature['mtime_ns'] = stat.st_mtime_ns
+        self._touched = True
+        return True
+
+    def _key(self, path):
+        """Files are recorded relative to the manifest, so the whole tree can be moved."""
+        return os.path.relpath(os.path.abspath(path), os.path.dirname(os.path.abspath(self.manifest_path)))
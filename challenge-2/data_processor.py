@@ -1,5 +1,9 @@
 import os
+import numpy as np
 import pandas as pd
+from build_cache import BuildCache, atomic_output
+from instrumentation import stage, timed_iter
+from io_utils import DEFAULT_CHUNK_SIZE, CSV_FORMAT, TableWriter, as_employee_dataset, table_file_name
 
 # Header mapping for CSV types
 CSV_HEADERS = {
@@ -15,153 +19,373 @@ CSV_HEADERS = {
 ACTIVITIES_CSV = "Activities.csv"
 EMPLOYEE_CSV = "Employee.csv"
 COUNTRIES_CSV = "Countries.csv"
-JOBS_CSV = "Jobs.csv"
-JOB_TYPES_CSV = "Job_types.csv"
-COMPANIES_CSV = "Companies.csv"
-    
-def normalize_employee_data(employees_file, output_path):
+JOBS_CSV = "Job.csv"
+JOB_TYPES_CSV = "Job_Type.csv"
+COMPANIES_CSV = "Company.csv"
+
+
+class DimensionTable:
+    """
+    Dictionary-encodes the distinct rows of a normalized table.
+
+    Every distinct combination of key columns gets an integer ID starting from 1, in order of first
+    appearance. Rows are identified by a 64-bit hash of their key columns, so only one hash per distinct
+    row is kept in memory: the memory used grows with the number of distinct values and not with the
+    number of rows read.
+    """
+
+    def __init__(self, key_columns, output_names=None):
+        """
+        Args:
+            key_columns (list): Columns of the incoming frames that identify a row of the table.
+            output_names (dict, optional): Renames key columns when writing the table.
+        """
+        self.key_columns = key_columns
+        self.output_names = output_names or {}
+        self.ids = {}
+        self.new_rows = None
+
+    def encode(self, frame):
+        """
+        Returns the ID of each row of the frame, registering the values not seen before.
+        The new distinct rows are left in `new_rows` so they can be appended to the output.
+        Args:
+            frame (pd.DataFrame): Frame containing the key columns.
+        Returns:
+            np.ndarray: Integer ID of each row.
+        """
+        keys = frame[self.key_columns]
+        hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+        # Local codes and uniques follow the order of first appearance
+        codes, unique_hashes = pd.factorize(hashes)
+
+        first_new_id = len(self.ids) + 1
+        unique_ids = np.fromiter(
+            (self.ids.setdefault(key, len(self.ids) + 1) for key in unique_hashes.tolist()),
+            dtype=np.int64, count=len(unique_hashes))
+
+        is_new = unique_ids >= first_new_id
+        first_rows = np.flatnonzero(~pd.Series(codes).duplicated().to_numpy())
+        new_rows = keys.iloc[first_rows[is_new]].rename(columns=self.output_names).reset_index(drop=True)
+        new_rows.insert(0, 'ID', unique_ids[is_new])
+        self.new_rows = new_rows
+        return unique_ids[codes]
+
+    @property
+    def columns(self):
+        """Columns of the written table."""
+        return ['ID'] + [self.output_names.get(column, column) for column in self.key_columns]
+
+
+def _parent_frame(names, parent_ids):
+    """Builds an activity frame with the given names and parent IDs (None for top level activities)."""
+    return pd.DataFrame({
+        'ACTIVITY': names.to_numpy(),
+        'PARENT_ID': pd.array(parent_ids if parent_ids is not None else [None] * len(names), dtype="Int64")
+    })
+
+
+class EmployeeNormalizer:
+    """
+    Builds the normalized tables (Employee, Job, Job Type, Company, Activities, Countries) from chunks of
+    employees, appending the new rows of every table to its file as they are found.
+
+    All tables are filled in the same pass with integer foreign keys between them. Activities hold the
+    whole hierarchy (grand parent, parent and activity), each one pointing to its parent through PARENT_ID.
+    """
+
+    def __init__(self, output_path, table_format=CSV_FORMAT, cache=None, inputs=()):
+        """
+        Opens the file of every table that is not up to date in output_path.
+        Args:
+            output_path (str): Path to the directory where the tables will be saved.
+            table_format (str): Format of the tables: CSV_FORMAT, PARQUET_FORMAT or ARROW_FORMAT.
+            cache (BuildCache, optional): Build cache deciding which tables are up to date.
+                Defaults to the one of output_path.
+            inputs (list): Paths of the files the tables are built from.
+        """
+        self.cache = cache or BuildCache.in_directory(output_path)
+        self.inputs = list(inputs)
+        self.countries = DimensionTable(['COUNTRY_NAME', 'CONTINENT'], {'CONTINENT': 'CONTINENT_ID'})
+        self.job_types = DimensionTable(['JOB_TYPE'])
+        self.jobs = DimensionTable(['JOB_NAME', 'JOB_TYPE_ID'], {'JOB_NAME': 'JOB'})
+        self.companies = DimensionTable(['COMPANY_NAME', 'LAT', 'LNG', 'COUNTRY_ID'])
+        self.activities = DimensionTable(['ACTIVITY', 'PARENT_ID'])
+        self.employees = DimensionTable(['EMPLOYEE_NAME', 'EMPLOYEE_EMAIL', 'COMPANY_ID', 'JOB_ID'])
+        self.tables = {
+            EMPLOYEE_CSV: self.employees,
+            JOBS_CSV: self.jobs,
+            JOB_TYPES_CSV: self.job_types,
+            COMPANIES_CSV: self.companies,
+            ACTIVITIES_CSV: self.activities,
+            COUNTRIES_CSV: self.countries,
+        }
+        # Instrumentation stage of every table
+        self.stage_names = {table: "table:" + os.path.splitext(file_name)[0] for file_name, table in self.tables.items()}
+
+        self.outputs = {}
+        for file_name, table in self.tables.items():
+            file_name = table_file_name(file_name, table_format)
+            table_file = os.path.join(output_path, file_name)
+            if self.cache.is_fresh(table_file, self.inputs):
+                print(f"File {file_name} is up to date. Skipping.")
+                continue
+            self.outputs[file_name] = (table, TableWriter(table_file, table.columns))
+
+    @property
+    def done(self):
+        """Whether every table already exists, so there is nothing to build."""
+        return not self.outputs
+
+    def update(self, chunk):
+        """
+        Encodes a chunk of employees and appends the new rows of every table. The chunk is not modified.
+        Args:
+            chunk (pd.DataFrame): Employees with all the EMPLOYEES_HEADER columns.
+        """
+        # Tables are encoded in dependency order so foreign keys are available to the tables using them
+        country_ids = self._encode(self.countries, chunk)
+        job_type_ids = self._encode(self.job_types, chunk)
+        job_ids = self._encode(self.jobs, chunk[['JOB_NAME']].assign(JOB_TYPE_ID=job_type_ids))
+        company_ids = self._encode(self.companies, chunk[['COMPANY_NAME', 'LAT', 'LNG']].assign(COUNTRY_ID=country_ids))
+        self._encode(self.employees, chunk[['EMPLOYEE_NAME', 'EMPLOYEE_EMAIL']].assign(COMPANY_ID=company_ids, JOB_ID=job_ids))
+
+        # Activities hierarchy: grand parent -> parent -> activity
+        grand_parent_ids = self._encode(self.activities, _parent_frame(chunk['ACTIVITY_GRAND_PARENT'], None))
+        new_activities = [self.activities.new_rows]
+        parent_ids = self._encode(self.activities, _parent_frame(chunk['ACTIVITY_PARENT'], grand_parent_ids))
+        new_activities.append(self.activities.new_rows)
+        self._encode(self.activities, _parent_frame(chunk['ACTIVITY'], parent_ids))
+        new_activities.append(self.activities.new_rows)
+        self.activities.new_rows = pd.concat(new_activities, ignore_index=True)
+
+        for table, writer in self.outputs.values():
+            with stage(self.stage_names[table]):
+                writer.write(table.new_rows)
+
+    def _encode(self, table, frame):
+        with stage(self.stage_names[table]):
+            return table.encode(frame)
+
+    def close(self):
+        """Moves the files of the tables into place and records them in the build cache."""
+        for table, writer in self.outputs.values():
+            with stage(self.stage_names[table]):
+                writer.close()
+            self.cache.record(writer.path, self.inputs)
+
+    def abort(self):
+        """Discards the files of the tables, leaving the previous ones untouched."""
+        for _, writer in self.outputs.values():
+            writer.abort()
+
+
+def normalize_employee_data(employees, output_path, chunksize=DEFAULT_CHUNK_SIZE, table_format=CSV_FORMAT, cache=None):
     """
     Normalize the employee data into structured tables: Employee, Job, Job Type, Company, Activities, Countries.
+
+    The employees data is read once, in chunks, and every table is built in that single pass.
     Args:
-        employees_file (str): Path to the CSV file containing processed employee data.
+        employees (str or EmployeeDataset): Path to the CSV file containing processed employee data, or the dataset.
         output_path (str): Path to the directory where reports will be saved.
+        chunksize (int, optional): Number of rows read at a time from a file. If None, the file is read at once.
+        table_format (str): Format of the tables: CSV_FORMAT, PARQUET_FORMAT or ARROW_FORMAT.
+        cache (BuildCache, optional): Build cache deciding which tables are up to date. Defaults to the one of output_path.
     """
-    # Read the employees CSV file into a DataFrame
-    df = pd.read_csv(employees_file, sep=",")
+    normalize_and_report(employees, output_path, chunksize, table_format, cache, reports=False)
 
-    # Ensure the output directory exists
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
 
-    # Extract relevant columns for each normalized table
-
-    if os.path.exists(os.path.join(output_path, EMPLOYEE_CSV)):
-        print(f"File {EMPLOYEE_CSV} already exists. Skipping.")
-    else:
-        # 1. Employee Table
-        employee_df = df[['EMPLOYEE_NAME', 'EMPLOYEE_EMAIL', 'COMPANY_NAME', 'JOB_NAME']].drop_duplicates().reset_index(drop=True)
-        employee_df['ID'] = employee_df.index + 1  # Generate unique IDs starting from 1
-        employee_df = employee_df.rename(columns={
-            'EMPLOYEE_NAME': 'EMPLOYEE_NAME',
-            'EMPLOYEE_EMAIL': 'EMPLOYEE_EMAIL',
-            'COMPANY_NAME': 'COMPANY_ID',
-            'JOB_NAME': 'JOB_ID'
-        })
-        employee_df = employee_df[['ID', 'EMPLOYEE_NAME', 'EMPLOYEE_EMAIL', 'COMPANY_ID', 'JOB_ID']]
-        employee_df.to_csv(os.path.join(output_path, 'Employee.csv'), index=False)
-
-
-    if os.path.exists(os.path.join(output_path, JOBS_CSV)):
-        print(f"File {JOBS_CSV} already exists. Skipping.")
-    else:
-        # 2. Job Table
-        job_df = df[['JOB_NAME', 'JOB_TYPE']].drop_duplicates().reset_index(drop=True)
-        job_df['ID'] = job_df.index + 1  # Generate unique IDs starting from 1
-        job_df = job_df.rename(columns={
-            'JOB_NAME': 'JOB',
-            'JOB_TYPE': 'JOB_TYPE_ID'
-        })
-        job_df = job_df[['ID', 'JOB', 'JOB_TYPE_ID']]
-        job_df.to_csv(os.path.join(output_path, 'Job.csv'), index=False)
-
-
-
-    if os.path.exists(os.path.join(output_path, JOB_TYPES_CSV)):
-        print(f"File {JOB_TYPES_CSV} already exists. Skipping.")
-    else:
-        # 3. Job Type Table
-        job_type_df = df[['JOB_TYPE']].drop_duplicates().reset_index(drop=True)
-        job_type_df['ID'] = job_type_df.index + 1  # Generate unique IDs starting from 1
-        job_type_df = job_type_df.rename(columns={'JOB_TYPE': 'JOB_TYPE'})
-        job_type_df = job_type_df[['ID', 'JOB_TYPE']]
-        job_type_df.to_csv(os.path.join(output_path, 'Job_Type.csv'), index=False)
-
-
-    if os.path.exists(os.path.join(output_path, COMPANIES_CSV)):
-        print(f"File {COMPANIES_CSV} already exists. Skipping.")
-    else:
-        # 4. Company Table
-        company_df = df[['COMPANY_NAME', 'LAT', 'LNG', 'COUNTRY_NAME']].drop_duplicates().reset_index(drop=True)
-        company_df['ID'] = company_df.index + 1  # Generate unique IDs starting from 1
-        company_df = company_df.rename(columns={
-            'COMPANY_NAME': 'COMPANY_NAME',
-            'LAT': 'LAT',
-            'LNG': 'LNG',
-            'COUNTRY_NAME': 'COUNTRY_ID'
-        })
-        company_df = company_df[['ID', 'COMPANY_NAME', 'LAT', 'LNG', 'COUNTRY_ID']]
-        company_df.to_csv(os.path.join(output_path, 'Company.csv'), index=False)
-
-    if os.path.exists(os.path.join(output_path, ACTIVITIES_CSV)):
-        print(f"File {ACTIVITIES_CSV} already exists. Skipping.")
-    else:
-        # 5. Activities Table
-        activities_df = df[['ACTIVITY', 'ACTIVITY_PARENT']].drop_duplicates().reset_index(drop=True)
-        activities_df['ID'] = activities_df.index + 1  # Generate unique IDs starting from 1
-        activities_df = activities_df.rename(columns={
-            'ACTIVITY': 'ACTIVITY',
-            'ACTIVITY_PARENT': 'PARENT_ID'
-        })
-        activities_df = activities_df[['ID', 'ACTIVITY', 'PARENT_ID']]
-        activities_df.to_csv(os.path.join(output_path, 'Activities.csv'), index=False)
-
-
-
-    if os.path.exists(os.path.join(output_path, COUNTRIES_CSV)):
-        print(f"File {COUNTRIES_CSV} already exists. Skipping.")
-    else:
-        # 6. Countries Table
-        countries_df = df[['COUNTRY_NAME', 'CONTINENT']].drop_duplicates().reset_index(drop=True)
-        countries_df['ID'] = countries_df.index + 1  # Generate unique IDs starting from 1
-        countries_df = countries_df.rename(columns={
-            'COUNTRY_NAME': 'COUNTRY_NAME',
-            'CONTINENT': 'CONTINENT_ID'
-        })
-        countries_df = countries_df[['ID', 'COUNTRY_NAME', 'CONTINENT_ID']]
-        countries_df.to_csv(os.path.join(output_path, 'Countries.csv'), index=False)
-
-    print("Data has been successfully normalized and saved.")
-
-def generate_reports(employees_file, output_path):
+# Columns of the employees file used by the reports
+COMPANY_REPORT_KEYS = ['COUNTRY_NAME', 'COMPANY_NAME']
+ACTIVITY_REPORT_KEYS = ['ACTIVITY_GRAND_PARENT', 'ACTIVITY_PARENT', 'ACTIVITY']
+REPORT_COLUMNS = COMPANY_REPORT_KEYS + ACTIVITY_REPORT_KEYS
+
+EMPLOYEES_BY_COMPANY_REPORT = "AMOUNT_EMPLOYEES_BY_COMPANY_COUNTRY.csv"
+COMPANIES_BY_ACTIVITY_REPORT = "AMOUNT_COMPANIES_BY_ACTIVITIES.csv"
+
+
+class ReportAggregator:
+    """
+    Running counters for the reports, fed one chunk of employees at a time.
+
+    Only the counts per (country, company) and per activity hierarchy are kept, so the memory used
+    depends on the number of distinct groups and not on the size of the input.
+    """
+
+    def __init__(self):
+        self.employees_by_company = None
+        self.employees_by_activity = None
+        self.rows = 0
+
+    def update(self, chunk):
+        """
+        Adds the employees of a chunk to the counters.
+        Args:
+            chunk (pd.DataFrame): Employees, with at least the REPORT_COLUMNS.
+        """
+        self.rows += len(chunk)
+        self._add(
+            chunk.groupby(COMPANY_REPORT_KEYS, observed=True).size(),
+            # Rows without a leaf activity still count towards the parent subtotals
+            chunk.groupby(ACTIVITY_REPORT_KEYS, dropna=False, observed=True).size())
+
+    def merge(self, other):
+        """
+        Adds the counters of another aggregator to this one.
+        Args:
+            other (ReportAggregator): Aggregator fed with a different part of the input.
+        """
+        self.rows += other.rows
+        if other.employees_by_company is not None:
+            self._add(other.employees_by_company, other.employees_by_activity)
+
+    def _add(self, by_company, by_activity):
+        if self.employees_by_company is None:
+            self.employees_by_company, self.employees_by_activity = by_company, by_activity
+            return
+        self.employees_by_company = self.employees_by_company.add(by_company, fill_value=0)
+        self.employees_by_activity = self.employees_by_activity.add(by_activity, fill_value=0)
+
+    def employees_by_company_report(self):
+        """
+        Returns:
+            pd.DataFrame: Amount of employees by country and company, ordered by country and company.
+        """
+        counts = self.employees_by_company
+        if counts is None:
+            return pd.DataFrame(columns=COMPANY_REPORT_KEYS + ['EMPLOYEES_COUNT'])
+        report = _plain_keys(counts.astype('int64').reset_index(name='EMPLOYEES_COUNT'), COMPANY_REPORT_KEYS)
+        return report.sort_values(by=COMPANY_REPORT_KEYS)
+
+    def companies_by_activity_report(self):
+        """
+        Returns:
+            pd.DataFrame: Amount of companies by activity, plus a '-' subtotal row for every parent activity,
+                ordered by grand parent activity, parent activity and activity.
+        """
+        counts = self.employees_by_activity
+        if counts is None:
+            return pd.DataFrame(columns=ACTIVITY_REPORT_KEYS + ['COMPANIES_COUNT'])
+        counts = _plain_keys(counts.astype('int64').reset_index(name='COMPANIES_COUNT'), ACTIVITY_REPORT_KEYS)
+        counts = counts.dropna(subset=['ACTIVITY_GRAND_PARENT', 'ACTIVITY_PARENT'])
+
+        # The parent activity subtotals are rolled up from the leaf counts
+        parent_activity_sum = counts.groupby(['ACTIVITY_GRAND_PARENT', 'ACTIVITY_PARENT'], observed=True)['COMPANIES_COUNT'].sum().reset_index()
+        parent_activity_sum['ACTIVITY'] = '-'
+        parent_activity_sum = parent_activity_sum[ACTIVITY_REPORT_KEYS + ['COMPANIES_COUNT']]
+
+        companies_by_activity = counts.dropna(subset=['ACTIVITY'])
+        final_activity_report = pd.concat([companies_by_activity, parent_activity_sum], ignore_index=True)
+        return final_activity_report.sort_values(by=ACTIVITY_REPORT_KEYS)
+
+
+def _plain_keys(report, keys):
+    """Turns categorical key columns into plain values, so reports are ordered by value and not by category."""
+    return report.astype({key: object for key in keys})
+
+
+def generate_reports(employees, output_path, chunksize=DEFAULT_CHUNK_SIZE, cache=None):
     """
     Generates reports based on the processed data.
 
+    The employees data is streamed in chunks and only the running counts are kept, so the reports
+    can be built from files bigger than the available memory.
     Args:
-        employees_file (str): Path to the CSV file containing processed employee data.
+        employees (str or EmployeeDataset): Path to the CSV file containing processed employee data, or the dataset.
         output_path (str): Path to the directory where reports will be saved.
+        chunksize (int, optional): Number of rows read at a time from a file. If None, the file is read at once.
+        cache (BuildCache, optional): Build cache deciding whether the reports are up to date. Defaults to the one of output_path.
+    """
+    normalize_and_report(employees, output_path, chunksize, cache=cache, normalize=False)
+
+
+def _aggregate_chunk(chunk):
+    """Worker task: counts a chunk of the employees data for the reports."""
+    aggregator = ReportAggregator()
+    aggregator.update(chunk)
+    return aggregator
+
+
+def normalize_and_report(employees, output_path, chunksize=DEFAULT_CHUNK_SIZE, table_format=CSV_FORMAT, cache=None,
+                         normalize=True, reports=True):
+    """
+    Normalizes the employee data and generates the reports reading the employees data only once:
+    every chunk is fed both to the normalized tables and to the report counters.
+    Args:
+        employees (str or EmployeeDataset): Path to the CSV file containing processed employee data, or the dataset.
+        output_path (str): Path to the directory where tables and reports will be saved.
+        chunksize (int, optional): Number of rows read at a time from a file. If None, the file is read at once.
+        table_format (str): Format of the normalized tables: CSV_FORMAT, PARQUET_FORMAT or ARROW_FORMAT.
+            Reports are always written as CSV.
+        cache (BuildCache, optional): Build cache deciding which outputs are up to date. Defaults to the one of output_path.
+        normalize (bool): Whether to build the normalized tables.
+        reports (bool): Whether to generate the reports.
     """
     # Ensure the output directory exists
     if not os.path.exists(output_path):
         os.makedirs(output_path)
 
-    df = pd.read_csv(employees_file, sep=",")
-    
-    # **Report 1**: Amount of employees by country, company (Ordered by country and company)
-    employees_by_country_company = df.groupby(['COUNTRY_NAME', 'COMPANY_NAME']).size().reset_index(name='EMPLOYEES_COUNT')
-    employees_by_country_company = employees_by_country_company.sort_values(by=['COUNTRY_NAME', 'COMPANY_NAME'])
-    
-    # Write to CSV
-    employees_by_country_company.to_csv(os.path.join(output_path, 'AMOUNT_EMPLOYEES_BY_COMPANY_COUNTRY.csv'), index=False, sep=";")
-    
-    # **Report 2**: Amount of companies by activities (Ordered by grand parent activity, parent activity, and activity)
-    # Assuming we have company information in the 'COMPANY_NAME' and activities info in 'ACTIVITY_GRAND_PARENT', 'ACTIVITY_PARENT', 'ACTIVITY'
-    companies_by_activity = df.groupby(['ACTIVITY_GRAND_PARENT', 'ACTIVITY_PARENT', 'ACTIVITY']).size().reset_index(name='COMPANIES_COUNT')
-    
-    # Add a row for the parent activities sum (grand parent activity + parent activity without specific activity)
-    parent_activity_sum = df.groupby(['ACTIVITY_GRAND_PARENT', 'ACTIVITY_PARENT']).size().reset_index(name='COMPANIES_COUNT')
-    parent_activity_sum['ACTIVITY'] = '-'
-    parent_activity_sum = parent_activity_sum[['ACTIVITY_GRAND_PARENT', 'ACTIVITY_PARENT', 'ACTIVITY', 'COMPANIES_COUNT']]
-    
-    # Combine both results (companies by activity and parent activity sum)
-    final_activity_report = pd.concat([companies_by_activity, parent_activity_sum], ignore_index=True)
-    final_activity_report = final_activity_report.sort_values(by=['ACTIVITY_GRAND_PARENT', 'ACTIVITY_PARENT', 'ACTIVITY'])
-    
-    # Write to CSV
-    final_activity_report.to_csv(os.path.join(output_path, 'AMOUNT_COMPANIES_BY_ACTIVITIES.csv'), index=False, sep=";")
-
-    print("Reports generated successfully.")
+    dataset = as_employee_dataset(employees, chunksize)
+    cache = cache or BuildCache.in_directory(output_path)
+    inputs = [dataset.path]
+
+    normalizer = EmployeeNormalizer(output_path, table_format, cache, inputs) if normalize else None
+    if normalizer is not None and normalizer.done:
+        normalizer = None
+
+    report_files = [os.path.join(output_path, report) for report in (EMPLOYEES_BY_COMPANY_REPORT, COMPANIES_BY_ACTIVITY_REPORT)]
+    aggregator = None
+    if reports:
+        if all(cache.is_fresh(report_file, inputs) for report_file in report_files):
+            print("Reports are up to date. Skipping.")
+        else:
+            aggregator = ReportAggregator()
+
+    if normalizer is None and aggregator is None:
+        return
+
+    # The reports only need a few columns, so the others are not read when normalization is skipped
+    try:
+        if normalizer is None:
+            # Chunks are counted where they are parsed, so parallel workers only send back their counters
+            with stage("report:aggregate") as metrics:
+                for partial in dataset.map_chunks(_aggregate_chunk, REPORT_COLUMNS):
+                    aggregator.merge(partial)
+                metrics.add(rows=aggregator.rows)
+        else:
+            for chunk in timed_iter("parse", dataset.chunks()):
+                normalizer.update(chunk)
+                if aggregator is not None:
+                    with stage("report:aggregate") as metrics:
+                        aggregator.update(chunk)
+                        metrics.add(rows=len(chunk))
+    except BaseException:
+        if normalizer is not None:
+            normalizer.abort()
+        raise
+
+    if normalizer is not None:
+        normalizer.close()
+        print("Data has been successfully normalized and saved.")
+
+    if aggregator is not None:
+        employees_report_file, activities_report_file = report_files
 
+        # **Report 1**: Amount of employees by country, company (Ordered by country and company)
+        _write_report(aggregator.employees_by_company_report, employees_report_file)
+        cache.record(employees_report_file, inputs)
 
+        # **Report 2**: Amount of companies by activities (Ordered by grand parent activity, parent activity, and activity)
+        _write_report(aggregator.companies_by_activity_report, activities_report_file)
+        cache.record(activities_report_file, inputs)
 
+        print("Reports generated successfully.")
 
 
+def _write_report(build_report, report_file):
+    """Builds a report and saves it atomically, measured as its own instrumentation stage."""
+    with stage("report:" + os.path.splitext(os.path.basename(report_file))[0]) as metrics:
+        report = build_report()
+        with atomic_output(report_file) as temp_file:
+            report.to_csv(temp_file, index=False, sep=";")
+        metrics.add(rows=len(report), bytes_written=os.path.getsize(report_file))
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from build_cache import atomic_output
+
+# Number of segments downloaded in parallel, which is also the size of the connection pool
+DEFAULT_WORKERS = 8
+# Size of every HTTP Range segment
+DEFAULT_SEGMENT_SIZE = 8 * 1024 * 1024
+# Size of the blocks read from the responses
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Attempts per segment before giving up, and HTTP statuses retried by the connection pool
+DEFAULT_RETRIES = 5
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+# An ETag made of a plain MD5 digest (S3 objects not uploaded in parts)
+MD5_ETAG = re.compile(r'^"?([0-9a-f]{32})"?$')
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+def make_session(pool_size=DEFAULT_WORKERS, retries=DEFAULT_RETRIES):
+    """
+    Creates a session whose pooled connections are reused by every segment and retried with backoff.
+    Args:
+        pool_size (int): Maximum number of connections kept open per host.
+        retries (int): Retries for failed connections and the RETRY_STATUSES.
+    Returns:
+        requests.Session: The session.
+    """
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=RETRY_STATUSES,
+                  allowed_methods=["GET"], raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def open_url_stream(url, session=None):
+    """
+    Opens a streaming GET request, so the body can be consumed as a file without saving it first.
+    Use it as a context manager and read from `response.raw`.
+    Args:
+        url (str): URL to open.
+        session (requests.Session, optional): Session to use.
+    Returns:
+        requests.Response: The open response.
+    """
+    response = (session or make_session(pool_size=1)).get(url, stream=True)
+    response.raise_for_status()
+    response.raw.decode_content = True
+    return response
+
+
+class RangedDownloader:
+    """
+    Downloads a file in parallel HTTP Range segments over a pooled session.
+
+    Progress is kept in a sidecar state file next to the partial download, so an interrupted transfer
+    resumes with the segments still missing. The result is checked against the expected size and, when
+    available, against the given SHA-256 or the MD5 ETag of the server, and is only moved into place
+    once verified. Servers without Range support are downloaded in a single stream.
+    """
+
+    def __init__(self, url, local_filename, workers=DEFAULT_WORKERS, segment_size=DEFAULT_SEGMENT_SIZE,
+                 expected_sha256=None, retries=DEFAULT_RETRIES, session=None):
+        """
+        Args:
+            url (str): URL of the file to download.
+            local_filename (str): Local filename where the downloaded file will be saved.
+            workers (int): Number of segments downloaded in parallel.
+            segment_size (int): Size in bytes of every segment.
+            expected_sha256 (str, optional): SHA-256 hex digest the file must have.
+            retries (int): Attempts per segment.
+            session (requests.Session, optional): Session to use. A pooled one is created by default.
+        """
+        self.url = url
+        self.local_filename = local_filename
+        self.workers = workers
+        self.segment_size = segment_size
+        self.expected_sha256 = expected_sha256
+        self.retries = retries
+        self.session = session or make_session(pool_size=workers)
+        self.part_file = local_filename + ".part"
+        self.state_file = local_filename + ".part.json"
+        self._lock = threading.Lock()
+
+    def download(self):
+        """
+        Downloads the file, resuming a previous attempt if its state matches the remote file.
+        Raises:
+            IOError: If the downloaded file does not match the expected size or checksum.
+        """
+        response = self.session.get(self.url, headers={'Range': 'bytes=0-0'}, stream=True)
+        response.raise_for_status()
+        content_range = CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+        etag = response.headers.get('ETag')
+
+        if response.status_code != 206 or content_range is None or content_range.group(3) == '*':
+            # No Range support: the probe response already carries the whole body
+            print("Server does not support ranges. Downloading in a single stream.")
+            with response:
+                size = int(response.headers['Content-Length']) if 'Content-Length' in response.headers else None
+                self._download_stream(response)
+        else:
+            response.close()
+            size = int(content_range.group(3))
+            self._download_segments(size, etag)
+
+        self._verify(size, etag)
+        os.replace(self.part_file, self.local_filename)
+        if os.path.exists(self.state_file):
+            os.remove(self.state_file)
+
+    def _download_stream(self, response):
+        with open(self.part_file, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                f.write(chunk)
+
+    def _download_segments(self, size, etag):
+        segments = [(start, min(start + self.segment_size, size) - 1) for start in range(0, size, self.segment_size)]
+        state = self._load_state(size, etag)
+        pending = [segment for index, segment in enumerate(segments) if index not in state['done']]
+        if len(pending) < len(segments):
+            print(f"Resuming download: {len(segments) - len(pending)} of {len(segments)} segments already done.")
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # Consuming the results re-raises the first failure
+            for _ in executor.map(lambda segment: self._download_segment(segment, state), pending):
+                pass
+
+    def _load_state(self, size, etag):
+        """Returns the saved progress if it belongs to the same remote file, or starts a new download."""
+        state = {'url': self.url.split('?')[0], 'size': size, 'etag': etag, 'segment_size': self.segment_size, 'done': []}
+        if os.path.exists(self.state_file) and os.path.exists(self.part_file):
+            with open(self.state_file, encoding='utf-8') as f:
+                saved = json.load(f)
+            if {key: saved.get(key) for key in state if key != 'done'} == {key: state[key] for key in state if key != 'done'}:
+                state['done'] = saved['done']
+        state['done'] = set(state['done'])
+
+        if not state['done']:
+            with open(self.part_file, 'wb') as f:
+                f.truncate(size)
+        return state
+
+    def _download_segment(self, segment, state):
+        start, end = segment
+        for attempt in range(1, self.retries + 1):
+            try:
+                with self.session.get(self.url, headers={'Range': f'bytes={start}-{end}'}, stream=True) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise IOError(f"Expected a partial response for bytes {start}-{end}, got {response.status_code}")
+                    written = 0
+                    with open(self.part_file, 'r+b') as f:
+                        f.seek(start)
+                        for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                            f.write(chunk)
+                            written += len(chunk)
+                if written != end - start + 1:
+                    raise IOError(f"Incomplete segment {start}-{end}: got {written} bytes")
+                break
+            except (requests.RequestException, IOError) as e:
+                if attempt == self.retries:
+                    raise
+                print(f"Segment {start}-{end} failed ({e}). Retrying ({attempt}/{self.retries}).")
+                time.sleep(0.5 * 2 ** (attempt - 1))
+
+        with self._lock:
+            state['done'].add(start // self.segment_size)
+            self._save_state(state)
+
+    def _save_state(self, state):
+        with atomic_output(self.state_file) as temp_file:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({**state, 'done': sorted(state['done'])}, f)
+
+    def _verify(self, size, etag):
+        """Checks the partial file against the expected size and checksum, discarding it if it does not match."""
+        actual_size = os.path.getsize(self.part_file)
+        error = None
+        if size is not None and actual_size != size:
+            error = f"expected {size} bytes, got {actual_size}"
+        elif self.expected_sha256:
+            digest = _file_digest(self.part_file, hashlib.sha256())
+            if digest != self.expected_sha256.lower():
+                error = f"SHA-256 {digest} does not match {self.expected_sha256}"
+        elif etag and MD5_ETAG.match(etag):
+            digest = _file_digest(self.part_file, hashlib.md5())
+            if digest != MD5_ETAG.match(etag).group(1):
+                error = f"MD5 {digest} does not match the ETag {etag}"
+        if error:
+            os.remove(self.part_file)
+            if os.path.exists(self.state_file):
+                os.remove(self.state_file)
+            raise IOError(f"Downloaded file {self.local_filename} is corrupt: {error}")
+
+
+def _file_digest(path, digest):
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,422 @@
+"""
+Spatial index and density reports over the coordinates of the companies (LAT and LNG of the normalized Company
+table) and of the properties crawled by challenge-1 (latitude and longitude of its CSV output).
+
+Points are bucketed in a regular latitude/longitude grid and sorted by cell, so the points of a row of cells
+are a contiguous slice found with a binary search. Radius queries only compute the haversine distance to the
+points of the cells overlapping the bounding box of the circle, and k-nearest queries widen a radius estimated
+from the density around the location until it holds k points. Density reports count the points of every
+geohash cell.
+
+Usage (from the repository root):
+    python challenge-2/geo_index.py --companies challenge-2/resources/csv/Company.csv \\
+        --properties challenge-1/booking_properties_output.csv --report challenge-2/resources/csv/DENSITY_BY_GEOHASH.csv
+    python challenge-2/geo_index.py --companies challenge-2/resources/csv/Company.csv --near 40.4168 -3.7038 --k 10
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from build_cache import atomic_output
+from io_utils import DEFAULT_CHUNK_SIZE, read_table_chunks
+
+# Mean radius of the Earth
+EARTH_RADIUS_KM = 6371.0088
+# Kilometers per degree of latitude
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+# Side in degrees of the cells of the grid index. Smaller cells check fewer points per query but need more
+# binary searches for large radiuses
+DEFAULT_CELL_DEGREES = 0.1
+
+# Geohash cells of the density reports. Precision 5 cells are about 5 x 5 km at the equator
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+DEFAULT_GEOHASH_PRECISION = 5
+# Geohashes longer than this do not fit in 64 bits
+MAX_GEOHASH_PRECISION = 12
+
+# Columns read from the normalized Company table and from the output of the crawler
+COMPANY_COLUMNS = ["ID", "COMPANY_NAME", "LAT", "LNG"]
+PROPERTY_COLUMNS = ["name", "latitude", "longitude", "url"]
+
+DENSITY_REPORT = "DENSITY_BY_GEOHASH.csv"
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance between points, vectorized: every argument may be a scalar or an array, and they are
+    broadcast against each other.
+    Args:
+        lat1, lng1: Coordinates of the first points, in degrees.
+        lat2, lng2: Coordinates of the second points, in degrees.
+    Returns:
+        np.ndarray or float: Distances in kilometers.
+    """
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lng1, lat2, lng2))
+    return _haversine_radians(lat1, lng1, np.cos(lat1), lat2, lng2, np.cos(lat2))
+
+
+def _haversine_radians(lat1, lng1, cos_lat1, lat2, lng2, cos_lat2):
+    """Haversine distance in kilometers of coordinates in radians, with the cosines of their latitudes given."""
+    a = np.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos_lat2 * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class GeoIndex:
+    """
+    Grid index of points for radius and k-nearest queries by haversine distance.
+
+    The points are sorted by the cell of a regular grid of cell_degrees x cell_degrees that contains them, and
+    their coordinates are kept in radians with the cosine of their latitude, so a query only computes a few
+    sines per candidate point. Queries return positions in the arrays the index was built from.
+    """
+
+    def __init__(self, lat, lng, cell_degrees=DEFAULT_CELL_DEGREES):
+        """
+        Args:
+            lat (array-like): Latitudes of the points, in degrees.
+            lng (array-like): Longitudes of the points, in degrees.
+            cell_degrees (float): Side of the cells of the grid, in degrees.
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        if lat.shape != lng.shape or lat.ndim != 1:
+            raise ValueError("Latitudes and longitudes must be one-dimensional arrays of the same length")
+        if not (np.all(np.abs(lat) <= 90) and np.all(np.abs(lng) <= 180)):
+            raise ValueError("Coordinates must be valid latitudes and longitudes, without missing values")
+        self.cell_degrees = cell_degrees
+        self._rows = int(np.ceil(180 / cell_degrees))
+        self._columns = int(np.ceil(360 / cell_degrees))
+
+        keys = self._row(lat) * self._columns + self._column(lng)
+        order = np.argsort(keys, kind="stable")
+        # Position of every sorted point in the input arrays
+        self.positions = order
+        self._keys = keys[order]
+        self._lat = np.radians(lat[order])
+        self._lng = np.radians(lng[order])
+        self._cos_lat = np.cos(self._lat)
+
+    @classmethod
+    def from_frame(cls, frame, lat_column, lng_column, cell_degrees=DEFAULT_CELL_DEGREES):
+        """
+        Returns the index of the coordinates of a frame. Query results are positions of its rows, for `iloc`.
+        Args:
+            frame (pd.DataFrame): Frame with valid coordinates, e.g. as returned by `load_points`.
+            lat_column (str): Column of the latitudes.
+            lng_column (str): Column of the longitudes.
+            cell_degrees (float): Side of the cells of the grid, in degrees.
+        """
+        return cls(frame[lat_column].to_numpy(), frame[lng_column].to_numpy(), cell_degrees)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def query_radius(self, lat, lng, radius_km):
+        """
+        Finds the points within a distance of a location.
+        Args:
+            lat (float): Latitude of the location, in degrees.
+            lng (float): Longitude of the location, in degrees.
+            radius_km (float): Maximum distance, in kilometers.
+        Returns:
+            tuple: Positions of the points and their distances in kilometers, nearest first.
+        """
+        return self._sorted(*self._within(lat, lng, radius_km))
+
+    def query_knn(self, lat, lng, k):
+        """
+        Finds the k points nearest to a location.
+        Args:
+            lat (float): Latitude of the location, in degrees.
+            lng (float): Longitude of the location, in degrees.
+            k (int): Number of points.
+        Returns:
+            tuple: Positions of the points and their distances in kilometers, nearest first. Fewer than k if
+                the index holds fewer points.
+        """
+        if k <= 0 or not len(self):
+            return self._sorted(np.empty(0, dtype=np.int64), np.empty(0))
+        # Every point found within a radius is nearer than the ones outside it, so the radius is doubled until
+        # it holds k points, starting from the one that would hold them at the density of the cell of the location
+        radius_km = self._expected_radius(lat, lng, k)
+        max_radius_km = np.pi * EARTH_RADIUS_KM
+        while True:
+            indices, distances = self._within(lat, lng, radius_km)
+            if len(indices) >= k or radius_km >= max_radius_km:
+                break
+            radius_km = min(radius_km * 2, max_radius_km)
+        if len(indices) > k:
+            nearest = np.argpartition(distances, k - 1)[:k]
+            indices, distances = indices[nearest], distances[nearest]
+        return self._sorted(indices, distances)
+
+    def _within(self, lat, lng, radius_km):
+        """Returns the indices of the sorted points within radius_km of the location, and their distances."""
+        indices = self._candidates(lat, lng, radius_km)
+        lat_rad, lng_rad = np.radians(lat), np.radians(lng)
+        distances = _haversine_radians(lat_rad, lng_rad, np.cos(lat_rad), self._lat[indices], self._lng[indices],
+                                       self._cos_lat[indices])
+        inside = distances <= radius_km
+        return indices[inside], distances[inside]
+
+    def _sorted(self, indices, distances):
+        """Returns the input positions of the sorted points and their distances, nearest first."""
+        order = np.argsort(distances, kind="stable")
+        return self.positions[indices[order]], distances[order]
+
+    def _expected_radius(self, lat, lng, k):
+        """Returns the radius that would hold k points if they were spread like in the cell of the location."""
+        cell_km = self.cell_degrees * KM_PER_DEGREE
+        key = self._row(lat) * self._columns + self._column(lng)
+        count = np.searchsorted(self._keys, key, side="right") - np.searchsorted(self._keys, key, side="left")
+        if not count:
+            return cell_km
+        # Cells narrow towards the poles
+        area = cell_km ** 2 * max(np.cos(np.radians(lat)), 1e-6)
+        return float(np.sqrt(k * area / (np.pi * count)))
+
+    def _row(self, lat):
+        return np.minimum(np.floor((np.asarray(lat) + 90) / self.cell_degrees), self._rows - 1).astype(np.int64)
+
+    def _column(self, lng):
+        # Wrapped around, since 180 and -180 are the same meridian. Integer modulo is much faster than on floats
+        return np.floor((np.asarray(lng) + 180) / self.cell_degrees).astype(np.int64) % self._columns
+
+    def _candidates(self, lat, lng, radius_km):
+        """Returns the sorted indices of the points in the cells overlapping the bounding box of the circle."""
+        angle = radius_km / EARTH_RADIUS_KM
+        if angle >= np.pi:
+            return np.arange(len(self))
+        lat_delta = np.degrees(angle)
+        lat_min, lat_max = max(lat - lat_delta, -90.0), min(lat + lat_delta, 90.0)
+        rows = np.arange(self._row(lat_min), self._row(lat_max) + 1)
+
+        # Longitudes spanned by the circle, unless it contains a pole
+        if lat_min <= -90 or lat_max >= 90 or np.sin(angle) >= np.cos(np.radians(lat)):
+            column_ranges = [(0, self._columns - 1)]
+        else:
+            lng_delta = np.degrees(np.arcsin(np.sin(angle) / np.cos(np.radians(lat))))
+            first, last = int(self._column(lng - lng_delta)), int(self._column(lng + lng_delta))
+            if lng_delta >= 180:
+                column_ranges = [(0, self._columns - 1)]
+            elif first <= last:
+                column_ranges = [(first, last)]
+            else:
+                # The box crosses the antimeridian
+                column_ranges = [(first, self._columns - 1), (0, last)]
+
+        # The cells of a row between two columns are consecutive keys, so their points are a single slice
+        starts = np.concatenate([rows * self._columns + first for first, _ in column_ranges])
+        ends = np.concatenate([rows * self._columns + last for _, last in column_ranges])
+        lows = np.searchsorted(self._keys, starts, side="left")
+        highs = np.searchsorted(self._keys, ends, side="right")
+        slices = [np.arange(low, high) for low, high in zip(lows.tolist(), highs.tolist()) if high > low]
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+
+def geohash_cells(lat, lng, precision=DEFAULT_GEOHASH_PRECISION):
+    """
+    Geohash cells of points, vectorized, as the integers whose base 32 digits are the geohash characters.
+    Integers sort like the geohashes they encode.
+    Args:
+        lat (array-like): Latitudes, in degrees.
+        lng (array-like): Longitudes, in degrees.
+        precision (int): Characters of the geohashes, from 1 to MAX_GEOHASH_PRECISION.
+    Returns:
+        np.ndarray: Cell of every point, as uint64.
+    """
+    if not 1 <= precision <= MAX_GEOHASH_PRECISION:
+        raise ValueError(f"Geohash precision must be between 1 and {MAX_GEOHASH_PRECISION}, got {precision}")
+    lat_bits, lng_bits = _geohash_bits(precision)
+    lat_cells = _quantize(lat, -90.0, 180.0, lat_bits)
+    lng_cells = _quantize(lng, -180.0, 360.0, lng_bits)
+    cells = np.zeros(lat_cells.shape, dtype=np.uint64)
+    # Bits alternate between longitude and latitude, starting with the most significant bit of the longitude
+    for bit in range(lat_bits + lng_bits):
+        source, bits = (lng_cells, lng_bits) if bit % 2 == 0 else (lat_cells, lat_bits)
+        shift = np.uint64(bits - 1 - bit // 2)
+        cells = (cells << np.uint64(1)) | ((source >> shift) & np.uint64(1))
+    return cells
+
+
+def geohash_strings(cells, precision=DEFAULT_GEOHASH_PRECISION):
+    """
+    Args:
+        cells (np.ndarray): Cells returned by `geohash_cells` with the same precision.
+        precision (int): Characters of the geohashes.
+    Returns:
+        np.ndarray: The geohash of every cell, as strings.
+    """
+    cells = np.asarray(cells, dtype=np.uint64)
+    shifts = (5 * np.arange(precision - 1, -1, -1)).astype(np.uint64)
+    digits = (cells[:, None] >> shifts) & np.uint64(31)
+    alphabet = np.frombuffer(GEOHASH_ALPHABET.encode("ascii"), dtype=np.uint8)
+    characters = np.ascontiguousarray(alphabet[digits.astype(np.intp)])
+    return characters.view(f"S{precision}").ravel().astype(str)
+
+
+def geohash_encode(lat, lng, precision=DEFAULT_GEOHASH_PRECISION):
+    """
+    Args:
+        lat (array-like): Latitudes, in degrees.
+        lng (array-like): Longitudes, in degrees.
+        precision (int): Characters of the geohashes.
+    Returns:
+        np.ndarray: The geohash of every point, as strings.
+    """
+    lat, lng = np.atleast_1d(lat), np.atleast_1d(lng)
+    return geohash_strings(geohash_cells(lat, lng, precision), precision)
+
+
+def geohash_centers(cells, precision=DEFAULT_GEOHASH_PRECISION):
+    """
+    Args:
+        cells (np.ndarray): Cells returned by `geohash_cells` with the same precision.
+        precision (int): Characters of the geohashes.
+    Returns:
+        tuple: Latitudes and longitudes of the centers of the cells, in degrees.
+    """
+    cells = np.asarray(cells, dtype=np.uint64)
+    lat_bits, lng_bits = _geohash_bits(precision)
+    lat_cells = np.zeros(cells.shape, dtype=np.uint64)
+    lng_cells = np.zeros(cells.shape, dtype=np.uint64)
+    total_bits = lat_bits + lng_bits
+    for bit in range(total_bits):
+        value = (cells >> np.uint64(total_bits - 1 - bit)) & np.uint64(1)
+        if bit % 2 == 0:
+            lng_cells = (lng_cells << np.uint64(1)) | value
+        else:
+            lat_cells = (lat_cells << np.uint64(1)) | value
+    lat = -90.0 + (lat_cells + 0.5) * (180.0 / 2 ** lat_bits)
+    lng = -180.0 + (lng_cells + 0.5) * (360.0 / 2 ** lng_bits)
+    return lat, lng
+
+
+def _geohash_bits(precision):
+    """Returns the bits of the latitude and of the longitude in a geohash of the given precision."""
+    bits = 5 * precision
+    return bits // 2, (bits + 1) // 2
+
+
+def _quantize(values, start, extent, bits):
+    """Returns the interval of 2 ** bits equal intervals of [start, start + extent] containing every value."""
+    intervals = 2 ** bits
+    index = np.floor((np.asarray(values, dtype=np.float64) - start) / extent * intervals)
+    return np.clip(index, 0, intervals - 1).astype(np.uint64)
+
+
+def load_points(path, columns, lat_column, lng_column, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Reads the points of a CSV, Parquet or Arrow IPC table, dropping the rows without valid coordinates.
+    Args:
+        path (str): Path of the table. Its extension sets the format.
+        columns (list): Columns to read, including the coordinates.
+        lat_column (str): Column of the latitudes.
+        lng_column (str): Column of the longitudes.
+        chunksize (int, optional): Rows read at a time.
+    Returns:
+        pd.DataFrame: The rows with valid coordinates, as float64, with a fresh index.
+    """
+    frame = pd.concat(read_table_chunks(path, columns=columns, chunksize=chunksize), ignore_index=True)
+    for column in (lat_column, lng_column):
+        frame[column] = pd.to_numeric(frame[column], errors="coerce").astype(np.float64)
+    valid = frame[lat_column].between(-90, 90) & frame[lng_column].between(-180, 180)
+    return frame[valid].reset_index(drop=True)
+
+
+def load_companies(path, chunksize=DEFAULT_CHUNK_SIZE):
+    """Reads the ID, name and coordinates of the companies of a normalized Company table."""
+    return load_points(path, COMPANY_COLUMNS, "LAT", "LNG", chunksize)
+
+
+def load_properties(path, chunksize=DEFAULT_CHUNK_SIZE):
+    """Reads the name, coordinates and URL of the properties exported by the crawler."""
+    return load_points(path, PROPERTY_COLUMNS, "latitude", "longitude", chunksize)
+
+
+def density_report(points, precision=DEFAULT_GEOHASH_PRECISION):
+    """
+    Counts the points of every geohash cell.
+    Args:
+        points (dict): Tuples (latitudes, longitudes) of every set of points, by name, e.g. {"COMPANIES": ...}.
+        precision (int): Characters of the geohashes.
+    Returns:
+        pd.DataFrame: GEOHASH, LAT and LNG of the center of every cell with points, and a <NAME>_COUNT column
+            per set of points, ordered by geohash.
+    """
+    counts = []
+    for name, (lat, lng) in points.items():
+        cells, cell_counts = np.unique(geohash_cells(lat, lng, precision), return_counts=True)
+        counts.append(pd.Series(cell_counts, index=cells, name=f"{name}_COUNT"))
+    count_columns = [series.name for series in counts]
+    if not counts or all(series.empty for series in counts):
+        return pd.DataFrame(columns=["GEOHASH", "LAT", "LNG"] + count_columns)
+    report = pd.concat(counts, axis=1).fillna(0).astype("int64").sort_index()
+    cells = report.index.to_numpy(dtype=np.uint64)
+    lat, lng = geohash_centers(cells, precision)
+    report.insert(0, "GEOHASH", geohash_strings(cells, precision))
+    report.insert(1, "LAT", np.round(lat, 6))
+    report.insert(2, "LNG", np.round(lng, 6))
+    return report.reset_index(drop=True)
+
+
+def write_density_report(report, report_file):
+    """Saves a density report atomically, ';' separated like the other reports."""
+    directory = os.path.dirname(report_file)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with atomic_output(report_file) as temp_file:
+        report.to_csv(temp_file, index=False, sep=";")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", metavar="FILE", help="Normalized Company table (CSV, Parquet or Arrow).")
+    parser.add_argument("--properties", metavar="FILE", help="Properties exported by the crawler (CSV or Parquet).")
+    parser.add_argument("--cell-degrees", type=float, default=DEFAULT_CELL_DEGREES, help="Side of the grid cells.")
+    parser.add_argument("--report", metavar="FILE", help=f"Save the density report, e.g. {DENSITY_REPORT}.")
+    parser.add_argument("--precision", type=int, default=DEFAULT_GEOHASH_PRECISION,
+                        help="Characters of the geohash cells of the report.")
+    parser.add_argument("--near", type=float, nargs=2, metavar=("LAT", "LNG"), help="Location to search around.")
+    parser.add_argument("--radius", type=float, metavar="KM", help="Find the points within this distance of --near.")
+    parser.add_argument("--k", type=int, default=10, help="Find the k points nearest to --near, or show the k "
+                                                          "nearest within --radius.")
+    args = parser.parse_args()
+    if not args.companies and not args.properties:
+        parser.error("At least one of --companies and --properties is required")
+
+    sets = {}
+    if args.companies:
+        sets["COMPANIES"] = (load_companies(args.companies), "LAT", "LNG", "COMPANY_NAME")
+    if args.properties:
+        sets["PROPERTIES"] = (load_properties(args.properties), "latitude", "longitude", "name")
+
+    if args.report:
+        report = density_report({name: (frame[lat].to_numpy(), frame[lng].to_numpy())
+                                 for name, (frame, lat, lng, _) in sets.items()}, args.precision)
+        write_density_report(report, args.report)
+        print(f"Density report of {len(report):,} cells saved to {args.report}")
+
+    if args.near:
+        lat, lng = args.near
+        for name, (frame, lat_column, lng_column, label) in sets.items():
+            start = time.perf_counter()
+            index = GeoIndex.from_frame(frame, lat_column, lng_column, args.cell_degrees)
+            print(f"{name}: {len(index):,} points indexed in {time.perf_counter() - start:.2f} s")
+            start = time.perf_counter()
+            if args.radius is not None:
+                positions, distances = index.query_radius(lat, lng, args.radius)
+                print(f"{len(positions):,} within {args.radius} km", end="")
+            else:
+                positions, distances = index.query_knn(lat, lng, args.k)
+                print(f"{len(positions):,} nearest", end="")
+            print(f" in {(time.perf_counter() - start) * 1000:.3f} ms")
+            for position, distance in zip(positions[:args.k], distances[:args.k]):
+                print(f"  {distance:10.3f} km  {frame[label].iloc[position]}")
+
+
+if __name__ == '__main__':
+    main()
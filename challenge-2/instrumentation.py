@@ -0,0 +1,284 @@
+"""
+Lightweight instrumentation of the pipeline stages.
+
+Stages are timed with `stage(name)` and counters are added to the innermost open stage with `count(...)`.
+Nothing is recorded until `enable()` is called: until then both are no-ops, so instrumented code runs at
+full speed. Only the main process is measured, the work done by worker processes is not included.
+"""
+import cProfile
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+from build_cache import atomic_output
+
+# Path where Linux resets the peak resident memory of the process when "5" is written to it
+CLEAR_REFS_FILE = "/proc/self/clear_refs"
+STATUS_FILE = "/proc/self/status"
+
+PROFILERS = ["cprofile", "pyinstrument"]
+
+# Metrics being recorded, None when disabled
+_active = None
+
+
+class StageMetrics:
+    """Totals of a stage over all the times it ran."""
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.calls = 0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.rows = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.peak_rss_mib = 0.0
+
+    def add(self, rows=0, bytes_read=0, bytes_written=0):
+        """Adds to the counters of the stage."""
+        self.rows += rows
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "calls": self.calls,
+            "wall_s": round(self.wall_s, 6),
+            "cpu_s": round(self.cpu_s, 6),
+            "rows": self.rows,
+            "rows_per_s": round(self.rows / self.wall_s) if self.wall_s else None,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "peak_rss_mib": round(self.peak_rss_mib, 1),
+        }
+
+
+class RunMetrics:
+    """
+    Metrics of a pipeline run: wall and CPU time, rows, bytes and peak memory of every stage.
+
+    Stages may be nested and entered several times, e.g. once per chunk; their totals are accumulated under
+    the same name. Peak memory is the peak resident memory while the stage was open. On Linux the peak is
+    reset when a stage starts, so it is specific to the stage; elsewhere it is the peak of the whole process.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._open = []
+        self._started = time.perf_counter()
+        self._started_cpu = time.process_time()
+        self._start_time = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measures the enclosed block as the stage name.
+        Yields:
+            StageMetrics: The stage, to add counters to.
+        """
+        metrics = self.stages.get(name)
+        if metrics is None:
+            metrics = self.stages[name] = StageMetrics(name, self._open[-1].name if self._open else None)
+        # Close the peak of the enclosing stages before resetting it for this one
+        peak = peak_rss_mib()
+        for open_stage in self._open:
+            open_stage.peak_rss_mib = max(open_stage.peak_rss_mib, peak)
+        _reset_peak_rss()
+
+        self._open.append(metrics)
+        start, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield metrics
+        finally:
+            metrics.wall_s += time.perf_counter() - start
+            metrics.cpu_s += time.process_time() - start_cpu
+            metrics.calls += 1
+            self._open.pop()
+            peak = peak_rss_mib()
+            for open_stage in self._open + [metrics]:
+                open_stage.peak_rss_mib = max(open_stage.peak_rss_mib, peak)
+
+    def count(self, rows=0, bytes_read=0, bytes_written=0):
+        """Adds to the counters of the innermost open stage, if any."""
+        if self._open:
+            self._open[-1].add(rows, bytes_read, bytes_written)
+
+    def report(self):
+        """
+        Returns:
+            dict: The run report, with the totals of the run and of every stage in the order they started.
+        """
+        return {
+            "started": self._start_time,
+            "wall_s": round(time.perf_counter() - self._started, 6),
+            "cpu_s": round(time.process_time() - self._started_cpu, 6),
+            "peak_rss_mib": round(max([peak_rss_mib()] + [stage.peak_rss_mib for stage in self.stages.values()]), 1),
+            "stages": [stage.as_dict() for stage in self.stages.values()],
+        }
+
+    def save(self, path):
+        """Writes the run report as JSON."""
+        with atomic_output(path) as temp_path:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.report(), f, indent=2)
+
+    def print_summary(self):
+        """Prints a table with the metrics of every stage."""
+        print(f"{'Stage':<52}{'Calls':>7}{'Wall s':>10}{'CPU s':>10}{'Rows':>12}{'MiB read':>10}{'MiB written':>12}{'Peak MiB':>10}")
+        for stage in self.stages.values():
+            name = "  " * self._depth(stage) + stage.name
+            print(f"{name:<52}{stage.calls:>7}{stage.wall_s:>10.2f}{stage.cpu_s:>10.2f}{stage.rows:>12,}"
+                  f"{stage.bytes_read / 2 ** 20:>10.1f}{stage.bytes_written / 2 ** 20:>12.1f}{stage.peak_rss_mib:>10.1f}")
+
+    def _depth(self, stage):
+        depth = 0
+        while stage.parent is not None:
+            stage = self.stages[stage.parent]
+            depth += 1
+        return depth
+
+
+class _NullStage:
+    """Stage used while disabled, doing nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add(self, rows=0, bytes_read=0, bytes_written=0):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+# Marks the end of the iterator in timed_iter
+_END = object()
+
+
+def enable():
+    """
+    Starts recording metrics.
+    Returns:
+        RunMetrics: The metrics being recorded.
+    """
+    global _active
+    _active = RunMetrics()
+    return _active
+
+
+def disable():
+    """Stops recording metrics."""
+    global _active
+    _active = None
+
+
+def stage(name):
+    """
+    Context manager measuring the enclosed block as the stage name, yielding the stage to add counters to.
+    Does nothing while disabled.
+    """
+    return _NULL_STAGE if _active is None else _active.stage(name)
+
+
+def count(rows=0, bytes_read=0, bytes_written=0):
+    """Adds to the counters of the innermost open stage. Does nothing while disabled."""
+    if _active is not None:
+        _active.count(rows, bytes_read, bytes_written)
+
+
+def timed_iter(name, iterable, rows=len):
+    """
+    Measures the time spent producing every item of iterable, e.g. parsing chunks, as the stage name.
+    Args:
+        name (str): Name of the stage.
+        iterable (iterable): Items to yield.
+        rows (callable, optional): Returns the rows of an item, counted for the stage. None counts nothing.
+    Returns:
+        The items of iterable. While disabled, iterable itself.
+    """
+    if _active is None:
+        return iterable
+    return _timed_iter(name, iter(iterable), rows)
+
+
+def _timed_iter(name, iterator, rows):
+    while True:
+        with stage(name) as metrics:
+            item = next(iterator, _END)
+            if item is not _END and rows is not None:
+                metrics.add(rows=rows(item))
+        if item is _END:
+            return
+        yield item
+
+
+@contextmanager
+def profile(path, profiler="cprofile"):
+    """
+    Profiles the enclosed block and saves the profile to path.
+    Args:
+        path (str): Output file. cProfile profiles are saved in pstats format; pyinstrument ones as HTML if
+            the path ends in .html, or as text otherwise.
+        profiler (str): "cprofile" or "pyinstrument" (which must be installed).
+    """
+    if profiler == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+    elif profiler == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError as e:
+            raise ImportError("The pyinstrument profiler is not installed. Install it with: pip install pyinstrument") from e
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html() if path.endswith(".html") else profiler.output_text())
+    else:
+        raise ValueError(f"Unknown profiler: {profiler}. Expected one of {PROFILERS}")
+    print(f"Profile saved to {path}")
+
+
+def peak_rss_mib():
+    """
+    Returns the peak resident memory of the current process in MiB.
+    VmHWM is preferred over ru_maxrss because the latter is inherited from the parent across fork/exec.
+    """
+    try:
+        with open(STATUS_FILE) as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        # Windows has neither /proc nor getrusage
+        return 0.0
+    # ru_maxrss is reported in KiB on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 2 ** 20 if sys.platform == "darwin" else maxrss / 1024
+
+
+def _reset_peak_rss():
+    """Resets the peak resident memory of the process to the current one, where supported (Linux)."""
+    try:
+        with open(CLEAR_REFS_FILE, 'w') as f:
+            f.write("5")
+    except OSError:
+        pass
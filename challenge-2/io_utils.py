@@ -1,67 +1,586 @@
+import io
 import os
+import shutil
 import tarfile
+from urllib.parse import urlsplit
 import pandas as pd
-import requests
+from build_cache import BuildCache, partial_path
+from downloader import DEFAULT_WORKERS, RangedDownloader, open_url_stream
+from instrumentation import count
+from parallel import concat_categoricals, map_csv_ranges
 
 EMPLOYEES_HEADER = ["EMPLOYEE_NAME", "EMPLOYEE_EMAIL", "JOB_NAME", "JOB_TYPE", "COMPANY_NAME", "TAX_ID",
                   "ACTIVITY", "ACTIVITY_PARENT", "ACTIVITY_GRAND_PARENT", "LAT", "LNG", "CONTINENT", "COUNTRY_NAME", "ISO2_CODE"]
 
-def download_file(url, local_filename):
+# Explicit types of the employees columns: text columns are categorical, coordinates are numeric
+EMPLOYEES_DTYPES = {column: "category" for column in EMPLOYEES_HEADER}
+EMPLOYEES_DTYPES.update({"LAT": "float64", "LNG": "float64"})
+
+# Default number of rows held in memory at once when streaming the employees file
+DEFAULT_CHUNK_SIZE = 100_000
+
+# Formats for the intermediate and normalized tables. Parquet and Arrow IPC need pyarrow.
+CSV_FORMAT = "csv"
+PARQUET_FORMAT = "parquet"
+ARROW_FORMAT = "arrow"
+TABLE_EXTENSIONS = {CSV_FORMAT: ".csv", PARQUET_FORMAT: ".parquet", ARROW_FORMAT: ".arrow"}
+
+# Size of the read buffer over the employees member of the archive
+STREAM_BUFFER_SIZE = 1024 * 1024
+
+# Member of the archive with the employees data, and the name it is extracted with
+EMPLOYEES_MEMBER = "employee.csv"
+RAW_EMPLOYEES_FILE = "raw_employee.csv"
+
+def download_file(url, local_filename, cache=None, workers=DEFAULT_WORKERS, expected_sha256=None):
     """
     Downloads a file from the given URL and saves it as local_filename.
+
+    The file is fetched in parallel HTTP Range segments and verified before being moved into place.
+    An interrupted download resumes from where it stopped on the next call.
     Args:
         url (str): URL of the file to download.
         local_filename (str): Local filename where the downloaded file will be saved.
+        cache (BuildCache, optional): Build cache deciding whether the file is up to date.
+            Defaults to the one of the directory of local_filename.
+        workers (int): Number of segments downloaded in parallel.
+        expected_sha256 (str, optional): SHA-256 hex digest the file must have.
     """
-
-    # Check if file already exists
-    if os.path.exists(local_filename):
-        print(f"{local_filename} already exists. Skipping download.")
-        return
-    
     # Create the directory if it doesn't exist
     directory = os.path.dirname(local_filename)
-    if not os.path.exists(directory):
+    if directory and not os.path.exists(directory):
         os.makedirs(directory)
         print(f"Directory {directory} created.")
 
-    response = requests.get(url, stream=True)
-    response.raise_for_status()  # Raise an error for bad status
-    with open(local_filename, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
+    # Check if file is already downloaded
+    cache = cache or BuildCache.in_directory(directory)
+    params = {'url': _url_key(url)}
+    # The download does not depend on the pipeline code, only on the remote file
+    if cache.is_fresh(local_filename, params=params, versioned=False):
+        print(f"{local_filename} is up to date. Skipping download.")
+        return
+
+    RangedDownloader(url, local_filename, workers=workers, expected_sha256=expected_sha256).download()
+    count(bytes_written=os.path.getsize(local_filename))
+    cache.record(local_filename, params=params, versioned=False)
     print(f"Downloaded file saved as {local_filename}")
 
-def extract_employees_from_gz_file(gz_file, output_path):
+def extract_employees_from_gz_file(gz_file, output_path, chunksize=None, table_format=CSV_FORMAT, cache=None, workers=1):
     """
     Normalize the data from a gzip file and save it to structured CSV files.
     Args:
         gz_file (str): Path to the compressed file (gzip format).
         output_path (str): Directory path where structured CSV files will be saved.
+        chunksize (int, optional): If set, the employees file is streamed in chunks of this many rows
+            instead of being loaded at once. Bigger chunks use more memory but run faster.
+        table_format (str): Format of the extracted file: CSV_FORMAT, PARQUET_FORMAT or ARROW_FORMAT.
+        cache (BuildCache, optional): Build cache deciding whether the file is up to date.
+            Defaults to the one of output_path.
+        workers (int): Processes parsing the employees data. With more than one, the archive member is
+            decompressed first and then parsed in parallel, line-aligned ranges.
     Returns:
         str: Path to the processed CSV file or None if extraction fails.
     """
+    output_file, _ = _extract_employees(gz_file, output_path, chunksize, table_format, cache, workers)
+    return output_file
+
+
+def load_employees_from_gz_file(gz_file, output_path, chunksize=None, table_format=CSV_FORMAT, cache=None, workers=1):
+    """
+    Extracts the employees data from a gzip file and returns it ready for the processing stages.
+
+    Without chunksize the data is parsed once and the parsed frame is handed straight to the later
+    stages, instead of being read back from the CSV file. With chunksize the stages stream the extracted CSV.
+    Args:
+        gz_file (str): Path to the compressed file (gzip format).
+        output_path (str): Directory path where the raw employees CSV file will be saved.
+        chunksize (int, optional): Rows per chunk when streaming. If None, the data is kept in memory.
+        table_format (str): Format of the extracted file: CSV_FORMAT, PARQUET_FORMAT or ARROW_FORMAT.
+        cache (BuildCache, optional): Build cache deciding whether the file is up to date.
+            Defaults to the one of output_path.
+        workers (int): Processes parsing the employees data. With more than one, the archive member is
+            decompressed first and then parsed in parallel, line-aligned ranges.
+    Returns:
+        EmployeeDataset: The employees data or None if extraction fails.
+    """
+    output_file, df = _extract_employees(gz_file, output_path, chunksize, table_format, cache, workers)
+    return _employee_dataset(output_file, df, chunksize, workers)
+
+
+def load_employees_from_url(url, output_path, chunksize=None, table_format=CSV_FORMAT, cache=None, workers=1):
+    """
+    Same as load_employees_from_gz_file, but the archive is streamed from the URL straight into
+    the extraction, without saving it to a temporary file first.
+    Args:
+        url (str): URL of the compressed file (gzip format).
+        output_path (str): Directory path where the raw employees file will be saved.
+        chunksize (int, optional): Rows per chunk when streaming. If None, the data is kept in memory.
+        table_format (str): Format of the extracted file: CSV_FORMAT, PARQUET_FORMAT or ARROW_FORMAT.
+        cache (BuildCache, optional): Build cache deciding whether the file is up to date.
+            Defaults to the one of output_path.
+        workers (int): Processes parsing the employees data. With more than one, the archive member is
+            decompressed first and then parsed in parallel, line-aligned ranges.
+    Returns:
+        EmployeeDataset: The employees data or None if extraction fails.
+    """
+    output_file, df = _extract_employees(url, output_path, chunksize, table_format, cache, workers)
+    return _employee_dataset(output_file, df, chunksize, workers)
+
+
+def _employee_dataset(output_file, df, chunksize, workers):
+    if output_file is None:
+        return None
+    if df is not None:
+        return EmployeeDataset(output_file, frame=df, workers=workers)
+    # The file was up to date: it is only parsed if a stage still has to read it, which normalize_and_report
+    # decides after checking its outputs against the build cache, so no-op reruns do not parse it at all
+    return EmployeeDataset(output_file, chunksize=chunksize, workers=workers)
+
+
+def _extract_employees(source, output_path, chunksize, table_format, cache, workers):
+    """
+    Extracts the employees file from an archive into output_path, in the given table format.
+    Args:
+        source (str): Path of the archive, or its URL to stream it.
+    Returns:
+        tuple: Path to the processed file (None if not found) and the parsed DataFrame,
+            or None if the data was streamed or the file was up to date.
+    """
     # Ensure the output directory exists
     if not os.path.exists(output_path):
         os.makedirs(output_path)
-    
-    with tarfile.open(gz_file, "r:*") as tar:
-        # Iterate through the files in the tar archive
-        for tar_file in tar.getnames():
-            if tar_file.endswith('employee.csv'):
-                # Check if the file already exists before processing
-                output_file = os.path.join(output_path, f"raw_{tar_file}")
-                if os.path.exists(output_file):
-                    print(f"File {output_file} already exists. Skipping.")
-                    return output_file
-                print(f"Processing file: {tar_file}")
-                # Read the CSV data using pandas
-                with tar.extractfile(tar_file) as file:
-                    # We assume the CSV file is semicolon-separated and has the proper header
-                    df = pd.read_csv(file, header=None, sep=";")
-                    df.columns = EMPLOYEES_HEADER  # Assign the appropriate header based on the CSV type
-                    
-                    df.to_csv(output_file, index=False)  # Save the normalized data as CSV
-                    print(f"Saved normalized data to: {output_file}")
-                    return output_file
-    return None
+    cache = cache or BuildCache.in_directory(output_path)
+
+    is_url = urlsplit(source).scheme in ("http", "https")
+    inputs, params = ([], {'url': _url_key(source)}) if is_url else ([source], None)
+
+    # Check if the file is up to date before processing
+    output_file = os.path.join(output_path, table_file_name(RAW_EMPLOYEES_FILE, table_format))
+    if cache.is_fresh(output_file, inputs, params):
+        print(f"File {output_file} is up to date. Skipping.")
+        return output_file, None
+
+    if is_url:
+        with open_url_stream(source) as response:
+            # Stream mode reads the members sequentially, as the archive arrives
+            with tarfile.open(fileobj=response.raw, mode="r|*") as tar:
+                df = _extract_employees_member(tar, output_file, chunksize, workers)
+    else:
+        with tarfile.open(source, "r:*") as tar:
+            df = _extract_employees_member(tar, output_file, chunksize, workers)
+
+    if df is False:
+        return None, None
+    cache.record(output_file, inputs, params)
+    print(f"Saved normalized data to: {output_file}")
+    return output_file, df
+
+
+def _extract_employees_member(tar, output_file, chunksize, workers):
+    """
+    Writes the employees member of an open archive to output_file.
+    Returns:
+        The parsed DataFrame when not streaming, None when streaming, or False if the member is not found.
+    """
+    # Iterate through the files in the tar archive
+    for member in tar:
+        if member.name.endswith(EMPLOYEES_MEMBER):
+            print(f"Processing file: {member.name}")
+            # Read the CSV data using pandas
+            with io.BufferedReader(_MemberReader(tar.extractfile(member)), buffer_size=STREAM_BUFFER_SIZE) as file:
+                if workers > 1:
+                    return _extract_employees_parallel(file, output_file, chunksize, workers)
+                if chunksize:
+                    stream_employees(file, output_file, chunksize)
+                    return None
+                # We assume the CSV file is semicolon-separated and without header
+                df = pd.read_csv(file, header=None, names=EMPLOYEES_HEADER, sep=";", dtype=EMPLOYEES_DTYPES)
+                write_table(df, output_file)  # Save the normalized data
+                return df
+    return False
+
+
+def _extract_employees_parallel(file, output_file, chunksize, workers):
+    """
+    Writes the employees member to output_file parsing it with several processes.
+    Gzip can only be decompressed as a single stream, so the member is decompressed to a temporary file
+    first, which is then split in line-aligned ranges parsed and converted by the workers.
+    Returns:
+        The parsed DataFrame when not streaming, None when streaming.
+    """
+    decompressed_file = partial_path(output_file) + ".decompressed"
+    try:
+        with open(decompressed_file, 'wb') as decompressed:
+            shutil.copyfileobj(file, decompressed, STREAM_BUFFER_SIZE)
+
+        if chunksize:
+            with TableWriter(output_file, EMPLOYEES_HEADER) as writer:
+                if writer.table_format == CSV_FORMAT:
+                    # Workers return the converted CSV text, so serializing is parallel too
+                    for text in map_csv_ranges(decompressed_file, _to_csv_text, workers, header=False,
+                                               names=EMPLOYEES_HEADER, sep=";", dtype=str):
+                        writer.write_text(text)
+                else:
+                    for chunk in map_csv_ranges(decompressed_file, None, workers, header=False,
+                                                names=EMPLOYEES_HEADER, sep=";", dtype=EMPLOYEES_DTYPES):
+                        writer.write(chunk)
+            return None
+
+        df = concat_categoricals(list(map_csv_ranges(decompressed_file, None, workers, header=False,
+                                                     names=EMPLOYEES_HEADER, sep=";", dtype=EMPLOYEES_DTYPES)),
+                                 EMPLOYEES_DTYPES)
+        write_table(df, output_file)  # Save the normalized data
+        return df
+    finally:
+        if os.path.exists(decompressed_file):
+            os.remove(decompressed_file)
+
+
+def _to_csv_text(chunk):
+    """Worker task: serializes a chunk as CSV rows, without header."""
+    return chunk.to_csv(index=False, header=False)
+
+
+class _MemberReader(io.RawIOBase):
+    """
+    Raw reader over a member of a tar archive. Members of archives opened in stream mode fail when asked
+    whether they are seekable, which pandas does, so they are read through this adapter.
+    """
+
+    def __init__(self, member_file):
+        self._member_file = member_file
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._member_file.read(len(buffer))
+        buffer[:len(data)] = data
+        count(bytes_read=len(data))
+        return len(data)
+
+    def close(self):
+        self._member_file.close()
+        super().close()
+
+
+def _url_key(url):
+    """Returns the URL without query string, since presigned URLs change on every signature."""
+    return urlsplit(url)._replace(query='', fragment='').geturl()
+
+
+def stream_employees(file, output_file, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Copies a semicolon-separated employees file into a table with EMPLOYEES_HEADER, reading and
+    appending one chunk of rows at a time so memory stays flat whatever the input size.
+    Args:
+        file (file-like): Binary file object with the raw employees data (no header).
+        output_file (str): Path of the table to write. Its extension sets the format.
+        chunksize (int): Number of rows read and written per chunk.
+    """
+    if table_format_of(output_file) == CSV_FORMAT:
+        # Values are kept as text so every chunk is written exactly as it was read,
+        # without per-chunk type inference changing how numbers are formatted.
+        dtypes = str
+    else:
+        dtypes = EMPLOYEES_DTYPES
+    reader = pd.read_csv(file, header=None, names=EMPLOYEES_HEADER, sep=";", dtype=dtypes, chunksize=chunksize)
+    with TableWriter(output_file, EMPLOYEES_HEADER) as writer:
+        for chunk in reader:
+            writer.write(chunk)
+
+
+def table_file_name(file_name, table_format):
+    """
+    Args:
+        file_name (str): File name, with or without extension.
+        table_format (str): CSV_FORMAT, PARQUET_FORMAT or ARROW_FORMAT.
+    Returns:
+        str: The file name with the extension of the format.
+    """
+    if table_format not in TABLE_EXTENSIONS:
+        raise ValueError(f"Unknown table format: {table_format}. Expected one of {list(TABLE_EXTENSIONS)}")
+    return os.path.splitext(file_name)[0] + TABLE_EXTENSIONS[table_format]
+
+
+def table_format_of(path):
+    """Returns the table format of a file from its extension."""
+    extension = os.path.splitext(path)[1]
+    for table_format, format_extension in TABLE_EXTENSIONS.items():
+        if extension == format_extension:
+            return table_format
+    raise ValueError(f"Unknown table format for file: {path}")
+
+
+def _import_pyarrow():
+    """Imports pyarrow, which is only needed for the columnar formats."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("The parquet and arrow formats require pyarrow. Install it with: pip install pyarrow") from e
+    return pyarrow
+
+
+def _to_arrow(pa, df, schema=None):
+    """
+    Converts a DataFrame into an Arrow table with dictionary-encoded string columns.
+    Args:
+        pa (module): The pyarrow module.
+        df (pd.DataFrame): Frame to convert.
+        schema (pa.Schema, optional): Schema to cast the table to, so all the chunks of a file share it.
+    Returns:
+        pa.Table: The converted table.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if schema is None:
+        schema = pa.schema([
+            pa.field(field.name, pa.dictionary(pa.int32(), pa.string()))
+            if pa.types.is_dictionary(field.type) or pa.types.is_string(field.type) or pa.types.is_large_string(field.type)
+            else field
+            for field in table.schema
+        ])
+    return table.cast(schema)
+
+
+class TableWriter:
+    """
+    Appends DataFrames to a CSV, Parquet or Arrow IPC file, picked from the extension of the path.
+    Columnar formats store string columns dictionary-encoded.
+
+    Rows are written to a temporary file that only replaces the final one when the writer is closed,
+    so an interrupted write never leaves a partial table behind.
+    """
+
+    def __init__(self, path, columns):
+        """
+        Args:
+            path (str): Path of the file to write.
+            columns (list): Columns of the table, written as header even if no rows are written.
+        """
+        self.path = path
+        self.columns = columns
+        self.table_format = table_format_of(path)
+        self._temp_path = partial_path(path)
+        self._file = None
+        self._writer = None
+        self._schema = None
+        if self.table_format == CSV_FORMAT:
+            self._file = open(self._temp_path, 'w', newline='', encoding='utf-8')
+            self._file.write(",".join(columns) + "\n")
+
+    def write(self, df):
+        """
+        Appends the rows of a DataFrame to the table.
+        Args:
+            df (pd.DataFrame): Rows to append, with the columns of the table.
+        """
+        count(rows=len(df))
+        if self.table_format == CSV_FORMAT:
+            df.to_csv(self._file, index=False, header=False)
+            return
+
+        pa = _import_pyarrow()
+        if self._writer is None:
+            table = _to_arrow(pa, df)
+            self._schema = table.schema
+            if self.table_format == PARQUET_FORMAT:
+                self._writer = pa.parquet.ParquetWriter(self._temp_path, table.schema)
+            else:
+                # The stream format allows a different dictionary in every batch
+                self._file = pa.OSFile(self._temp_path, 'wb')
+                self._writer = pa.ipc.new_stream(self._file, table.schema)
+        else:
+            table = _to_arrow(pa, df, self._schema)
+        self._writer.write_table(table)
+
+    def write_text(self, text):
+        """
+        Appends rows already serialized as CSV text. Only for CSV tables.
+        Args:
+            text (str): CSV rows, without header.
+        """
+        if self.table_format != CSV_FORMAT:
+            raise ValueError(f"Cannot append CSV text to a {self.table_format} table: {self.path}")
+        count(rows=text.count("\n"))
+        self._file.write(text)
+
+    def close(self):
+        """Closes the file and moves it into place. Columnar files that got no rows are written with an empty table."""
+        if self.table_format != CSV_FORMAT and self._writer is None:
+            self.write(pd.DataFrame({column: pd.Series(dtype="category") for column in self.columns}))
+        self._close_handles()
+        os.replace(self._temp_path, self.path)
+        count(bytes_written=os.path.getsize(self.path))
+
+    def abort(self):
+        """Closes and removes the temporary file, leaving the final one untouched."""
+        self._close_handles()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+    def _close_handles(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_table(df, path):
+    """
+    Writes a DataFrame to a CSV, Parquet or Arrow IPC file, picked from the extension of the path.
+    Args:
+        df (pd.DataFrame): Frame to write.
+        path (str): Path of the file to write.
+    """
+    with TableWriter(path, list(df.columns)) as writer:
+        writer.write(df)
+
+
+def read_table_chunks(path, columns=None, chunksize=DEFAULT_CHUNK_SIZE, dtypes=None):
+    """
+    Reads a CSV, Parquet or Arrow IPC file as an iterable of DataFrames. Columnar files only read
+    the requested columns, and Arrow IPC files are memory-mapped instead of loaded.
+    Args:
+        path (str): Path of the file to read. Its extension sets the format.
+        columns (list, optional): Columns to read. All of them if None.
+        chunksize (int, optional): Rows per chunk. If None, the whole file is returned as a single chunk.
+            Arrow IPC files are read in the batches they were written with.
+        dtypes (dict, optional): Types of the columns of CSV files.
+    Returns:
+        Iterable of pd.DataFrame.
+    """
+    table_format = table_format_of(path)
+    if table_format == CSV_FORMAT:
+        if dtypes is not None and columns is not None:
+            dtypes = {column: dtypes[column] for column in columns if column in dtypes}
+        return read_csv_chunks(path, chunksize, sep=",", usecols=columns, dtype=dtypes)
+
+    pa = _import_pyarrow()
+    if table_format == PARQUET_FORMAT:
+        parquet_file = pa.parquet.ParquetFile(path)
+        if not chunksize:
+            return [parquet_file.read(columns=columns).to_pandas()]
+        return (pa.Table.from_batches([batch]).to_pandas()
+                for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns))
+    return _read_arrow_batches(pa, path, columns, chunksize)
+
+
+def _read_arrow_batches(pa, path, columns, chunksize):
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_stream(source)
+        if not chunksize:
+            table = reader.read_all()
+            yield (table if columns is None else table.select(columns)).to_pandas()
+            return
+        for batch in reader:
+            yield (batch if columns is None else batch.select(columns)).to_pandas()
+
+
+def read_csv_chunks(file, chunksize=DEFAULT_CHUNK_SIZE, **kwargs):
+    """
+    Reads a CSV file as an iterable of DataFrames.
+    Args:
+        file (str or file-like): CSV file to read.
+        chunksize (int, optional): Rows per chunk. If None, the whole file is returned as a single chunk.
+        **kwargs: Extra arguments for pd.read_csv.
+    Returns:
+        Iterable of pd.DataFrame.
+    """
+    if chunksize:
+        return pd.read_csv(file, chunksize=chunksize, **kwargs)
+    return [pd.read_csv(file, **kwargs)]
+
+
+class EmployeeDataset:
+    """
+    Employees data shared by the processing stages.
+
+    The data is either a DataFrame already parsed in memory, which every stage reuses as is,
+    or a CSV, Parquet or Arrow IPC file that is streamed chunk by chunk. Both are read with EMPLOYEES_DTYPES.
+    With several workers, CSV files are parsed in parallel, line-aligned ranges.
+    """
+
+    def __init__(self, path, frame=None, chunksize=DEFAULT_CHUNK_SIZE, workers=1):
+        """
+        Args:
+            path (str): Path to the processed employees file.
+            frame (pd.DataFrame, optional): The contents of the file, if already parsed.
+            chunksize (int, optional): Rows per chunk when streaming the file. If None, it is read at once.
+                Ignored when parsing in parallel, where every range is a chunk.
+            workers (int): Processes parsing CSV files.
+        """
+        self.path = path
+        self.frame = frame
+        self.chunksize = chunksize
+        self.workers = workers
+
+    @classmethod
+    def load(cls, path, workers=1):
+        """
+        Parses the whole employees file once and keeps it in memory.
+        Args:
+            path (str): Path to the processed employees file.
+            workers (int): Processes parsing CSV files.
+        Returns:
+            EmployeeDataset: The parsed dataset.
+        """
+        dataset = cls(path, chunksize=None, workers=workers)
+        dataset.frame = concat_categoricals(list(dataset.chunks()), EMPLOYEES_DTYPES)
+        return dataset
+
+    @property
+    def parallel(self):
+        """Whether the data is parsed by several processes."""
+        return self.frame is None and self.workers > 1 and table_format_of(self.path) == CSV_FORMAT
+
+    def chunks(self, columns=None):
+        """
+        Iterates over the employees data. Chunks must not be modified, since in memory they are the shared frame.
+        Args:
+            columns (list, optional): Columns to read. All of them if None.
+        Returns:
+            Iterable of pd.DataFrame.
+        """
+        return self.map_chunks(None, columns)
+
+    def map_chunks(self, function, columns=None):
+        """
+        Applies a function to every chunk of the employees data. When parsing in parallel, the function runs
+        in the worker that parsed the chunk, so only its result is sent back.
+        Args:
+            function (callable, optional): Picklable function called with every chunk. None yields the chunks.
+            columns (list, optional): Columns to read. All of them if None.
+        Returns:
+            Iterable with the result of every chunk, in the order of the data.
+        """
+        if self.frame is not None:
+            chunks = [self.frame if columns is None else self.frame[columns]]
+        elif self.parallel:
+            dtypes = EMPLOYEES_DTYPES if columns is None else {column: EMPLOYEES_DTYPES[column] for column in columns}
+            return map_csv_ranges(self.path, function, self.workers, usecols=columns, dtype=dtypes)
+        else:
+            chunks = read_table_chunks(self.path, columns, self.chunksize, dtypes=EMPLOYEES_DTYPES)
+        return chunks if function is None else map(function, chunks)
+
+
+def as_employee_dataset(employees, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Args:
+        employees (str or EmployeeDataset): Path to the processed employees file, or a dataset.
+        chunksize (int, optional): Rows per chunk when employees is a path.
+    Returns:
+        EmployeeDataset: The given dataset, or one streaming the given file.
+    """
+    if isinstance(employees, EmployeeDataset):
+        return employees
+    return EmployeeDataset(employees, chunksize=chunksize)
@@ -1,5 +1,11 @@
-from io_utils import download_file, extract_employees_from_gz_file
-from data_processor import normalize_employee_data, generate_reports
+import argparse
+import os
+
+import instrumentation
+from build_cache import BuildCache
+from instrumentation import stage
+from io_utils import download_file, load_employees_from_gz_file, load_employees_from_url
+from data_processor import normalize_and_report
 
 # URL for the compressed employees file.
 # Note: The file is available until Fri Mar 21 18:43:24 UTC 2025.
@@ -8,27 +14,64 @@ URL = "https://interview-challenges-resources.s3.eu-west-1.amazonaws.com/databas
 COMPRESSED_FILE = "./challenge-2/resources/interview-challenges-database-option-b"
 # Path for the directory to save CSV files
 CSV_PATH = "./challenge-2/resources/csv"
+# Stream the archive from URL straight into the extraction instead of downloading it first
+STREAM_ARCHIVE = False
+# Manifest recording what every artifact was built from, so only stale ones are rebuilt
+BUILD_MANIFEST = "./challenge-2/resources/.build_manifest.json"
+# Rows held in memory at once while processing the employees file (None loads it all at once)
+CHUNK_SIZE = 100_000
+# Format of the extracted and normalized tables: "csv", "parquet" or "arrow" (the last two need pyarrow)
+TABLE_FORMAT = "csv"
+# Processes parsing the employees data (1 parses it in the main process)
+WORKERS = os.cpu_count() or 1
 
 def process_employee_data():
-    # Step 1: Download the compressed file
-    download_file(URL, COMPRESSED_FILE)
+    cache = BuildCache(BUILD_MANIFEST)
+
+    if STREAM_ARCHIVE:
+        # Step 1 and 2: Extract the contents of the tar.gz file as it is downloaded
+        with stage("download_and_extract"):
+            employees = load_employees_from_url(URL, CSV_PATH, chunksize=CHUNK_SIZE, table_format=TABLE_FORMAT, cache=cache,
+                                                workers=WORKERS)
+    else:
+        # Step 1: Download the compressed file
+        with stage("download"):
+            download_file(URL, COMPRESSED_FILE, cache=cache)
 
-    # Step 2: Extract the contents of the tar.gz file
-    employee_csv = extract_employees_from_gz_file(COMPRESSED_FILE, CSV_PATH)
+        # Step 2: Extract the contents of the tar.gz file
+        with stage("extract"):
+            employees = load_employees_from_gz_file(COMPRESSED_FILE, CSV_PATH, chunksize=CHUNK_SIZE, table_format=TABLE_FORMAT, cache=cache,
+                                                    workers=WORKERS)
 
-    if employee_csv is None:
+    if employees is None:
         print("Failed to extract employees CSV file.")
         return
 
-    # Step 3: Process the extracted CSV data (this step is not implemented in the provided code)
-    normalize_employee_data(employee_csv, CSV_PATH)
-
-    # Step 4: Generate reports based on the processed data
-    generate_reports(employee_csv, CSV_PATH)
+    # Step 3 and 4: Normalize the employee data and generate the reports, reading the data only once
+    with stage("normalize_and_report"):
+        normalize_and_report(employees, CSV_PATH, table_format=TABLE_FORMAT, cache=cache)
 
 
 def main():
-   process_employee_data()
+    parser = argparse.ArgumentParser(description="Downloads, normalizes and reports the employees database.")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="Record wall and CPU time, rows, bytes and peak memory of every stage and save them as JSON.")
+    parser.add_argument("--profile", metavar="FILE", help="Profile the run and save the profile.")
+    parser.add_argument("--profiler", default="cprofile", choices=instrumentation.PROFILERS,
+                        help="Profiler used by --profile (pyinstrument must be installed).")
+    args = parser.parse_args()
+
+    metrics = instrumentation.enable() if args.metrics else None
+    if args.profile:
+        with instrumentation.profile(args.profile, args.profiler):
+            process_employee_data()
+    else:
+        process_employee_data()
+
+    if metrics is not None:
+        metrics.save(args.metrics)
+        metrics.print_summary()
+        print(f"Run metrics saved to {args.metrics}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,132 @@
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# Default number of worker processes
+DEFAULT_WORKERS = os.cpu_count() or 1
+# Default size in bytes of the ranges parsed by every worker
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def line_ranges(path, block_size=DEFAULT_BLOCK_SIZE, start=0):
+    """
+    Splits a text file into byte ranges of about block_size bytes that start and end on line boundaries,
+    so every range can be parsed on its own. Fields must not contain line breaks.
+    Args:
+        path (str): Path of the file.
+        block_size (int): Approximate size of every range.
+        start (int): Offset where the first range starts, e.g. after a header line.
+    Returns:
+        list: (start, end) offsets of every range, end excluded.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as f:
+        while start < size:
+            f.seek(min(start + block_size, size))
+            f.readline()  # Move to the end of the line the range would otherwise cut
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def header_line(path):
+    """
+    Returns:
+        tuple: Column names of the header line of a CSV file, and the offset where the data starts.
+    """
+    with open(path, 'rb') as f:
+        line = f.readline()
+    return line.decode('utf-8').rstrip('\r\n').split(','), len(line)
+
+
+def read_range(path, start, end, **read_kwargs):
+    """
+    Parses a byte range of a CSV file.
+    Args:
+        path (str): Path of the file.
+        start (int): Offset of the first byte.
+        end (int): Offset after the last byte.
+        **read_kwargs: Extra arguments for pd.read_csv (names, sep, dtype...).
+    Returns:
+        pd.DataFrame: The rows of the range.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return pd.read_csv(io.BytesIO(data), header=None, **read_kwargs)
+
+
+def _apply_to_range(path, start, end, read_kwargs, function):
+    """Worker task: parses a range and applies function to it, so only its result is sent back."""
+    frame = read_range(path, start, end, **read_kwargs)
+    return frame if function is None else function(frame)
+
+
+def ordered_map(executor, function, tasks, window):
+    """
+    Runs function over tasks in an executor and yields the results in the order of the tasks.
+    At most window tasks are in flight, so results do not pile up when the consumer is slower.
+    Args:
+        executor (Executor): Executor running the tasks.
+        function (callable): Function called with the arguments of every task.
+        tasks (iterable): Tuple of arguments of every task.
+        window (int): Maximum number of tasks submitted and not consumed yet.
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(function, *task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def map_csv_ranges(path, function=None, workers=DEFAULT_WORKERS, block_size=DEFAULT_BLOCK_SIZE, header=True, **read_kwargs):
+    """
+    Parses a CSV file in parallel, one line-aligned range per task, and yields the per-range results in file order.
+    Args:
+        path (str): Path of the CSV file.
+        function (callable, optional): Picklable function applied to every parsed range in the worker.
+            Without it, the parsed DataFrames are yielded.
+        workers (int): Number of worker processes.
+        block_size (int): Approximate size in bytes of every range.
+        header (bool): Whether the first line of the file is a header with the column names.
+        **read_kwargs: Extra arguments for pd.read_csv (names, sep, usecols, dtype...).
+    """
+    start = 0
+    if header:
+        names, start = header_line(path)
+        read_kwargs.setdefault('names', names)
+    tasks = [(path, range_start, range_end, read_kwargs, function)
+             for range_start, range_end in line_ranges(path, block_size, start)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from ordered_map(executor, _apply_to_range, tasks, window=2 * workers)
+
+
+def concat_categoricals(frames, dtypes=None):
+    """
+    Concatenates frames whose categorical columns have different categories, keeping them categorical
+    instead of falling back to plain objects.
+    Args:
+        frames (list): Frames with the same columns.
+        dtypes (dict, optional): Types of the columns, by name, of the empty frame returned when there are no frames.
+    Returns:
+        pd.DataFrame: The concatenated frame.
+    """
+    if not frames:
+        # No rows at all, e.g. a file with only a header
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in (dtypes or {}).items()})
+    if len(frames) == 1:
+        return frames[0]
+    columns = {}
+    for column in frames[0].columns:
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype):
+            columns[column] = pd.api.types.union_categoricals([frame[column] for frame in frames])
+        else:
+            columns[column] = pd.concat([frame[column] for frame in frames], ignore_index=True)
+    return pd.DataFrame(columns)
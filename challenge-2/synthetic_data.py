@@ -0,0 +1,147 @@
+"""
+Deterministic generator of synthetic employees archives shaped like the database dump:
+a tar.gz with a ';' separated `employee.csv` member, without header, with the columns of EMPLOYEES_HEADER.
+
+Usage (from the repository root):
+    python challenge-2/synthetic_data.py --rows 1000000 --output challenge-2/resources/synthetic.tar.gz
+"""
+import argparse
+import gzip
+import os
+import tarfile
+
+import numpy as np
+import pandas as pd
+
+from build_cache import atomic_output, partial_path
+from io_utils import EMPLOYEES_HEADER, EMPLOYEES_MEMBER
+
+# Default cardinalities of the generated data
+DEFAULT_COMPANIES = 50_000
+DEFAULT_ACTIVITIES = 1_000
+DEFAULT_COUNTRIES = 200
+DEFAULT_JOBS = 2_000
+# Exponent of the Zipf-like distribution of employees over companies (0 spreads them evenly)
+DEFAULT_SKEW = 1.0
+# Rows generated and written at a time, which bounds the memory used by the generator
+GENERATE_CHUNK_ROWS = 1_000_000
+
+CONTINENTS = ["Africa", "Antarctica", "Asia", "Europe", "North America", "Oceania", "South America"]
+# Parent activities per grand parent activity, and activities per parent activity
+ACTIVITY_FAN_OUT = 10
+# Job types of the generated jobs
+JOB_TYPES = 50
+
+
+def generate_employees_archive(path, rows, companies=DEFAULT_COMPANIES, activities=DEFAULT_ACTIVITIES,
+                               countries=DEFAULT_COUNTRIES, jobs=DEFAULT_JOBS, skew=DEFAULT_SKEW, seed=0):
+    """
+    Writes a synthetic employees archive. The same arguments always produce the same bytes.
+
+    Every company has a fixed activity, country, tax ID and coordinates, and every activity and country
+    belong to a fixed parent activity and continent, so the data normalizes like the real dump.
+    Args:
+        path (str): Path of the tar.gz archive to write.
+        rows (int): Number of employees.
+        companies (int): Number of distinct companies.
+        activities (int): Number of distinct leaf activities.
+        countries (int): Number of distinct countries.
+        jobs (int): Number of distinct jobs.
+        skew (float): Exponent of the Zipf-like distribution of employees over companies.
+        seed (int): Seed of the random generator.
+    Returns:
+        str: Path of the archive.
+    """
+    rng = np.random.default_rng(seed)
+    company_frame = _companies(rng, companies, activities, countries)
+    weights = 1.0 / np.arange(1, companies + 1) ** skew
+    weights /= weights.sum()
+
+    member_file = partial_path(path) + ".member"
+    try:
+        with open(member_file, 'w', newline='', encoding='utf-8') as f:
+            for start in range(0, rows, GENERATE_CHUNK_ROWS):
+                count = min(GENERATE_CHUNK_ROWS, rows - start)
+                _employees(rng, start, count, company_frame, weights, jobs).to_csv(f, sep=";", header=False, index=False)
+
+        with atomic_output(path) as temp_path:
+            # No gzip file name and fixed mtimes keep the archive byte-identical across runs
+            with open(temp_path, 'wb') as f, gzip.GzipFile(filename='', mode='wb', fileobj=f, mtime=0) as gz, \
+                    tarfile.open(fileobj=gz, mode='w') as tar:
+                info = tar.gettarinfo(member_file, arcname=f"raw_db/{EMPLOYEES_MEMBER}")
+                info.mtime = 0
+                info.mode = 0o644
+                info.uid = info.gid = 0
+                info.uname = info.gname = ""
+                with open(member_file, 'rb') as member:
+                    tar.addfile(info, member)
+    finally:
+        if os.path.exists(member_file):
+            os.remove(member_file)
+    return path
+
+
+def _companies(rng, companies, activities, countries):
+    """Returns the attributes of every company, indexed by company number."""
+    activity = rng.integers(0, activities, companies)
+    parent = activity // ACTIVITY_FAN_OUT
+    country = rng.integers(0, countries, companies)
+    return pd.DataFrame({
+        "COMPANY_NAME": [f"Company {c}" for c in range(companies)],
+        "TAX_ID": [f"TAX{c:09d}" for c in range(companies)],
+        "ACTIVITY": [f"Activity {a}" for a in activity],
+        "ACTIVITY_PARENT": [f"Parent activity {p}" for p in parent],
+        "ACTIVITY_GRAND_PARENT": [f"Grand parent activity {p // ACTIVITY_FAN_OUT}" for p in parent],
+        "LAT": np.round(rng.uniform(-90, 90, companies), 6),
+        "LNG": np.round(rng.uniform(-180, 180, companies), 6),
+        "CONTINENT": [CONTINENTS[c % len(CONTINENTS)] for c in country],
+        "COUNTRY_NAME": [f"Country {c}" for c in country],
+        "ISO2_CODE": [_iso2_code(c) for c in country],
+    })
+
+
+def _employees(rng, start, count, company_frame, weights, jobs):
+    """Returns count employees numbered from start."""
+    ids = np.arange(start, start + count)
+    company = rng.choice(len(company_frame), size=count, p=weights)
+    job = rng.integers(0, jobs, count)
+    frame = company_frame.iloc[company].reset_index(drop=True)
+    frame.insert(0, "EMPLOYEE_NAME", [f"Employee {i}" for i in ids])
+    frame.insert(1, "EMPLOYEE_EMAIL", [f"employee{i}@example.com" for i in ids])
+    frame.insert(2, "JOB_NAME", [f"Job {j}" for j in job])
+    frame.insert(3, "JOB_TYPE", [f"Job type {j % JOB_TYPES}" for j in job])
+    return frame[EMPLOYEES_HEADER]
+
+
+def _iso2_code(country):
+    """Two letter code of a country number, unique for up to 676 countries."""
+    return chr(ord('A') + country // 26 % 26) + chr(ord('A') + country % 26)
+
+
+def parse_count(value):
+    """Parses a row count with an optional k or m suffix, e.g. '10k' or '50M'."""
+    value = value.strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip('km')) * multiplier)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=parse_count, default=100_000, help="Number of employees, e.g. 10k or 5M.")
+    parser.add_argument("--output", required=True, help="Path of the tar.gz archive to write.")
+    parser.add_argument("--companies", type=int, default=DEFAULT_COMPANIES, help="Number of distinct companies.")
+    parser.add_argument("--activities", type=int, default=DEFAULT_ACTIVITIES, help="Number of distinct activities.")
+    parser.add_argument("--countries", type=int, default=DEFAULT_COUNTRIES, help="Number of distinct countries.")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="Number of distinct jobs.")
+    parser.add_argument("--skew", type=float, default=DEFAULT_SKEW,
+                        help="Zipf exponent of the employees per company (0 for uniform).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator.")
+    args = parser.parse_args()
+
+    generate_employees_archive(args.output, args.rows, companies=args.companies, activities=args.activities,
+                               countries=args.countries, jobs=args.jobs, skew=args.skew, seed=args.seed)
+    print(f"Generated {args.rows:,} employees in {args.output} ({os.path.getsize(args.output) / 2 ** 20:.1f} MiB)")
+
+
+if __name__ == '__main__':
+    main()